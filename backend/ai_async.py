@@ -0,0 +1,181 @@
+"""
+Async AI Runtime - One background event loop per worker for concurrent LLM calls
+
+Blocking SDK calls pin one thread per in-flight request. Providers that speak
+plain HTTP also implement an async interface (agenerate_*) on pooled httpx
+clients; their coroutines run on a single event loop thread per worker
+process, so one process can keep dozens of LLM calls in flight while the
+calling threads only wait on futures.
+
+Request handlers stay synchronous: submit() hands a coroutine to the loop
+and returns a concurrent.futures.Future, and run() waits for its result.
+Those providers have a single (async) HTTP implementation; their blocking
+calls go through run_sync().
+
+Requires httpx; without it (or with AI_ASYNC=false) get_async_runtime()
+returns None and callers use their thread-pool paths. With AI_ASYNC=false,
+run_sync() runs each call on a short-lived loop in the calling thread.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from deadlines import DeadlineExceeded, current_deadline, deadline_scope
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """Background event loop thread plus one pooled HTTP client per upstream service."""
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20,
+                 connect_timeout: float = 5, read_timeout: float = 120):
+        if httpx is None:
+            raise ImportError("httpx is required for async AI providers")
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.read_timeout = read_timeout
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Dict[str, "httpx.AsyncClient"] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.submitted = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Started lazily so each forked gunicorn worker gets its own loop thread
+        with self._lock:
+            if self._loop is None or not self._loop.is_running():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="ai-async-loop", daemon=True).start()
+                started.wait()
+                self._loop = loop
+                self._clients = {}
+            return self._loop
+
+    def submit(self, coro) -> Future:
+        """
+        Schedule a coroutine on the loop; cancelling the future cancels the task.
+        The caller's request deadline travels with it and bounds its run time.
+        """
+        deadline = current_deadline()
+        if deadline is not None:
+            coro = self._with_deadline(coro, deadline)
+        loop = self._ensure_loop()
+        with self._lock:
+            self._in_flight += 1
+            self.submitted += 1
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        future.add_done_callback(self._done)
+        return future
+
+    @staticmethod
+    async def _with_deadline(coro, deadline):
+        with deadline_scope(deadline):
+            try:
+                return await asyncio.wait_for(coro, max(deadline.remaining(), 0.001))
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"Request deadline of {deadline.seconds:g}s exceeded")
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def run(self, coro, timeout: float = None):
+        """Run a coroutine on the loop and wait for its result from a synchronous caller."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def on_loop(self) -> bool:
+        """True when called from a coroutine running on this runtime's loop."""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def client(self, name: str) -> "httpx.AsyncClient":
+        """Pooled client for one upstream service. Must be called on the loop."""
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        return client
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "running": bool(self._loop and self._loop.is_running()),
+                "in_flight": self._in_flight,
+                "submitted": self.submitted,
+                "clients": sorted(self._clients),
+            }
+
+
+READ_TIMEOUT = float(os.getenv("AI_ASYNC_TIMEOUT", "120"))
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime() -> Optional[AsyncRuntime]:
+    """Shared runtime, or None when AI_ASYNC is disabled or httpx is not installed."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                if os.getenv("AI_ASYNC", "true").lower() in ("0", "false", "no", "off"):
+                    _runtime = False
+                elif httpx is None:
+                    logger.info("httpx not installed; async AI providers disabled")
+                    _runtime = False
+                else:
+                    _runtime = AsyncRuntime(
+                        max_connections=int(os.getenv("AI_ASYNC_MAX_CONNECTIONS", "100")),
+                        max_keepalive=int(os.getenv("AI_ASYNC_MAX_KEEPALIVE", "20")),
+                        read_timeout=READ_TIMEOUT,
+                    )
+    return _runtime or None
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code: on the shared runtime,
+    or on a short-lived loop in the calling thread when the runtime is disabled.
+    """
+    runtime = get_async_runtime()
+    if runtime:
+        return runtime.run(coro)
+    if httpx is None:
+        coro.close()
+        raise ImportError("httpx is required for Gemini, Groq and Ollama calls")
+    deadline = current_deadline()
+    if deadline is not None:
+        coro = AsyncRuntime._with_deadline(coro, deadline)
+    return asyncio.run(coro)
+
+
+async def post(service: str, url: str, **kwargs) -> "httpx.Response":
+    """POST on the pooled client for ``service``; a one-off client off the shared loop."""
+    runtime = get_async_runtime()
+    if runtime and runtime.on_loop():
+        return await runtime.client(service).post(url, **kwargs)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(READ_TIMEOUT, connect=5)) as client:
+        return await client.post(url, **kwargs)
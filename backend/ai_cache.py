@@ -0,0 +1,330 @@
+"""
+AI Response Cache - Reuse LLM output for identical generation requests
+
+Features:
+- Keys built from normalized request inputs plus provider/model
+- TTL expiry and size-bounded LRU eviction
+- Pluggable backends: in-process memory or a shared SQLite file
+- Hit/miss counters per namespace
+
+Reads stay read-only on the SQLite backend: LRU access times are refreshed at
+most every AI_CACHE_TOUCH_INTERVAL seconds per entry, and counters are summed
+in-process and flushed in batches, so cache hits do not queue on the write lock.
+
+Backends (AI_CACHE_BACKEND):
+- memory: per-process dict, fastest, not shared between workers
+- sqlite: local file shared by all gunicorn workers (default)
+- none: caching disabled
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import shared_state
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(value) -> str:
+    """Lowercase and collapse whitespace so trivially different inputs share a key."""
+    return " ".join(str(value or "").lower().split())
+
+
+def make_key(*parts) -> str:
+    """Stable hash of normalized key parts."""
+    raw = json.dumps(
+        [normalize_text(p) if isinstance(p, str) or p is None else p for p in parts],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def plan_cache_key(subject: str, level: str, days: int, hours_per_day: float,
+                   provider: str, model: Optional[str], lazy: bool = False) -> str:
+    parts = ["plan", subject, level, int(days), round(float(hours_per_day), 2), provider, model]
+    if lazy:
+        parts.append("lazy")  # outline-only plans must not be served to full-plan requests
+    return make_key(*parts)
+
+
+def day_details_cache_key(subject: str, level: str, days: int, day: int, topic: str,
+                          provider: str, model: Optional[str]) -> str:
+    return make_key("plan_day", subject, level, int(days), int(day), topic, provider, model)
+
+
+def flashcard_cache_key(topic: str, subject: Optional[str]) -> str:
+    """Flashcards are shared across users and providers: only topic and subject matter."""
+    return make_key("flashcards", topic, subject)
+
+
+# =============================================================================
+# BACKENDS
+# =============================================================================
+
+class MemoryCacheBackend:
+    """In-process LRU cache. Values are stored as JSON so callers never share mutable objects."""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()  # (namespace, key) -> (json_value, expires_at)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[(namespace, key)]
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry[0]
+
+    def set(self, namespace: str, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[(namespace, key)] = (value, time.time() + ttl)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def incr(self, namespace: str, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[(namespace, counter)] = self._counters.get((namespace, counter), 0) + amount
+
+    def counters(self, namespace: str) -> Dict[str, int]:
+        with self._lock:
+            return {c: v for (ns, c), v in self._counters.items() if ns == namespace}
+
+    def size(self, namespace: str) -> int:
+        with self._lock:
+            return sum(1 for ns, _ in self._entries if ns == namespace)
+
+
+class SQLiteCacheBackend:
+    """Cache stored in the shared state SQLite file so every worker sees the same entries."""
+
+    def __init__(self, path: str = None, max_entries: int = 5000, touch_interval: float = 300,
+                 flush_every: int = 50, flush_interval: float = 10):
+        self.path = path or shared_state.get_state_db_path()
+        self.max_entries = max(1, max_entries)
+        self.touch_interval = touch_interval
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._pending = {}  # (namespace, counter) -> increments not yet written
+        self._pending_total = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        conn = shared_state.connect(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_cache_last_access ON ai_cache (last_access)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache_counters ("
+            " namespace TEXT NOT NULL, counter TEXT NOT NULL, value INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (namespace, counter))"
+        )
+
+    def _conn(self):
+        return shared_state.connect(self.path)
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at, last_access FROM ai_cache WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM ai_cache WHERE namespace = ? AND key = ?", (namespace, key))
+            return None
+        # LRU order only needs to be approximate: refresh a hot entry's access time now and then
+        if now - row[2] >= self.touch_interval:
+            conn.execute(
+                "UPDATE ai_cache SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+        return row[0]
+
+    def set(self, namespace: str, key: str, value: str, ttl: float):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (namespace, key, value, expires_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, value, now + ttl, now),
+        )
+        # Size bound: drop expired rows, then the least recently used overflow
+        conn.execute("DELETE FROM ai_cache WHERE expires_at < ?", (now,))
+        conn.execute(
+            "DELETE FROM ai_cache WHERE rowid IN ("
+            " SELECT rowid FROM ai_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, namespace: str, key: str):
+        self._conn().execute("DELETE FROM ai_cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def incr(self, namespace: str, counter: str, amount: int = 1):
+        with self._lock:
+            self._pending[(namespace, counter)] = self._pending.get((namespace, counter), 0) + amount
+            self._pending_total += 1
+            due = (self._pending_total >= self.flush_every
+                   or time.monotonic() - self._flushed_at >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the counter increments buffered by this process."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_total = 0
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        self._conn().executemany(
+            "INSERT INTO ai_cache_counters (namespace, counter, value) VALUES (?, ?, ?)"
+            " ON CONFLICT(namespace, counter) DO UPDATE SET value = value + excluded.value",
+            [(namespace, counter, amount) for (namespace, counter), amount in pending.items()],
+        )
+
+    def counters(self, namespace: str) -> Dict[str, int]:
+        self.flush()
+        rows = self._conn().execute(
+            "SELECT counter, value FROM ai_cache_counters WHERE namespace = ?", (namespace,)
+        ).fetchall()
+        return {counter: value for counter, value in rows}
+
+    def size(self, namespace: str) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM ai_cache WHERE namespace = ? AND expires_at >= ?",
+            (namespace, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+
+# =============================================================================
+# RESPONSE CACHE
+# =============================================================================
+
+class ResponseCache:
+    """JSON value cache for one namespace (e.g. "plan") on top of a backend."""
+
+    def __init__(self, backend, namespace: str, ttl: float):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def get(self, key: str, count: bool = True) -> Optional[Any]:
+        """Cached value or None; ``count=False`` skips the hit/miss counters (for polling)."""
+        try:
+            raw = self.backend.get(self.namespace, key)
+            if count:
+                self.backend.incr(self.namespace, "hits" if raw is not None else "misses")
+        except Exception as e:
+            # A broken cache must never break generation
+            logger.warning(f"⚠️ AI cache read failed ({self.namespace}): {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        try:
+            self.backend.set(self.namespace, key, json.dumps(value), ttl or self.ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ AI cache write failed ({self.namespace}): {e}")
+
+    def incr(self, counter: str, amount: int = 1):
+        """Bump a namespace counter (reported by stats())."""
+        try:
+            self.backend.incr(self.namespace, counter, amount)
+        except Exception as e:
+            logger.warning(f"⚠️ AI cache counter failed ({self.namespace}): {e}")
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(self.namespace, key)
+        except Exception as e:
+            logger.warning(f"⚠️ AI cache delete failed ({self.namespace}): {e}")
+
+    def stats(self) -> Dict:
+        try:
+            counters = self.backend.counters(self.namespace)
+            size = self.backend.size(self.namespace)
+        except Exception as e:
+            return {"error": str(e)}
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return dict(
+            {c: v for c, v in counters.items() if c not in ("hits", "misses")},
+            backend=type(self.backend).__name__,
+            size=size,
+            ttl=self.ttl,
+            hits=hits,
+            misses=misses,
+            hit_rate=round(hits / (hits + misses), 3) if hits + misses else 0,
+        )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_cache_backend():
+    """Shared cache backend selected by AI_CACHE_BACKEND, or None when caching is disabled."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                kind = os.getenv("AI_CACHE_BACKEND", "sqlite").strip().lower()
+                max_entries = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+                if kind in ("none", "off", "disabled"):
+                    _backend = False
+                elif kind == "memory":
+                    _backend = MemoryCacheBackend(max_entries=max_entries)
+                else:
+                    try:
+                        _backend = SQLiteCacheBackend(
+                            path=os.getenv("AI_CACHE_PATH", "").strip() or None,
+                            max_entries=max_entries,
+                            touch_interval=float(os.getenv("AI_CACHE_TOUCH_INTERVAL", "300")),
+                        )
+                        atexit.register(_backend.flush)
+                    except Exception as e:
+                        logger.warning(f"⚠️ SQLite AI cache unavailable, using memory: {e}")
+                        _backend = MemoryCacheBackend(max_entries=max_entries)
+                logger.info(f"AI response cache backend: {type(_backend).__name__ if _backend else 'disabled'}")
+    return _backend or None
+
+
+_caches = {}
+
+
+def get_response_cache(namespace: str, ttl: float = None) -> Optional[ResponseCache]:
+    """Cache for one namespace, or None when caching is disabled."""
+    backend = get_cache_backend()
+    if backend is None:
+        return None
+    cache = _caches.get(namespace)
+    if cache is None:
+        cache = _caches.setdefault(
+            namespace,
+            ResponseCache(backend, namespace, ttl or float(os.getenv("AI_CACHE_TTL", "86400"))),
+        )
+    return cache
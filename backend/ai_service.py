@@ -12,23 +12,454 @@ Supported Providers:
 - ollama: Local Ollama (completely free, no API key needed)
 - huggingface: Hugging Face Inference API (free tier available)
 - openai: OpenAI API (paid only)
+- local: Template plans from curated topic catalogs (instant, also the fallback)
 """
 
 import os
 import json
+import asyncio
 import logging
-import re
-from typing import List, Dict, Optional
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import List, Dict, Iterator, Optional, Tuple
 from abc import ABC, abstractmethod
 
+import ai_async
+from ai_async import get_async_runtime
+from deadlines import (DeadlineExceeded, cap_timeout, check_deadline, current_deadline, get_retry_policy,
+                       run_in_context)
+from ai_cache import (get_response_cache, plan_cache_key, flashcard_cache_key, day_details_cache_key,
+                      normalize_text)
+import local_planner
+from rate_limit import RateLimited, get_rate_limiter
+from semantic_cache import adapt_plan, get_semantic_index
+from single_flight import get_single_flight
+
 logger = logging.getLogger(__name__)
 
+# =============================================================================
+# PROMPTS & JSON PARSING
+# =============================================================================
+
+def build_flashcard_prompt(topic: str, num_cards: int) -> str:
+    return (
+        f"Generate exactly {num_cards} flashcard Q&A pairs for: {topic}\n\n"
+        "Return ONLY a JSON array with no extra text or markdown:\n"
+        '[{"question": "...", "answer": "..."}]\n\n'
+        "Requirements:\n"
+        "- Questions should test understanding\n"
+        "- Keep answers concise (1-2 sentences)\n"
+        "- Valid JSON array only\n"
+        "- Each object must have 'question' and 'answer' keys"
+    )
+
+
+def build_batch_flashcard_prompt(topics: List[str], num_cards: int, subject: str = None) -> str:
+    """One prompt covering several topics; each card names its topic by number."""
+    numbered = "\n".join(f"{i}. {topic}" for i, topic in enumerate(topics, 1))
+    context = f" for a {subject} study plan" if subject else ""
+    return (
+        f"Generate exactly {num_cards} flashcard Q&A pairs for EACH of these topics{context}:\n"
+        f"{numbered}\n\n"
+        "Return ONLY a JSON array with no extra text or markdown:\n"
+        '[{"topic": 1, "question": "...", "answer": "..."}]\n\n'
+        "Requirements:\n"
+        "- \"topic\" is the number of the topic the card belongs to\n"
+        "- Questions should test understanding\n"
+        "- Keep answers concise (1-2 sentences)\n"
+        "- Valid JSON array only"
+    )
+
+
+def build_plan_prompt(subject: str, level: str, days: int, hours_per_day: float, details: bool = True,
+                      detail_words: int = None) -> str:
+    """``details=False`` asks for day/topic/hours only (lazy plans fill details in later)."""
+    if details:
+        shape = '[{"day": 1, "topic": "...", "hours": 2, "details": "..."}, ...]\n'
+        if detail_words:
+            shape += f"Keep each details field under {detail_words} words.\n"
+    else:
+        shape = '[{"day": 1, "topic": "...", "hours": 2}, ...]\nKeep each topic under 10 words.\n'
+    return (
+        f"Create a {days}-day study plan for {subject} (Level: {level}).\n"
+        f"Total: {hours_per_day} hours per day.\n"
+        "Return ONLY a JSON array:\n"
+        f"{shape}"
+    )
+
+
+def build_day_details_prompt(subject: str, level: str, days: int, day: int, topic: str,
+                             hours: float) -> str:
+    return (
+        f"Day {day} of a {days}-day {subject} study plan (Level: {level}) covers: {topic}.\n"
+        f"The student has {hours} hours for it.\n"
+        "Write a concise study breakdown for this day: what to learn, in what order, "
+        "with a short practice task at the end.\n"
+        "Plain text only, no markdown headings, at most 120 words."
+    )
+
+
+def build_outline_prompt(subject: str, level: str, days: int, parts: int, window: int) -> str:
+    return (
+        f"Create a compact outline for a {days}-day study plan for {subject} (Level: {level}), "
+        f"split into {parts} consecutive parts of {window} days each.\n"
+        "Return ONLY a JSON array with one object per part, in order:\n"
+        '[{"part": 1, "focus": "..."}, ...]\n'
+        "Keep each focus under 12 words and build from fundamentals to advanced material."
+    )
+
+
+def build_window_prompt(subject: str, level: str, days: int, hours_per_day: float,
+                        start: int, end: int, focus: str = None,
+                        previous: str = None, following: str = None, details: bool = True,
+                        detail_words: int = None) -> str:
+    detail_field = ', "details": "..."' if details else ""
+    limit = f"Keep each details field under {detail_words} words.\n" if details and detail_words else ""
+    context = ""
+    if focus:
+        context += f"These days cover: {focus}.\n"
+    if previous:
+        context += f"The days before covered: {previous}.\n"
+    if following:
+        context += f"The days after will cover: {following}.\n"
+    return (
+        f"Write days {start}-{end} of a {days}-day study plan for {subject} (Level: {level}).\n"
+        f"Total: {hours_per_day} hours per day.\n"
+        f"{context}"
+        f"Return ONLY a JSON array with exactly {end - start + 1} days:\n"
+        f'[{{"day": {start}, "topic": "...", "hours": 2{detail_field}}}, ...]\n'
+        f"{limit}"
+    )
+
+
+class JsonArrayStreamParser:
+    """
+    Incremental parser for a JSON array of objects arriving in chunks.
+
+    feed() returns every array element that has been fully received so far, so
+    callers can act on each object as soon as its closing brace arrives. Text
+    before the opening bracket (markdown fences, chatter) is skipped.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0           # next character to scan
+        self._depth = 0         # bracket depth; 0 = not inside the array yet
+        self._in_string = False
+        self._escape = False
+        self._item_start = None
+        self._items_seen = 0
+        self.done = False
+
+    def feed(self, chunk: str) -> List:
+        items = []
+        if self.done or not chunk:
+            return items
+        self._buf += chunk
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                if ch == "[":
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                if self._depth == 1:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._item_start is not None:
+                    try:
+                        items.append(json.loads(buf[self._item_start:i + 1]))
+                        self._items_seen += 1
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+                elif self._depth == 0:
+                    if self._items_seen:
+                        self.done = True
+                        break
+                    # An empty "[]" or bracketed chatter: keep looking for the real array
+            i += 1
+
+        # Drop scanned text that no pending element needs
+        keep_from = self._item_start if self._item_start is not None else i
+        self._buf = buf[keep_from:]
+        self._pos = i - keep_from
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
+
+    @property
+    def truncated(self) -> bool:
+        """True if elements were parsed but the array never closed (e.g. output cut off by max_tokens)."""
+        return not self.done and self._items_seen > 0
+
+
+def parse_json_list(text: str) -> Tuple[List[Dict], bool]:
+    """
+    Parse the JSON array of objects in a model response.
+
+    Shared by all providers. Tolerates markdown fences and chatter around the
+    array, and keeps every complete object from a truncated response instead
+    of discarding the whole generation. Returns (items, truncated).
+    """
+    parser = JsonArrayStreamParser()
+    items = [item for item in parser.feed(text or "") if isinstance(item, dict)]
+    return items, parser.truncated
+
+
+# Declared shapes of one array element, in the JSON Schema subset every backend understands.
+# Providers with a structured-output mode get them as the response schema.
+FLASHCARD_SCHEMA = {
+    "type": "object",
+    "properties": {"question": {"type": "string"}, "answer": {"type": "string"}},
+    "required": ["question", "answer"],
+}
+
+BATCH_FLASHCARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "topic": {"type": "integer"},
+        "question": {"type": "string"},
+        "answer": {"type": "string"},
+    },
+    "required": ["topic", "question", "answer"],
+}
+
+PLAN_DAY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "day": {"type": "integer"},
+        "topic": {"type": "string"},
+        "hours": {"type": "number"},
+        "details": {"type": "string"},
+    },
+    "required": ["day", "topic"],
+}
+
+OUTLINE_SCHEMA = {
+    "type": "object",
+    "properties": {"part": {"type": "integer"}, "focus": {"type": "string"}},
+    "required": ["focus"],
+}
+
+
+def validate_item(item: Dict, schema: Dict) -> Optional[Dict]:
+    """
+    Check one parsed element against its schema. Numbers sent as strings are
+    coerced; returns the (coerced) item, or None if a required field is missing
+    or has the wrong type.
+    """
+    if not isinstance(item, dict):
+        return None
+    item = dict(item)
+    for name, spec in schema.get("properties", {}).items():
+        value = item.get(name)
+        if value is None or value == "":
+            if name in schema.get("required", ()):
+                return None
+            item.pop(name, None)
+            continue
+        kind = spec.get("type")
+        try:
+            if kind == "integer" and not isinstance(value, int):
+                item[name] = int(float(value))
+            elif kind == "number" and not isinstance(value, (int, float)):
+                item[name] = float(value)
+            elif kind == "string":
+                if isinstance(value, (dict, list)):
+                    raise ValueError(name)
+                item[name] = str(value).strip()
+        except (TypeError, ValueError):
+            if name in schema.get("required", ()):
+                return None
+            item.pop(name, None)
+    return item
+
+
+class ParseStats:
+    """Per-provider counters of structured output outcomes (per worker process)."""
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, ok: bool, invalid_items: int = 0, truncated: bool = False):
+        with self._lock:
+            counts = self._counts.setdefault(
+                provider, {"responses": 0, "parse_failures": 0, "invalid_items": 0, "truncated": 0})
+            counts["responses"] += 1
+            counts["parse_failures"] += 0 if ok else 1
+            counts["invalid_items"] += invalid_items
+            counts["truncated"] += 1 if truncated else 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                name: dict(counts, failure_rate=round(counts["parse_failures"] / counts["responses"], 3))
+                for name, counts in self._counts.items()
+            }
+
+
+_parse_stats = ParseStats()
+
+
+def get_parse_stats() -> ParseStats:
+    return _parse_stats
+
+
+# =============================================================================
+# TOKEN BUDGETING
+# =============================================================================
+
+_usage_local = threading.local()
+
+
+def report_output_tokens(tokens: Optional[int]):
+    """Called by providers with the output token count their API reported for the current call."""
+    _usage_local.tokens = tokens
+
+
+class TokenBudget:
+    """
+    Sizes max_tokens from the requested output size instead of fixed limits.
+
+    Each kind of output ("flashcard", "plan_day", ...) has an expected token
+    cost per unit (card, day, ...), calibrated per provider from the output token
+    counts of completed calls (EWMA). A truncated response bumps the estimate.
+    Budgets get HEADROOM on top and are capped at the model's output limit.
+    """
+
+    DEFAULT_PER_UNIT = {
+        "flashcard": 70,
+        "plan_day": 110,
+        "plan_topic": 25,
+        "outline_part": 25,
+        "day_details": 250,
+    }
+    OVERHEAD = 64        # brackets, wrapper object, stray chatter
+    HEADROOM = 1.3
+    MIN_TOKENS = 256
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._per_unit: Dict[Tuple[str, str], float] = {}
+        self._samples: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def detail_words(units: int) -> int:
+        """Words per plan-day "details" field: shorter as one response covers more days."""
+        return max(12, min(40, 600 // max(1, units)))
+
+    def per_unit(self, provider: str, kind: str) -> float:
+        with self._lock:
+            return self._per_unit.get((provider, kind), self.DEFAULT_PER_UNIT.get(kind, 100))
+
+    def estimate(self, provider: str, kind: str, units: int, limit: int) -> int:
+        tokens = int((self.OVERHEAD + self.per_unit(provider, kind) * max(1, units)) * self.HEADROOM)
+        return max(min(self.MIN_TOKENS, limit), min(limit, tokens))
+
+    def observe(self, provider: str, kind: str, units: int, output_tokens: int, truncated: bool = False):
+        """Calibrate from a finished call that produced ``units`` elements in ``output_tokens``."""
+        if units <= 0 or output_tokens <= 0:
+            return
+        sample = max(1.0, (output_tokens - self.OVERHEAD) / units)
+        key = (provider, kind)
+        with self._lock:
+            current = self._per_unit.get(key, self.DEFAULT_PER_UNIT.get(kind, 100))
+            if truncated:
+                # The budget ran out: the true cost is higher than what we reserved
+                sample = max(sample, current) * 1.25
+            self._per_unit[key] = self.alpha * sample + (1 - self.alpha) * current
+            self._samples[key] = self._samples.get(key, 0) + 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                f"{provider}:{kind}": {"tokens_per_unit": round(value, 1), "samples": self._samples.get((provider, kind), 0)}
+                for (provider, kind), value in self._per_unit.items()
+            }
+
+
+_token_budget = TokenBudget(alpha=float(os.getenv("AI_TOKEN_BUDGET_ALPHA", "0.2")))
+
+
+def get_token_budget() -> TokenBudget:
+    return _token_budget
+
+
 # =============================================================================
 # PROVIDER IMPLEMENTATIONS
 # =============================================================================
 
+class ProviderRateLimitError(Exception):
+    """Upstream 429 / quota error; retry_after is the server's Retry-After in seconds, if sent."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after_from(error: Exception) -> Optional[float]:
+    """Read Retry-After from an SDK/HTTP error's response headers, if present."""
+    return _retry_after_header(getattr(error, "response", None))
+
+
+def _retry_after_header(response) -> Optional[float]:
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _check_http_response(response, label: str):
+    """Raise for an error status from an async HTTP call; 429 becomes ProviderRateLimitError."""
+    if response.status_code == 429:
+        raise ProviderRateLimitError(f"{label} rate limit reached. Please wait and try again.",
+                                     _retry_after_header(response))
+    if response.status_code >= 400:
+        raise Exception(f"{label} returned {response.status_code}: {response.text[:150]}")
+
+
+def _deadline_timeout() -> Dict:
+    """{"timeout": seconds left} for SDK calls made under a request deadline; empty (SDK default) otherwise."""
+    timeout = cap_timeout(None)
+    return {"timeout": timeout} if timeout is not None else {}
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    if isinstance(error, ProviderRateLimitError):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("429", "rate limit", "rate_limit", "quota", "resource_exhausted"))
+
+
 class AIProvider(ABC):
     """Base class for AI providers."""
+
+    name = ""
+    model_name = None
+    # Output token ceiling used to cap estimated budgets
+    max_output_tokens = 4096
+    # Plans are worth caching and coalescing (False for the instant local engine)
+    cacheable = True
+    supports_flashcards = True
     
     @abstractmethod
     def generate_flashcards(self, topic: str, num_cards: int) -> List[Dict]:
@@ -38,9 +469,199 @@ class AIProvider(ABC):
     def generate_study_plan(self, subject: str, level: str, days: int, hours_per_day: float) -> List[Dict]:
         pass
 
+    def _stream_text(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                     schema: Dict = None) -> Iterator[str]:
+        """
+        Yield raw response text chunks from the provider's streaming API. ``schema``
+        (one array element) requests the backend's JSON output mode where supported.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support streaming")
+
+    def _complete(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                  schema: Dict = None) -> str:
+        """Complete response text; providers override this to use their non-streaming API."""
+        return "".join(self._stream_text(prompt, temperature, max_tokens, schema))
+
+    def _budget(self, kind: str, units: int) -> int:
+        """max_tokens for ``units`` elements of ``kind`` on this provider (see TokenBudget)."""
+        return _token_budget.estimate(self.name, kind, units, self.max_output_tokens)
+
+    def _observe_usage(self, kind: Optional[str], units: int, text_length: int, truncated: bool):
+        if not kind:
+            return
+        reported = getattr(_usage_local, "tokens", None)
+        _usage_local.tokens = None
+        # Providers that don't report usage: ~4 characters per token
+        _token_budget.observe(self.name, kind, units, reported or text_length // 4, truncated)
+
+    def _parse_items(self, text: str, schema: Dict, kind: str = None) -> List[Dict]:
+        """
+        Extract the JSON array from a complete response and keep the elements that
+        match the schema, salvaging complete elements if the response was truncated.
+        """
+        items, truncated = parse_json_list(text)
+        valid = [v for v in (validate_item(item, schema) for item in items) if v is not None]
+        _parse_stats.record(self.name, bool(valid), len(items) - len(valid), truncated)
+        self._observe_usage(kind, len(items), len(text or ""), truncated)
+        if truncated:
+            logger.warning(f"⚠️ {self.name} response was truncated; salvaged {len(valid)} complete item(s)")
+        return valid
+
+    def _generate_items(self, prompt: str, temperature: float, kind: str, units: int, schema: Dict) -> List[Dict]:
+        if not getattr(self, "available", False):
+            raise Exception(f"{type(self).__name__} not available")
+        text = self._complete(prompt, temperature, self._budget(kind, units), schema)
+        items = self._parse_items(text, schema, kind)
+        if not items:
+            raise Exception(f"Could not parse data from {self.name}")
+        return items
+
+    def _stream_items(self, prompt: str, temperature: float, kind: str, units: int,
+                      schema: Dict) -> Iterator[Dict]:
+        if not getattr(self, "available", False):
+            raise Exception(f"{type(self).__name__} not available")
+        parser = JsonArrayStreamParser()
+        count = 0
+        invalid = 0
+        length = 0
+        for chunk in self._stream_text(prompt, temperature, self._budget(kind, units), schema):
+            length += len(chunk)
+            for item in parser.feed(chunk):
+                item = validate_item(item, schema)
+                if item is None:
+                    invalid += 1
+                    continue
+                count += 1
+                yield item
+            if parser.done:
+                break
+        _parse_stats.record(self.name, bool(count), invalid, parser.truncated)
+        self._observe_usage(kind, count + invalid, length, parser.truncated)
+        if parser.truncated:
+            logger.warning(f"⚠️ {self.name} stream was truncated; salvaged {count} complete item(s)")
+        if not count:
+            raise Exception(f"Could not parse streamed data from {self.name}")
+
+    # ---- async interface (runs on the ai_async event loop) ----
+
+    async def _acomplete(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                         schema: Dict = None) -> str:
+        """
+        Async _complete. Providers with a plain HTTP API override this on the shared
+        httpx clients; the default runs the blocking call in a thread.
+        """
+        def call():
+            text = self._complete(prompt, temperature, max_tokens, schema)
+            return text, getattr(_usage_local, "tokens", None)
+
+        text, tokens = await asyncio.to_thread(call)
+        # Usage is thread-local: hand it over to the loop thread that parses the response
+        report_output_tokens(tokens)
+        return text
+
+    def _complete_via_async(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                            schema: Dict = None) -> str:
+        """_complete for providers whose only HTTP implementation is _acomplete."""
+        async def call():
+            text = await self._acomplete(prompt, temperature, max_tokens, schema)
+            return text, getattr(_usage_local, "tokens", None)
+
+        text, tokens = ai_async.run_sync(call())
+        # Reported on the loop thread; hand it back to the caller that parses the response
+        report_output_tokens(tokens)
+        return text
+
+    async def _agenerate_items(self, prompt: str, temperature: float, kind: str, units: int,
+                               schema: Dict) -> List[Dict]:
+        if not getattr(self, "available", False):
+            raise Exception(f"{type(self).__name__} not available")
+        text = await self._acomplete(prompt, temperature, self._budget(kind, units), schema)
+        # No await between the usage report and parsing, so concurrent tasks can't mix them up
+        items = self._parse_items(text, schema, kind)
+        if not items:
+            raise Exception(f"Could not parse data from {self.name}")
+        return items
+
+    async def agenerate_flashcards(self, topic: str, num_cards: int = 5) -> List[Dict]:
+        prompt = build_flashcard_prompt(topic, num_cards)
+        return await self._agenerate_items(prompt, 0.7, "flashcard", num_cards, FLASHCARD_SCHEMA)
+
+    async def agenerate_study_plan(self, subject: str, level: str, days: int, hours_per_day: float) -> List[Dict]:
+        prompt = build_plan_prompt(subject, level, days, hours_per_day, detail_words=TokenBudget.detail_words(days))
+        return await self._agenerate_items(prompt, 0.5, "plan_day", days, PLAN_DAY_SCHEMA)
+
+    async def agenerate_plan_window(self, subject: str, level: str, days: int, hours_per_day: float,
+                                    start: int, end: int, focus: str = None,
+                                    previous: str = None, following: str = None, details: bool = True) -> List[Dict]:
+        count = end - start + 1
+        prompt = build_window_prompt(subject, level, days, hours_per_day, start, end,
+                                     focus, previous, following, details, TokenBudget.detail_words(count))
+        return await self._agenerate_items(prompt, 0.5, "plan_day" if details else "plan_topic", count,
+                                           PLAN_DAY_SCHEMA)
+
+    async def agenerate_flashcard_batch(self, topics: List[str], num_cards: int, subject: str = None) -> List[Dict]:
+        prompt = build_batch_flashcard_prompt(topics, num_cards, subject)
+        return await self._agenerate_items(prompt, 0.7, "flashcard", num_cards * len(topics),
+                                           BATCH_FLASHCARD_SCHEMA)
+
+    def stream_flashcards(self, topic: str, num_cards: int = 5) -> Iterator[Dict]:
+        """Yield flashcards one by one as they are parsed from the streamed response."""
+        prompt = build_flashcard_prompt(topic, num_cards)
+        yield from self._stream_items(prompt, 0.7, "flashcard", num_cards, FLASHCARD_SCHEMA)
+
+    def stream_study_plan(self, subject: str, level: str, days: int, hours_per_day: float,
+                          details: bool = True) -> Iterator[Dict]:
+        """Yield plan days one by one as they are parsed from the streamed response."""
+        prompt = build_plan_prompt(subject, level, days, hours_per_day, details, TokenBudget.detail_words(days))
+        kind = "plan_day" if details else "plan_topic"
+        yield from self._stream_items(prompt, 0.5, kind, days, PLAN_DAY_SCHEMA)
+
+    def generate_plan_topics(self, subject: str, level: str, days: int, hours_per_day: float) -> List[Dict]:
+        """Lazy plan: day/topic/hours only, without details."""
+        prompt = build_plan_prompt(subject, level, days, hours_per_day, details=False)
+        return self._generate_items(prompt, 0.5, "plan_topic", days, PLAN_DAY_SCHEMA)
+
+    def generate_day_details(self, subject: str, level: str, days: int, day: int, topic: str,
+                             hours: float) -> str:
+        """Detailed breakdown for one day of a lazy plan, as plain text."""
+        if not getattr(self, "available", False):
+            raise Exception(f"{type(self).__name__} not available")
+        prompt = build_day_details_prompt(subject, level, days, day, topic, hours)
+        text = self._complete(prompt, 0.5, self._budget("day_details", 1)).strip()
+        self._observe_usage("day_details", 1, len(text), False)
+        if not text:
+            raise Exception(f"Empty day details from {self.name}")
+        return text
+
+    def generate_plan_outline(self, subject: str, level: str, days: int, parts: int, window: int) -> List[Dict]:
+        """One {"part", "focus"} entry per window of a long plan."""
+        prompt = build_outline_prompt(subject, level, days, parts, window)
+        return self._generate_items(prompt, 0.5, "outline_part", parts, OUTLINE_SCHEMA)
+
+    def generate_plan_window(self, subject: str, level: str, days: int, hours_per_day: float,
+                             start: int, end: int, focus: str = None,
+                             previous: str = None, following: str = None, details: bool = True) -> List[Dict]:
+        """Days start..end of a long plan."""
+        count = end - start + 1
+        prompt = build_window_prompt(subject, level, days, hours_per_day, start, end,
+                                     focus, previous, following, details, TokenBudget.detail_words(count))
+        return self._generate_items(prompt, 0.5, "plan_day" if details else "plan_topic", count, PLAN_DAY_SCHEMA)
+
+    def generate_flashcard_batch(self, topics: List[str], num_cards: int, subject: str = None) -> List[Dict]:
+        """Flashcards for several topics in one call; each card carries its 1-based "topic" number."""
+        prompt = build_batch_flashcard_prompt(topics, num_cards, subject)
+        return self._generate_items(prompt, 0.7, "flashcard", num_cards * len(topics), BATCH_FLASHCARD_SCHEMA)
+
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
 
 class GeminiProvider(AIProvider):
     """Google Gemini API Provider"""
+
+    name = "gemini"
+    max_output_tokens = 8192
     
     def __init__(self, model_override: str = None):
         try:
@@ -51,9 +672,14 @@ class GeminiProvider(AIProvider):
             logger.warning("⚠️ google-generativeai not installed")
             self.available = False
             return
+        if ai_async.httpx is None:
+            logger.warning("⚠️ httpx not installed (needed for Gemini)")
+            self.available = False
+            return
         
         api_key = os.getenv("GEMINI_API_KEY", "").strip()
         model = model_override or os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+        self.model_name = model
         
         if not api_key:
             logger.warning("⚠️ GEMINI_API_KEY not set")
@@ -64,7 +690,6 @@ class GeminiProvider(AIProvider):
             genai.configure(api_key=api_key)
             self.model = genai.GenerativeModel(model)
             self.api_key = api_key
-            self.model_name = model
             logger.info(f"✅ Gemini provider initialized: {model}")
         except Exception as e:
             logger.error(f"❌ Gemini init failed: {e}")
@@ -75,24 +700,14 @@ class GeminiProvider(AIProvider):
             raise Exception("Gemini provider not available")
         
         try:
-            prompt = (
-                f"Generate exactly {num_cards} flashcard Q&A pairs for: {topic}\n\n"
-                "Return ONLY a JSON array with no extra text or markdown:\n"
-                '[{"question": "...", "answer": "..."}]\n\n'
-                "Requirements:\n"
-                "- Questions should test understanding\n"
-                "- Keep answers concise (1-2 sentences)\n"
-                "- Valid JSON array only\n"
-                "- Each object must have 'question' and 'answer' keys"
-            )
+            prompt = build_flashcard_prompt(topic, num_cards)
             
-            response = self.model.generate_content(prompt, generation_config={'temperature': 0.7})
-            text = response.text if response else ""
+            text = self._complete(prompt, 0.7, self._budget("flashcard", num_cards), FLASHCARD_SCHEMA)
             
             if not text:
                 raise Exception("Empty response from Gemini API")
             
-            cards = self._parse_json_list(text)
+            cards = self._parse_items(text, FLASHCARD_SCHEMA, "flashcard")
             if not cards:
                 raise Exception(f"Could not parse flashcard data from response")
             
@@ -101,9 +716,10 @@ class GeminiProvider(AIProvider):
             
         except Exception as e:
             error_msg = str(e)
-            if "quota" in error_msg.lower() or "resource_exhausted" in error_msg.lower():
+            if _is_rate_limit_error(e):
                 logger.error(f"❌ Gemini quota exceeded: {error_msg[:150]}")
-                raise Exception("API quota exceeded. Please wait and try again.")
+                raise ProviderRateLimitError("API quota exceeded. Please wait and try again.",
+                                             getattr(e, "retry_after", None) or _retry_after_from(e))
             else:
                 logger.error(f"❌ Gemini error: {error_msg[:200]}")
                 raise Exception(f"Gemini error: {error_msg[:100]}")
@@ -113,20 +729,15 @@ class GeminiProvider(AIProvider):
             raise Exception("Gemini provider not available")
         
         try:
-            prompt = (
-                f"Create a {days}-day study plan for {subject} (Level: {level}).\n"
-                f"Total: {hours_per_day} hours per day.\n"
-                "Return ONLY a JSON array:\n"
-                '[{"day": 1, "topic": "...", "hours": 2, "details": "..."}, ...]\n'
-            )
+            prompt = build_plan_prompt(subject, level, days, hours_per_day,
+                                       detail_words=TokenBudget.detail_words(days))
             
-            response = self.model.generate_content(prompt, generation_config={'temperature': 0.5})
-            text = response.text if response else ""
+            text = self._complete(prompt, 0.5, self._budget("plan_day", days), PLAN_DAY_SCHEMA)
             
             if not text:
                 raise Exception("Empty response from Gemini")
             
-            plans = self._parse_json_list(text)
+            plans = self._parse_items(text, PLAN_DAY_SCHEMA, "plan_day")
             if not plans:
                 raise Exception("Could not parse plan data")
             
@@ -137,27 +748,93 @@ class GeminiProvider(AIProvider):
             logger.error(f"❌ Gemini study plan error: {str(e)[:200]}")
             raise
     
-    def _parse_json_list(self, text: str) -> List[Dict]:
-        """Extract and parse JSON array from response text."""
-        # Remove markdown code blocks
-        text = re.sub(r'^```json\s*', '', text)
-        text = re.sub(r'^```\s*', '', text)
-        text = re.sub(r'\s*```$', '', text)
-        text = text.strip()
-        
-        # Extract JSON array
-        match = re.search(r'\[.*\]', text, re.DOTALL)
-        if not match:
-            return []
-        
-        try:
-            return json.loads(match.group())
-        except json.JSONDecodeError:
-            return []
+    @staticmethod
+    def _response_schema(schema: Dict) -> Dict:
+        """JSON Schema subset -> Gemini's OpenAPI-style schema (upper-case type names)."""
+        converted = {"type": schema["type"].upper()}
+        if "properties" in schema:
+            converted["properties"] = {
+                name: GeminiProvider._response_schema(spec) for name, spec in schema["properties"].items()
+            }
+        if "items" in schema:
+            converted["items"] = GeminiProvider._response_schema(schema["items"])
+        if schema.get("required"):
+            converted["required"] = list(schema["required"])
+        return converted
+
+    def _generation_config(self, temperature: float, max_tokens: Optional[int], schema: Dict = None) -> Dict:
+        config = {'temperature': temperature}
+        if max_tokens:
+            config['max_output_tokens'] = max_tokens
+        if schema:
+            # Constrained decoding: the response is a JSON array of schema-shaped objects
+            config['response_mime_type'] = 'application/json'
+            config['response_schema'] = self._response_schema({"type": "array", "items": schema})
+        return config
+
+    _complete = AIProvider._complete_via_async
+
+    @staticmethod
+    def _output_tokens(response) -> Optional[int]:
+        usage = getattr(response, "usage_metadata", None)
+        return getattr(usage, "candidates_token_count", None) if usage else None
+
+    async def _acomplete(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                         schema: Dict = None) -> str:
+        model = self.model_name[len("models/"):] if self.model_name.startswith("models/") else self.model_name
+        response = await ai_async.post(
+            "gemini", GEMINI_API_URL.format(model=model),
+            headers={"x-goog-api-key": self.api_key},
+            timeout=cap_timeout(ai_async.READ_TIMEOUT),
+            json={
+                "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                # The REST API accepts the SDK's snake_case config names
+                "generationConfig": self._generation_config(temperature, max_tokens, schema),
+            },
+        )
+        _check_http_response(response, "Gemini")
+        data = response.json()
+        candidates = data.get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        report_output_tokens((data.get("usageMetadata") or {}).get("candidatesTokenCount"))
+        return "".join(part.get("text", "") for part in parts)
+
+    def _stream_text(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                     schema: Dict = None) -> Iterator[str]:
+        response = self.model.generate_content(
+            prompt,
+            generation_config=self._generation_config(temperature, max_tokens, schema),
+            stream=True,
+            request_options=_deadline_timeout(),
+        )
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety or finish metadata)
+                continue
+            if text:
+                yield text
+        report_output_tokens(self._output_tokens(response))
+
+
+# One HTTP session and request-slot semaphore per Ollama server, shared by all its models
+_ollama_servers: Dict[str, Tuple[object, threading.BoundedSemaphore]] = {}
+_ollama_servers_lock = threading.Lock()
 
 
 class OllamaProvider(AIProvider):
-    """Local Ollama Provider - Free, no API key needed"""
+    """
+    Local Ollama Provider - Free, no API key needed
+
+    Requests reuse one keep-alive HTTP session per server and are capped at
+    OLLAMA_NUM_PARALLEL concurrent generations per worker process (the number
+    Ollama serves in parallel); extra requests queue client-side for up to
+    OLLAMA_QUEUE_TIMEOUT seconds instead of piling onto a CPU-bound model.
+    OLLAMA_KEEP_ALIVE keeps the model loaded between requests.
+    """
+
+    name = "ollama"
     
     def __init__(self, model_override: str = None):
         try:
@@ -168,13 +845,22 @@ class OllamaProvider(AIProvider):
             logger.warning("⚠️ requests library not installed (needed for Ollama)")
             self.available = False
             return
+        if ai_async.httpx is None:
+            logger.warning("⚠️ httpx not installed (needed for Ollama)")
+            self.available = False
+            return
         
         self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.model = model_override or os.getenv("OLLAMA_MODEL", "llama2")
+        self.model_name = self.model
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m").strip()
+        self.read_timeout = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+        self.queue_timeout = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "120"))
+        self.session, self.slots = self._server(self.base_url)
         
         # Test connection
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
                 logger.info(f"✅ Ollama provider initialized: {self.model} at {self.base_url}")
             else:
@@ -189,28 +875,14 @@ class OllamaProvider(AIProvider):
             raise Exception("Ollama provider not available")
         
         try:
-            prompt = (
-                f"Generate exactly {num_cards} flashcard Q&A pairs for: {topic}\n\n"
-                "Return ONLY a JSON array:\n"
-                '[{"question": "...", "answer": "..."}]\n'
-            )
-            
-            response = self.requests.post(
-                f"{self.base_url}/api/generate",
-                json={"model": self.model, "prompt": prompt, "stream": False},
-                timeout=60
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Ollama returned {response.status_code}")
+            prompt = build_flashcard_prompt(topic, num_cards)
             
-            data = response.json()
-            text = data.get("response", "")
+            text = self._complete(prompt, 0.7, self._budget("flashcard", num_cards), FLASHCARD_SCHEMA)
             
             if not text:
                 raise Exception("Empty response from Ollama")
             
-            cards = self._parse_json_list(text)
+            cards = self._parse_items(text, FLASHCARD_SCHEMA, "flashcard")
             if not cards:
                 raise Exception("Could not parse flashcard data")
             
@@ -226,26 +898,12 @@ class OllamaProvider(AIProvider):
             raise Exception("Ollama provider not available")
         
         try:
-            prompt = (
-                f"Create a {days}-day study plan for {subject} (Level: {level}).\n"
-                f"Total: {hours_per_day} hours per day.\n"
-                "Return ONLY a JSON array:\n"
-                '[{"day": 1, "topic": "...", "hours": 2, "details": "..."}, ...]\n'
-            )
-            
-            response = self.requests.post(
-                f"{self.base_url}/api/generate",
-                json={"model": self.model, "prompt": prompt, "stream": False},
-                timeout=120
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Ollama returned {response.status_code}")
+            prompt = build_plan_prompt(subject, level, days, hours_per_day,
+                                       detail_words=TokenBudget.detail_words(days))
             
-            data = response.json()
-            text = data.get("response", "")
+            text = self._complete(prompt, 0.5, self._budget("plan_day", days), PLAN_DAY_SCHEMA)
             
-            plans = self._parse_json_list(text)
+            plans = self._parse_items(text, PLAN_DAY_SCHEMA, "plan_day")
             if not plans:
                 raise Exception("Could not parse plan data")
             
@@ -256,25 +914,111 @@ class OllamaProvider(AIProvider):
             logger.error(f"❌ Ollama study plan error: {str(e)[:200]}")
             raise
     
-    def _parse_json_list(self, text: str) -> List[Dict]:
-        """Extract and parse JSON array."""
-        text = re.sub(r'^```json\s*', '', text)
-        text = re.sub(r'^```\s*', '', text)
-        text = re.sub(r'\s*```$', '', text)
-        text = text.strip()
-        
-        match = re.search(r'\[.*\]', text, re.DOTALL)
-        if not match:
-            return []
-        
+    def _server(self, base_url: str):
+        with _ollama_servers_lock:
+            server = _ollama_servers.get(base_url)
+            if server is None:
+                parallel = max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "1")))
+                session = self.requests.Session()
+                adapter = self.requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=parallel + 2)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                server = _ollama_servers[base_url] = (session, threading.BoundedSemaphore(parallel))
+            return server
+
+    def _acquire_slot(self):
+        if not self.slots.acquire(blocking=False):
+            logger.info(f"Ollama busy; queueing request for {self.model}")
+            if not self.slots.acquire(timeout=cap_timeout(self.queue_timeout)):
+                raise Exception("Ollama is busy with other requests. Please try again shortly.")
+
+    def _payload(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                 schema: Dict, stream: bool) -> Dict:
+        options = {"temperature": temperature}
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        payload = {"model": self.model, "prompt": prompt, "stream": stream, "options": options}
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        if schema:
+            payload["format"] = "json"  # grammar-constrained: output is always valid JSON
+        return payload
+
+    def warm_up(self):
+        """Load the model into memory (an empty prompt loads it without generating)."""
+        started = time.monotonic()
+        self._acquire_slot()
+        try:
+            payload = {"model": self.model, "prompt": ""}
+            if self.keep_alive:
+                payload["keep_alive"] = self.keep_alive
+            response = self.session.post(f"{self.base_url}/api/generate", json=payload,
+                                         timeout=(5, self.read_timeout))
+            if response.status_code != 200:
+                raise Exception(f"Ollama returned {response.status_code}")
+        finally:
+            self.slots.release()
+        logger.info(f"✅ Ollama model {self.model} warmed up in {time.monotonic() - started:.1f}s")
+
+    _complete = AIProvider._complete_via_async
+
+    async def _acomplete(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                         schema: Dict = None) -> str:
+        # Poll for a slot instead of blocking the loop; sync and async callers share the slots
+        deadline = time.monotonic() + cap_timeout(self.queue_timeout)
+        while not self.slots.acquire(blocking=False):
+            check_deadline()
+            if time.monotonic() > deadline:
+                raise Exception("Ollama is busy with other requests. Please try again shortly.")
+            await asyncio.sleep(0.05)
+        try:
+            response = await ai_async.post(
+                f"ollama:{self.base_url}", f"{self.base_url}/api/generate",
+                json=self._payload(prompt, temperature, max_tokens, schema, stream=False),
+                timeout=cap_timeout(self.read_timeout),
+            )
+        finally:
+            self.slots.release()
+        _check_http_response(response, "Ollama")
+        data = response.json()
+        report_output_tokens(data.get("eval_count"))
+        return data.get("response", "")
+
+    def _stream_text(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                     schema: Dict = None) -> Iterator[str]:
+        self._acquire_slot()
         try:
-            return json.loads(match.group())
-        except json.JSONDecodeError:
-            return []
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json=self._payload(prompt, temperature, max_tokens, schema, stream=True),
+                stream=True,
+                timeout=(5, cap_timeout(self.read_timeout))
+            )
+            try:
+                if response.status_code != 200:
+                    raise Exception(f"Ollama returned {response.status_code}")
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise Exception(f"Ollama error: {data['error']}")
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        report_output_tokens(data.get("eval_count"))
+                        break
+            finally:
+                response.close()
+        finally:
+            self.slots.release()
 
 
 class HuggingFaceProvider(AIProvider):
     """Hugging Face Inference API Provider"""
+
+    name = "huggingface"
+    max_output_tokens = 2048
     
     def __init__(self, model_override: str = None):
         try:
@@ -288,6 +1032,7 @@ class HuggingFaceProvider(AIProvider):
         
         api_key = os.getenv("HUGGINGFACE_API_KEY", "").strip()
         model = model_override or os.getenv("HUGGINGFACE_MODEL", "mistralai/Mistral-7B-Instruct-v0.1")
+        self.model_name = model
         
         if not api_key:
             logger.warning("⚠️ HUGGINGFACE_API_KEY not set")
@@ -307,19 +1052,14 @@ class HuggingFaceProvider(AIProvider):
             raise Exception("Hugging Face provider not available")
         
         try:
-            prompt = (
-                f"Generate exactly {num_cards} flashcard Q&A pairs for: {topic}\n\n"
-                "Return ONLY a JSON array:\n"
-                '[{"question": "...", "answer": "..."}]\n'
-            )
+            prompt = build_flashcard_prompt(topic, num_cards)
             
-            response = self.client.text_generation(prompt, max_new_tokens=1024)
-            text = response if isinstance(response, str) else response.get("generated_text", "")
+            text = self._complete(prompt, 0.7, self._budget("flashcard", num_cards), FLASHCARD_SCHEMA)
             
             if not text:
                 raise Exception("Empty response from Hugging Face")
             
-            cards = self._parse_json_list(text)
+            cards = self._parse_items(text, FLASHCARD_SCHEMA, "flashcard")
             if not cards:
                 raise Exception("Could not parse flashcard data")
             
@@ -335,17 +1075,12 @@ class HuggingFaceProvider(AIProvider):
             raise Exception("Hugging Face provider not available")
         
         try:
-            prompt = (
-                f"Create a {days}-day study plan for {subject} (Level: {level}).\n"
-                f"Total: {hours_per_day} hours per day.\n"
-                "Return ONLY a JSON array:\n"
-                '[{"day": 1, "topic": "...", "hours": 2}, ...]\n'
-            )
+            prompt = build_plan_prompt(subject, level, days, hours_per_day,
+                                       detail_words=TokenBudget.detail_words(days))
             
-            response = self.client.text_generation(prompt, max_new_tokens=2048)
-            text = response if isinstance(response, str) else response.get("generated_text", "")
+            text = self._complete(prompt, 0.5, self._budget("plan_day", days), PLAN_DAY_SCHEMA)
             
-            plans = self._parse_json_list(text)
+            plans = self._parse_items(text, PLAN_DAY_SCHEMA, "plan_day")
             if not plans:
                 raise Exception("Could not parse plan data")
             
@@ -356,26 +1091,32 @@ class HuggingFaceProvider(AIProvider):
             logger.error(f"❌ Hugging Face study plan error: {str(e)[:200]}")
             raise
     
-    def _parse_json_list(self, text: str) -> List[Dict]:
-        """Extract and parse JSON array."""
-        text = re.sub(r'^```json\s*', '', text)
-        text = re.sub(r'^```\s*', '', text)
-        text = re.sub(r'\s*```$', '', text)
-        text = text.strip()
-        
-        match = re.search(r'\[.*\]', text, re.DOTALL)
-        if not match:
-            return []
-        
-        try:
-            return json.loads(match.group())
-        except json.JSONDecodeError:
-            return []
+    # The serverless text-generation endpoint has no JSON mode; output is only schema-validated
+    def _complete(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                  schema: Dict = None) -> str:
+        response = self.client.text_generation(
+            prompt, model=self.model, max_new_tokens=max_tokens or self.max_output_tokens, temperature=temperature)
+        return response if isinstance(response, str) else response.get("generated_text", "")
+
+    def _stream_text(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                     schema: Dict = None) -> Iterator[str]:
+        for token in self.client.text_generation(
+            prompt,
+            model=self.model,
+            max_new_tokens=max_tokens or self.max_output_tokens,
+            temperature=temperature,
+            stream=True,
+        ):
+            if token:
+                yield token
 
 
 class GroqProvider(AIProvider):
     """Groq API Provider - LLaMA 3, Mixtral (14,400 free req/day)"""
 
+    name = "groq"
+    max_output_tokens = 8192
+
     def __init__(self, model_override: str = None):
         try:
             from groq import Groq
@@ -385,9 +1126,14 @@ class GroqProvider(AIProvider):
             logger.warning("⚠️ groq package not installed. Run: pip install groq")
             self.available = False
             return
+        if ai_async.httpx is None:
+            logger.warning("⚠️ httpx not installed (needed for Groq)")
+            self.available = False
+            return
 
         api_key = os.getenv("GROQ_API_KEY", "").strip()
         model = model_override or os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+        self.model_name = model
 
         if not api_key:
             logger.warning("⚠️ GROQ_API_KEY not set")
@@ -395,7 +1141,9 @@ class GroqProvider(AIProvider):
             return
 
         try:
-            self.client = Groq(api_key=api_key)
+            # Retries are ours (RetryPolicy), bounded by the request deadline
+            self.client = Groq(api_key=api_key, max_retries=0)
+            self.api_key = api_key
             self.model = model
             logger.info(f"✅ Groq provider initialized: {model}")
         except Exception as e:
@@ -407,29 +1155,14 @@ class GroqProvider(AIProvider):
             raise Exception("Groq provider not available")
 
         try:
-            prompt = (
-                f"Generate exactly {num_cards} flashcard Q&A pairs for: {topic}\n\n"
-                "Return ONLY a JSON array with no extra text or markdown:\n"
-                '[{"question": "...", "answer": "..."}]\n\n'
-                "Requirements:\n"
-                "- Questions should test understanding\n"
-                "- Keep answers concise (1-2 sentences)\n"
-                "- Valid JSON array only\n"
-                "- Each object must have 'question' and 'answer' keys"
-            )
+            prompt = build_flashcard_prompt(topic, num_cards)
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=1024,
-            )
-            text = response.choices[0].message.content or ""
+            text = self._complete(prompt, 0.7, self._budget("flashcard", num_cards), FLASHCARD_SCHEMA)
 
             if not text:
                 raise Exception("Empty response from Groq")
 
-            cards = self._parse_json_list(text)
+            cards = self._parse_items(text, FLASHCARD_SCHEMA, "flashcard")
             if not cards:
                 raise Exception("Could not parse flashcard data from Groq response")
 
@@ -440,7 +1173,8 @@ class GroqProvider(AIProvider):
             error_msg = str(e)
             if "rate_limit" in error_msg.lower() or "429" in error_msg:
                 logger.error(f"❌ Groq rate limit hit: {error_msg[:150]}")
-                raise Exception("Groq rate limit reached. Please wait and try again.")
+                raise ProviderRateLimitError("Groq rate limit reached. Please wait and try again.",
+                                             _retry_after_from(e))
             logger.error(f"❌ Groq flashcard error: {error_msg[:200]}")
             raise
 
@@ -449,25 +1183,15 @@ class GroqProvider(AIProvider):
             raise Exception("Groq provider not available")
 
         try:
-            prompt = (
-                f"Create a {days}-day study plan for {subject} (Level: {level}).\n"
-                f"Total: {hours_per_day} hours per day.\n"
-                "Return ONLY a JSON array:\n"
-                '[{"day": 1, "topic": "...", "hours": 2, "details": "..."}, ...]\n'
-            )
+            prompt = build_plan_prompt(subject, level, days, hours_per_day,
+                                       detail_words=TokenBudget.detail_words(days))
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.5,
-                max_tokens=2048,
-            )
-            text = response.choices[0].message.content or ""
+            text = self._complete(prompt, 0.5, self._budget("plan_day", days), PLAN_DAY_SCHEMA)
 
             if not text:
                 raise Exception("Empty response from Groq")
 
-            plans = self._parse_json_list(text)
+            plans = self._parse_items(text, PLAN_DAY_SCHEMA, "plan_day")
             if not plans:
                 raise Exception("Could not parse plan data from Groq response")
 
@@ -478,29 +1202,455 @@ class GroqProvider(AIProvider):
             logger.error(f"❌ Groq study plan error: {str(e)[:200]}")
             raise
 
-    def _parse_json_list(self, text: str) -> List[Dict]:
-        """Extract and parse JSON array from response text."""
-        text = re.sub(r'^```json\s*', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^```\s*', '', text, flags=re.MULTILINE)
-        text = re.sub(r'\s*```$', '', text, flags=re.MULTILINE)
-        text = text.strip()
+    def _chat_body(self, prompt: str, temperature: float, max_tokens: Optional[int], schema: Dict = None) -> Dict:
+        messages = [{"role": "user", "content": prompt}]
+        body = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens or self.max_output_tokens,
+        }
+        if schema:
+            # JSON mode only allows a top-level object, so the array travels in "items"
+            messages.insert(0, {"role": "system", "content": (
+                'Respond with a JSON object {"items": [...]} whose "items" array holds the requested '
+                "elements, each shaped like this JSON schema: " + json.dumps(schema))})
+            body["response_format"] = {"type": "json_object"}
+        return body
+
+    _complete = AIProvider._complete_via_async
 
-        match = re.search(r'\[.*\]', text, re.DOTALL)
-        if not match:
-            return []
+    async def _acomplete(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                         schema: Dict = None) -> str:
+        response = await ai_async.post(
+            "groq", GROQ_API_URL,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json=self._chat_body(prompt, temperature, max_tokens, schema),
+            timeout=cap_timeout(ai_async.READ_TIMEOUT),
+        )
+        _check_http_response(response, "Groq")
+        data = response.json()
+        report_output_tokens((data.get("usage") or {}).get("completion_tokens"))
+        return ((data.get("choices") or [{}])[0].get("message") or {}).get("content") or ""
 
+    # JSON mode cannot be combined with streaming on Groq; streamed output is only schema-validated
+    def _stream_text(self, prompt: str, temperature: float, max_tokens: Optional[int],
+                     schema: Dict = None) -> Iterator[str]:
         try:
-            return json.loads(match.group())
-        except json.JSONDecodeError:
-            return []
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **_deadline_timeout(),
+            )
+            for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    yield text
+                # Groq attaches usage to the final chunk
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage is not None:
+                    report_output_tokens(getattr(usage, "completion_tokens", None))
+        except Exception as e:
+            error_msg = str(e)
+            if "rate_limit" in error_msg.lower() or "429" in error_msg:
+                logger.error(f"❌ Groq rate limit hit: {error_msg[:150]}")
+                raise ProviderRateLimitError("Groq rate limit reached. Please wait and try again.",
+                                             _retry_after_from(e))
+            raise
+
+
+class LocalProvider(AIProvider):
+    """Deterministic plans from curated topic catalogs (local_planner); no network or API key."""
+
+    name = "local"
+    cacheable = False
+    supports_flashcards = False
+
+    def __init__(self, model_override: str = None):
+        self.available = True
+
+    def generate_flashcards(self, topic: str, num_cards: int = 5) -> List[Dict]:
+        raise Exception("The local engine only generates study plans")
+
+    def generate_study_plan(self, subject: str, level: str, days: int, hours_per_day: float) -> List[Dict]:
+        return local_planner.build_plan(subject, level, days, hours_per_day)
+
+    def stream_study_plan(self, subject: str, level: str, days: int, hours_per_day: float,
+                          details: bool = True) -> Iterator[Dict]:
+        yield from local_planner.build_plan(subject, level, days, hours_per_day, details)
+
+    def generate_plan_topics(self, subject: str, level: str, days: int, hours_per_day: float) -> List[Dict]:
+        return local_planner.build_plan(subject, level, days, hours_per_day, details=False)
+
+    async def agenerate_study_plan(self, subject: str, level: str, days: int, hours_per_day: float) -> List[Dict]:
+        return local_planner.build_plan(subject, level, days, hours_per_day)
+
+    def generate_day_details(self, subject: str, level: str, days: int, day: int, topic: str,
+                             hours: float) -> str:
+        return local_planner.day_details(subject, level, days, day, topic, hours)
+
+
+# =============================================================================
+# PROVIDER POOL
+# =============================================================================
+
+_PROVIDER_MAP = {
+    "groq": GroqProvider,
+    "gemini": GeminiProvider,
+    "ollama": OllamaProvider,
+    "huggingface": HuggingFaceProvider,
+    "local": LocalProvider,
+}
+
+
+class ProviderPool:
+    """
+    Bounded, thread-safe registry of warm provider instances keyed by (provider, model).
+
+    Building a provider creates an SDK client (and for Ollama probes the server),
+    so instances are reused across requests. Least recently used entries are evicted
+    once the pool is full, and entries idle for longer than ``idle_ttl`` seconds are
+    dropped. Unavailable providers are remembered for ``retry_ttl`` seconds so a
+    missing API key or a down Ollama server is not re-probed on every request.
+    """
+
+    def __init__(self, max_size: int = 16, idle_ttl: float = 1800, retry_ttl: float = 60):
+        self.max_size = max(1, max_size)
+        self.idle_ttl = idle_ttl
+        self.retry_ttl = retry_ttl
+        self._entries = OrderedDict()  # key -> [instance, created_at, last_used]
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, provider_name: str, model: str = None) -> Optional[AIProvider]:
+        """Return a pooled provider instance, building it on first use. May raise on init errors."""
+        cls = _PROVIDER_MAP.get(provider_name.lower())
+        if not cls:
+            return None
+        key = (cls.name, model or None)
+
+        with self._lock:
+            instance = self._lookup(key)
+            if instance is not None:
+                return instance
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Build outside the pool lock so one slow init doesn't block other keys
+        with build_lock:
+            with self._lock:
+                instance = self._lookup(key)
+                if instance is not None:
+                    return instance
+            try:
+                instance = cls(model_override=model) if model else cls()
+            except Exception:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+                raise
+            with self._lock:
+                self._build_locks.pop(key, None)
+                self.misses += 1
+                now = time.monotonic()
+                self._entries[key] = [instance, now, now]
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return instance
+
+    def _lookup(self, key: Tuple[str, Optional[str]]) -> Optional[AIProvider]:
+        """Return a live entry for key and mark it used. Caller must hold the lock."""
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entry[2] = now
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _expire(self, now: float):
+        expired = [
+            key for key, (instance, created_at, last_used) in self._entries.items()
+            if (instance.available and now - last_used > self.idle_ttl)
+            or (not instance.available and now - created_at > self.retry_ttl)
+        ]
+        for key in expired:
+            del self._entries[key]
+
+    def invalidate(self, provider_name: str = None):
+        """Drop pooled instances for one provider (or all of them)."""
+        with self._lock:
+            for key in list(self._entries):
+                if provider_name is None or key[0] == provider_name.lower():
+                    del self._entries[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": [
+                    {"provider": key[0], "model": entry[0].model_name, "available": entry[0].available}
+                    for key, entry in self._entries.items()
+                ],
+            }
+
+
+_provider_pool = ProviderPool(
+    max_size=int(os.getenv("AI_PROVIDER_POOL_SIZE", "16")),
+    idle_ttl=float(os.getenv("AI_PROVIDER_POOL_IDLE_TTL", "1800")),
+    retry_ttl=float(os.getenv("AI_PROVIDER_POOL_RETRY_TTL", "60")),
+)
+
+
+def get_provider_pool() -> ProviderPool:
+    return _provider_pool
+
+
+# =============================================================================
+# PROVIDER ROUTING
+# =============================================================================
+
+class ProviderHealth:
+    """
+    Live health of one provider: EWMA latency and error rate plus a circuit breaker.
+
+    The breaker opens after ``failure_threshold`` consecutive failures. Once
+    ``reset_timeout`` seconds have passed, a single half-open probe request is
+    let through; its success closes the breaker, its failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, alpha: float, failure_threshold: int, reset_timeout: float,
+                 error_half_life: float = 120):
+        self.name = name
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.updated_at = 0.0
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.recent_latencies = deque(maxlen=100)
+
+    def can_attempt(self, now: float) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now - self.opened_at >= self.reset_timeout
+        # Half-open: one probe at a time, unless the probe was abandoned
+        return self.probe_started_at is None or now - self.probe_started_at >= self.reset_timeout
+
+    def acquire(self, now: float) -> bool:
+        """Claim permission for one request; moves an expired open breaker to half-open."""
+        if not self.can_attempt(now):
+            return False
+        if self.state != self.CLOSED:
+            self.state = self.HALF_OPEN
+            self.probe_started_at = now
+        return True
+
+    def record(self, ok: bool, latency: float, now: float):
+        if ok:
+            # Failures are often fast (auth/429 errors) and must not make a provider look quick
+            self.ewma_latency = latency if self.ewma_latency is None else (
+                self.alpha * latency + (1 - self.alpha) * self.ewma_latency)
+            self.recent_latencies.append(latency)
+        self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.current_error_rate(now)
+        self.updated_at = now
+        self.probe_started_at = None
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"⚠️ Circuit breaker opened for {self.name}")
+                self.state = self.OPEN
+                self.opened_at = now
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Observed success latency at the given percentile (0-1), or None without samples."""
+        if not self.recent_latencies:
+            return None
+        ordered = sorted(self.recent_latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def current_error_rate(self, now: float) -> float:
+        """Error rate decayed since the last outcome, so an idle provider is eventually retried."""
+        if not self.error_rate:
+            return 0.0
+        return self.error_rate * 0.5 ** ((now - self.updated_at) / self.error_half_life)
+
+    def score(self, default_latency: float, error_penalty: float, now: float) -> float:
+        """Lower is better: expected latency inflated by the recent error rate."""
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return latency * (1 + error_penalty * self.current_error_rate(now))
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.state,
+            "ewma_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "error_rate": round(self.current_error_rate(time.monotonic()), 3),
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+class ProviderRouter:
+    """Ranks providers per call by live health and tracks outcomes. Thread-safe."""
+
+    def __init__(self):
+        self.alpha = float(os.getenv("AI_ROUTER_EWMA_ALPHA", "0.3"))
+        self.failure_threshold = int(os.getenv("AI_ROUTER_FAILURE_THRESHOLD", "3"))
+        self.reset_timeout = float(os.getenv("AI_ROUTER_RESET_TIMEOUT", "30"))
+        self.default_latency = float(os.getenv("AI_ROUTER_DEFAULT_LATENCY", "5"))
+        self.error_penalty = float(os.getenv("AI_ROUTER_ERROR_PENALTY", "4"))
+        self.error_half_life = float(os.getenv("AI_ROUTER_ERROR_HALF_LIFE", "120"))
+        self._health: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> ProviderHealth:
+        health = self._health.get(name)
+        if health is None:
+            health = self._health[name] = ProviderHealth(
+                name, self.alpha, self.failure_threshold, self.reset_timeout, self.error_half_life)
+        return health
+
+    def rank(self, providers: List[AIProvider]) -> List[AIProvider]:
+        """
+        Providers whose breaker allows a request, healthiest first (config order breaks ties).
+        A provider due for its half-open probe goes first so a recovered provider gets traffic again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            scored = []
+            for index, provider in enumerate(providers):
+                health = self._get(provider.name)
+                if health.can_attempt(now):
+                    probe = 0 if health.state != ProviderHealth.CLOSED else 1
+                    scored.append((probe, health.score(self.default_latency, self.error_penalty, now), index, provider))
+        scored.sort(key=lambda item: item[:3])
+        return [item[3] for item in scored]
+
+    def acquire(self, name: str) -> bool:
+        with self._lock:
+            return self._get(name).acquire(time.monotonic())
+
+    def record(self, name: str, ok: bool, latency: float):
+        with self._lock:
+            self._get(name).record(ok, latency, time.monotonic())
+
+    def release(self, name: str):
+        """Give back a claimed half-open probe without recording an outcome."""
+        with self._lock:
+            self._get(name).probe_started_at = None
+
+    def latency_percentile(self, name: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            return self._get(name).latency_percentile(percentile)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {name: health.snapshot() for name, health in self._health.items()}
+
+
+class HedgeBudget:
+    """
+    Caps hedged requests to a fraction of routed calls.
+
+    Every call deposits ``ratio`` tokens (up to ``burst``) and every hedge
+    spends one, so over time hedges never exceed ``ratio`` of the traffic
+    and quota usage stays bounded.
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.hedges = 0
+        self.denied = 0
+        self.secondary_wins = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.hedges += 1
+                return True
+            self.denied += 1
+            return False
+
+    def record_secondary_win(self):
+        with self._lock:
+            self.secondary_wins += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "ratio": self.ratio,
+                "tokens": round(self.tokens, 2),
+                "hedges": self.hedges,
+                "denied": self.denied,
+                "secondary_wins": self.secondary_wins,
+            }
 
 
 # =============================================================================
 # PROVIDER FACTORY
 # =============================================================================
 
+# Max cached cards kept per (topic, subject) for rotation
+FLASHCARD_POOL_SIZE = int(os.getenv("AI_FLASHCARD_POOL_SIZE", "30"))
+
+# Plans longer than this are generated as an outline plus parallel day windows
+PLAN_CHUNK_THRESHOLD = int(os.getenv("AI_PLAN_CHUNK_THRESHOLD", "21"))
+PLAN_CHUNK_DAYS = max(1, int(os.getenv("AI_PLAN_CHUNK_DAYS", "7")))
+PLAN_CHUNK_WORKERS = max(1, int(os.getenv("AI_PLAN_CHUNK_WORKERS", "8")))
+
+
 class AIStudyService:
-    """Multi-provider AI Service - Automatically selects best available provider."""
+    """
+    Multi-provider AI Service - Routes each call to the healthiest available provider.
+
+    Providers are tried in order of live health (EWMA latency and error rate),
+    skipping any whose circuit breaker is open, and a failed call falls through
+    to the next candidate. A provider passed explicitly (per-request selection)
+    is used as-is, but its outcome still feeds the routing stats.
+    """
+
+    # Candidate list is re-read from the provider pool this often (seconds)
+    CANDIDATE_REFRESH_INTERVAL = 60
     
     def __init__(self):
         provider_name = os.getenv("AI_PROVIDER", "gemini").lower()
@@ -519,41 +1669,791 @@ class AIStudyService:
             providers_to_try = [HuggingFaceProvider, GroqProvider, GeminiProvider, OllamaProvider]
         else:
             providers_to_try = [GroqProvider, GeminiProvider, OllamaProvider, HuggingFaceProvider]
+
+        self.provider_order = [provider_class.name for provider_class in providers_to_try]
+        self.router = ProviderRouter()
+        self.providers: List[AIProvider] = []
+        self._providers_checked_at = 0.0
+        self._refreshing = threading.Lock()
+        self._local = threading.local()
+        self._refresh_providers()
+
+        # Hedging (opt-in): re-issue a slow call to the next-best provider
+        self.hedge_enabled = os.getenv("AI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.hedge_percentile = float(os.getenv("AI_HEDGE_PERCENTILE", "0.95"))
+        self.hedge_min_delay = float(os.getenv("AI_HEDGE_MIN_DELAY", "1.0"))
+        self.hedge_budget = HedgeBudget(
+            ratio=float(os.getenv("AI_HEDGE_BUDGET", "0.1")),
+            burst=float(os.getenv("AI_HEDGE_BURST", "5")),
+        )
+        self._hedge_pool = None
+        self._hedge_pool_lock = threading.Lock()
+
+        # Quota buckets shared by all workers; a call queues this long for a token before spilling over
+        self.limiter = get_rate_limiter()
+        self.rate_limit_max_wait = float(os.getenv("AI_RATE_LIMIT_MAX_WAIT", "2"))
+
+        # Identical concurrent generations share one upstream call
+        self.flights = get_single_flight()
+
+        # Transient upstream failures are retried within the request's deadline
+        self.retry = get_retry_policy()
+
+        # Where the next flashcard pool hit starts, per cache key (per process; hits never rewrite the pool)
+        self._rotation = OrderedDict()
+        self._rotation_lock = threading.Lock()
+
+        # Plans cached for a differently worded but similar subject are reused
+        self.semantic = get_semantic_index()
         
-        self.provider = None
-        for provider_class in providers_to_try:
+        if not self.providers:
+            logger.warning("❌ No AI provider available!")
+
+    def _refresh_providers(self):
+        providers = []
+        for name in self.provider_order:
             try:
-                provider = provider_class()
-                if provider.available:
-                    self.provider = provider
-                    break
+                provider = _provider_pool.get(name)
+                if provider and provider.available:
+                    providers.append(provider)
             except Exception as e:
-                logger.debug(f"Provider {provider_class.__name__} not available: {e}")
+                logger.debug(f"Provider {name} not available: {e}")
+        self.providers = providers
+        self._providers_checked_at = time.monotonic()
+
+    def candidates(self) -> List[AIProvider]:
+        """Available providers, healthiest first."""
+        stale = time.monotonic() - self._providers_checked_at > self.CANDIDATE_REFRESH_INTERVAL
+        if stale and self._refreshing.acquire(blocking=False):
+            # Re-probing (e.g. a down Ollama server) can block, so never do it on the request path
+            def refresh():
+                try:
+                    self._refresh_providers()
+                finally:
+                    self._refreshing.release()
+            threading.Thread(target=refresh, name="ai-provider-refresh", daemon=True).start()
+        return self.router.rank(self.providers)
+
+    @property
+    def provider(self) -> Optional[AIProvider]:
+        """The provider the next routed call would try first (None if none are available)."""
+        ranked = self.candidates()
+        if ranked:
+            return ranked[0]
+        return self.providers[0] if self.providers else None
+
+    def last_provider_name(self) -> Optional[str]:
+        """Name of the provider that served this thread's last call (None for cache hits)."""
+        return getattr(self._local, "provider", None)
+
+    def routing_state(self) -> Dict:
+        return {
+            "order": [p.name for p in self.candidates()],
+            "available": [p.name for p in self.providers],
+            "providers": self.router.snapshot(),
+            "hedging": dict(self.hedge_budget.snapshot(), enabled=self.hedge_enabled),
+            "retries": self.retry.retries,
+        }
+
+    def rate_limit_state(self) -> Optional[Dict]:
+        return self.limiter.snapshot() if self.limiter else None
+
+    def single_flight_state(self) -> Optional[Dict]:
+        return self.flights.stats() if self.flights else None
+
+    def async_state(self) -> Optional[Dict]:
+        runtime = get_async_runtime()
+        return runtime.stats() if runtime else None
+
+    def semantic_cache_state(self) -> Optional[Dict]:
+        return self.semantic.stats() if self.semantic else None
+
+    @staticmethod
+    def _semantic_identity(provider: Optional[AIProvider], lazy: bool) -> str:
+        name, model = AIStudyService._cache_identity(provider)
+        return f"{name}|{model or ''}|{'lazy' if lazy else 'full'}"
+
+    def _similar_plan(self, cache, subject: str, level: str, days: int, hours_per_day: float,
+                      provider: Optional[AIProvider], lazy: bool) -> Optional[List[Dict]]:
+        """A cached plan for a similar subject, adapted to this request; None on a miss."""
+        if not (self.semantic and cache):
+            return None
+        try:
+            match = self.semantic.lookup(subject, level, days, hours_per_day,
+                                         self._semantic_identity(provider, lazy))
+            if not match:
+                return None
+            plan = cache.get(match[0], count=False)
+            if not plan:
+                self.semantic.remove(match[0])  # expired or evicted from the response cache
+                return None
+        except Exception as e:
+            logger.warning(f"⚠️ Semantic plan lookup failed: {e}")
+            return None
+        self.semantic.record_hit()
+        cache.incr("semantic_hits")
+        logger.info(f"✅ Study plan for '{subject}' reused from a similar cached plan ({match[1]:.2f})")
+        self._local.provider = None
+        return adapt_plan(plan, hours_per_day)
+
+    def _index_plan(self, key: str, subject: str, level: str, days: int, hours_per_day: float,
+                    provider: Optional[AIProvider], lazy: bool):
+        if not self.semantic:
+            return
+        try:
+            self.semantic.add(key, subject, level, days, hours_per_day, self._semantic_identity(provider, lazy))
+        except Exception as e:
+            logger.warning(f"⚠️ Could not index plan for semantic reuse: {e}")
+
+    def _coalesced(self, key: str, fn, fetch=None):
+        """Run fn once for all concurrent callers of key (see single_flight)."""
+        if not self.flights:
+            return fn()
+        leader = []
+        result = self.flights.run(key, lambda: leader.append(True) or fn(), fetch)
+        if not leader:
+            self._local.provider = None
+        return result
+
+    def _coalesced_stream(self, key: str, make_stream, fetch=None) -> Iterator[Dict]:
+        if not self.flights:
+            return make_stream()
+        self._local.provider = None
+        return self.flights.stream(key, make_stream, fetch)
+
+    def _attempts(self, provider: Optional[AIProvider], exclude=()) -> List[AIProvider]:
+        if provider:
+            return [provider]
+        if not self.providers:
+            raise Exception("No AI provider available. Configure GEMINI_API_KEY, set up Ollama, or add HUGGINGFACE_API_KEY")
+        return [p for p in self.candidates() if p.name not in exclude]
+
+    def _take_quota(self, candidate: AIProvider):
+        """Wait briefly for a rate limit token; raises RateLimited (not a provider failure) if none comes."""
+        if self.limiter:
+            self.limiter.acquire(candidate.name, candidate.model_name, cap_timeout(self.rate_limit_max_wait))
+
+    def _record_failure(self, candidate: AIProvider, error: Exception, started: float):
+        deadline = current_deadline()
+        if isinstance(error, DeadlineExceeded) or (deadline is not None and deadline.expired):
+            # The request ran out of time (or was cancelled); that says nothing about the provider
+            self.router.release(candidate.name)
+        else:
+            self.router.record(candidate.name, False, time.monotonic() - started)
+        if self.limiter and _is_rate_limit_error(error):
+            self.limiter.penalize(candidate.name, candidate.model_name, getattr(error, "retry_after", None))
+
+    def _timed_call(self, candidate: AIProvider, call):
+        """
+        Run call(candidate) and feed the outcome into the routing stats. Transient
+        failures are retried on the same provider with jittered backoff (see RetryPolicy).
+        """
+        attempt = 0
+        while True:
+            check_deadline()
+            self._take_quota(candidate)
+            started = time.monotonic()
+            try:
+                result = call(candidate)
+            except Exception as e:
+                self._record_failure(candidate, e, started)
+                delay = self.retry.backoff(attempt, e)
+                if delay is None:
+                    logger.warning(f"⚠️ {candidate.name} failed: {str(e)[:150]}")
+                    raise
+                attempt += 1
+                logger.warning(f"⚠️ {candidate.name} failed ({str(e)[:100]}); retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
                 continue
-        
-        if not self.provider:
-            logger.warning("❌ No AI provider available!")
+            self.router.record(candidate.name, True, time.monotonic() - started)
+            return result
+
+    def _call(self, provider: Optional[AIProvider], call, exclude=()):
+        """Run call(provider) on the given provider, or on routed candidates until one succeeds."""
+        self._local.provider = None
+        last_error = None
+        for candidate in self._attempts(provider, exclude):
+            if not provider and not self.router.acquire(candidate.name):
+                continue
+            try:
+                result = self._timed_call(candidate, call)
+            except RateLimited as e:
+                # Out of quota: spill over to the next provider without counting it as a failure
+                self.router.release(candidate.name)
+                last_error = e
+                continue
+            except DeadlineExceeded:
+                self.router.release(candidate.name)
+                raise
+            except Exception as e:
+                last_error = e
+                continue
+            self._local.provider = candidate.name
+            return result
+        raise last_error or Exception("All AI providers are temporarily unavailable")
+
+    async def _acall(self, provider: Optional[AIProvider], acall, exclude=()) -> Tuple[object, str]:
+        """
+        _call for coroutines on the ai_async loop: awaits acall(candidate) with the same
+        routing, quota and failover, and returns (result, provider name) since the
+        loop thread is shared by every task.
+        """
+        last_error = None
+        for candidate in self._attempts(provider, exclude):
+            if not provider and not self.router.acquire(candidate.name):
+                continue
+            try:
+                result = await self._atimed_call(candidate, acall)
+            except RateLimited as e:
+                self.router.release(candidate.name)
+                last_error = e
+                continue
+            except DeadlineExceeded:
+                self.router.release(candidate.name)
+                raise
+            except Exception as e:
+                last_error = e
+                continue
+            return result, candidate.name
+        raise last_error or Exception("All AI providers are temporarily unavailable")
+
+    async def _atimed_call(self, candidate: AIProvider, acall):
+        """Async _timed_call: same retries, with the backoff awaited instead of slept."""
+        attempt = 0
+        while True:
+            check_deadline()
+            if self.limiter:
+                await asyncio.to_thread(self._take_quota, candidate)
+            started = time.monotonic()
+            try:
+                result = await acall(candidate)
+            except Exception as e:
+                self._record_failure(candidate, e, started)
+                delay = self.retry.backoff(attempt, e)
+                if delay is None:
+                    logger.warning(f"⚠️ {candidate.name} failed: {str(e)[:150]}")
+                    raise
+                attempt += 1
+                logger.warning(f"⚠️ {candidate.name} failed ({str(e)[:100]}); retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.router.record(candidate.name, True, time.monotonic() - started)
+            return result
+
+    def _fan_out(self, runtime, fn, acall_fn, items, workers: int, thread_prefix: str):
+        """
+        Start fn(item) for every item and return (futures, pool). With the async
+        runtime, acall_fn(item) coroutines run on the event loop (at most ``workers``
+        at a time) instead of occupying a thread each. Every future's result is
+        (value, provider name).
+        """
+        if runtime:
+            limit = asyncio.Semaphore(workers)
+
+            async def bounded(item):
+                async with limit:
+                    return await acall_fn(item)
+
+            return [runtime.submit(bounded(item)) for item in items], None
+        pool = ThreadPoolExecutor(max_workers=min(workers, len(items)), thread_name_prefix=thread_prefix)
+        # Worker threads don't inherit context variables; pass the request's deadline along
+        return [pool.submit(run_in_context(fn, item)) for item in items], pool
+
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        if self._hedge_pool is None:
+            with self._hedge_pool_lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(
+                        max_workers=int(os.getenv("AI_HEDGE_WORKERS", "8")), thread_name_prefix="ai-hedge")
+        return self._hedge_pool
+
+    def _call_hedged(self, call):
+        """
+        Routed call with hedging: if the best provider hasn't answered within its
+        observed latency percentile, the same call is sent to the next provider and
+        the first valid (non-empty) result wins. The slower call is cancelled if it
+        hasn't started, otherwise its result is ignored. Hedges are capped by
+        HedgeBudget so they can't multiply quota usage.
+        """
+        self._local.provider = None
+        self.hedge_budget.deposit()
+        ranked = self._attempts(None)
+        if len(ranked) < 2 or not self.router.acquire(ranked[0].name):
+            return self._call(None, call)
+        primary, secondary = ranked[0], ranked[1]
+
+        observed = self.router.latency_percentile(primary.name, self.hedge_percentile)
+        delay = max(self.hedge_min_delay, observed if observed is not None else self.router.default_latency)
+        pool = self._get_hedge_pool()
+        futures = {pool.submit(run_in_context(self._timed_call, primary, call)): primary}
+        done, _ = wait(futures, timeout=delay)
+        if not done and self.hedge_budget.try_spend() and self.router.acquire(secondary.name):
+            logger.info(f"Hedging slow {primary.name} call with {secondary.name} after {delay:.1f}s")
+            futures[pool.submit(run_in_context(self._timed_call, secondary, call))] = secondary
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    if isinstance(future.exception(), RateLimited):
+                        self.router.release(futures[future].name)
+                    continue
+                result = future.result()
+                if result:
+                    for loser in pending:
+                        loser.cancel()
+                    winner = futures[future]
+                    if winner is not primary:
+                        self.hedge_budget.record_secondary_win()
+                    self._local.provider = winner.name
+                    return result
+
+        # Every hedged attempt failed: continue with ordinary failover over the rest
+        return self._call(None, call, exclude={p.name for p in futures.values()})
+
+    def _call_stream(self, provider: Optional[AIProvider], make_stream) -> Iterator[Dict]:
+        """Streaming _call: fails over to the next candidate only if nothing was yielded yet."""
+        self._local.provider = None
+        last_error = None
+        for candidate in self._attempts(provider):
+            if not provider and not self.router.acquire(candidate.name):
+                continue
+            try:
+                check_deadline()
+                self._take_quota(candidate)
+            except RateLimited as e:
+                self.router.release(candidate.name)
+                last_error = e
+                continue
+            except DeadlineExceeded:
+                self.router.release(candidate.name)
+                raise
+            started = time.monotonic()
+            yielded = False
+            try:
+                for item in make_stream(candidate):
+                    yielded = True
+                    yield item
+            except Exception as e:
+                self._record_failure(candidate, e, started)
+                logger.warning(f"⚠️ {candidate.name} stream failed: {str(e)[:150]}")
+                if yielded or isinstance(e, DeadlineExceeded):
+                    raise
+                last_error = e
+                continue
+            self.router.record(candidate.name, True, time.monotonic() - started)
+            self._local.provider = candidate.name
+            return
+        raise last_error or Exception("All AI providers are temporarily unavailable")
+
+    @staticmethod
+    def _cache_identity(provider: Optional[AIProvider]) -> Tuple[str, Optional[str]]:
+        # Routed calls can land on any provider, so they share one "auto" cache identity
+        return (provider.name, provider.model_name) if provider else ("auto", None)
+
+    @staticmethod
+    def _flashcard_provider(provider: Optional[AIProvider]) -> Optional[AIProvider]:
+        # A plans-only provider (e.g. a saved "local" preference) routes flashcards instead
+        return provider if provider is None or provider.supports_flashcards else None
+
+    def local_study_plan(self, subject: str, level: str, days: int, hours_per_day: float,
+                         details: bool = True) -> List[Dict]:
+        """Catalog-based plan from the local engine; the fallback when every AI provider fails."""
+        self._local.provider = LocalProvider.name
+        return local_planner.build_plan(subject, level, days, hours_per_day, details)
     
-    def generate_flashcards(self, topic: str, num_cards: int = 5) -> List[Dict]:
-        if not self.provider:
-            raise Exception("No AI provider available. Configure GEMINI_API_KEY, set up Ollama, or add HUGGINGFACE_API_KEY")
-        
+    def generate_flashcards(self, topic: str, num_cards: int = 5, subject: str = None,
+                            provider: AIProvider = None, fresh: bool = False,
+                            hedge: bool = None) -> List[Dict]:
+        """
+        Generate flashcards for a topic, optionally in the context of a subject.
+
+        Generated cards are pooled in a cache shared by all users, keyed on the
+        normalized topic and subject. While the pool holds enough cards, requests
+        are served by rotating through it; the provider is only called on a miss
+        or when ``fresh`` is set, and new cards are added to the pool.
+
+        Routed calls are hedged across providers when ``hedge`` is set
+        (default: AI_HEDGE_ENABLED).
+        """
+        provider = self._flashcard_provider(provider)
+        cache, key, entry, cached = self._cached_flashcards(topic, num_cards, subject, fresh)
+        if cached:
+            self._local.provider = None
+            return cached
+
+        combined_topic = self._flashcard_topic(topic, subject)
+        call = lambda p: p.generate_flashcards(combined_topic, num_cards)
+        hedge = self.hedge_enabled if hedge is None else hedge
+
+        def generate():
+            cards = self._call_hedged(call) if hedge and not provider else self._call(provider, call)
+            self._pool_flashcards(cache, key, entry, cards)
+            return cards
+
         try:
-            return self.provider.generate_flashcards(topic, num_cards)
+            if fresh:
+                return generate()
+            return self._coalesced(f"flashcards:{key}:{num_cards}", generate,
+                                   self._flashcard_fetch(topic, num_cards, subject))
         except Exception as e:
             logger.error(f"Flashcard generation failed: {str(e)}")
             raise
+
+    def stream_flashcards(self, topic: str, num_cards: int = 5, subject: str = None,
+                          provider: AIProvider = None, fresh: bool = False) -> Iterator[Dict]:
+        """Streaming variant of generate_flashcards: yields each card as soon as it is parsed."""
+        provider = self._flashcard_provider(provider)
+        cache, key, entry, cached = self._cached_flashcards(topic, num_cards, subject, fresh)
+        if cached:
+            self._local.provider = None
+            yield from cached
+            return
+
+        combined_topic = self._flashcard_topic(topic, subject)
+
+        def generate():
+            cards = []
+            for card in self._call_stream(provider, lambda p: p.stream_flashcards(combined_topic, num_cards)):
+                cards.append(card)
+                yield card
+            self._pool_flashcards(cache, key, entry, cards)
+
+        if fresh:
+            yield from generate()
+        else:
+            yield from self._coalesced_stream(f"flashcards:{key}:{num_cards}", generate,
+                                              self._flashcard_fetch(topic, num_cards, subject))
+
+    @staticmethod
+    def _flashcard_topic(topic: str, subject: Optional[str]) -> str:
+        return f"{topic} (in the context of studying {subject})" if subject else topic
+
+    def _cached_flashcards(self, topic: str, num_cards: int, subject: Optional[str], fresh: bool,
+                           count: bool = True):
+        """Return (cache, key, entry, cards); cards is set when the request can be served from the pool."""
+        cache = get_response_cache("flashcards")
+        key = flashcard_cache_key(topic, subject)
+        entry = cache.get(key, count=count) if cache else None
+
+        if entry and not fresh and len(entry["cards"]) >= num_cards:
+            cards = entry["cards"]
+            cursor = self._next_rotation(key, entry, num_cards) if count else entry["cursor"]
+            picked = [cards[(cursor + i) % len(cards)] for i in range(num_cards)]
+            logger.info(f"✅ {len(picked)} flashcards served from cache for '{topic}'")
+            return cache, key, entry, picked
+        return cache, key, entry, None
+
+    def _next_rotation(self, key: str, entry: Dict, step: int) -> int:
+        """Rotation offset for this hit; restarts at the entry's cursor whenever the pool is refilled."""
+        size = len(entry["cards"])
+        with self._rotation_lock:
+            written, offset = self._rotation.pop(key, (None, 0))
+            if written != entry["expires_at"]:
+                offset = entry["cursor"]
+            self._rotation[key] = (entry["expires_at"], (offset + step) % size)
+            while len(self._rotation) > 1024:
+                self._rotation.popitem(last=False)
+        return offset % size
+
+    def generate_plan_flashcards(self, topics: List[str], num_cards: int = 3, subject: str = None,
+                                 provider: AIProvider = None, progress=None) -> Tuple[Dict[str, List[Dict]], List[str]]:
+        """
+        Flashcards for every topic of a plan. Topics already in the shared card pool
+        are served from it; the rest are packed AI_BATCH_TOPICS_PER_PROMPT to a prompt
+        and up to AI_BATCH_WORKERS prompts run in parallel (as tasks on the async
+        runtime when available, else on threads).
+
+        Returns ({topic: cards}, failed_topics). ``progress(done, total)`` is called
+        from the calling thread after each topic/batch.
+        """
+        provider = self._flashcard_provider(provider)
+        per_prompt = max(1, int(os.getenv("AI_BATCH_TOPICS_PER_PROMPT", "4")))
+        workers = max(1, int(os.getenv("AI_BATCH_WORKERS", "4")))
+
+        results: Dict[str, List[Dict]] = {}
+        pending = []
+        for topic in topics:
+            cache, key, entry, cached = self._cached_flashcards(topic, num_cards, subject, False)
+            if cached:
+                results[topic] = cached
+            else:
+                pending.append((topic, cache, key, entry))
+
+        batches = [pending[i:i + per_prompt] for i in range(0, len(pending), per_prompt)]
+        total = len(results) + len(batches)
+        done = len(results)
+        if progress and total:
+            progress(done, total)
+
+        def run(batch):
+            names = [topic for topic, _, _, _ in batch]
+            cards = self._call(provider, lambda p: p.generate_flashcard_batch(names, num_cards, subject))
+            return cards, self.last_provider_name()
+
+        async def arun(batch):
+            names = [topic for topic, _, _, _ in batch]
+            return await self._acall(provider, lambda p: p.agenerate_flashcard_batch(names, num_cards, subject))
+
+        failed = []
+        if batches:
+            started, pool = self._fan_out(get_async_runtime(), run, arun, batches, workers, "ai-batch")
+            futures = dict(zip(started, batches))
+            try:
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        cards, _ = future.result()
+                        by_topic = self._split_batch_cards([topic for topic, _, _, _ in batch], cards, num_cards)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Flashcard batch failed for {len(batch)} topic(s): {str(e)[:150]}")
+                        by_topic = {}
+                    for topic, cache, key, entry in batch:
+                        cards = by_topic.get(topic)
+                        if cards:
+                            results[topic] = cards
+                            self._pool_flashcards(cache, key, entry, cards)
+                        else:
+                            failed.append(topic)
+                    done += 1
+                    if progress:
+                        progress(done, total)
+            finally:
+                for future in futures:
+                    future.cancel()
+                if pool:
+                    pool.shutdown(wait=False)
+
+        logger.info(f"✅ Plan flashcards: {len(results)} topic(s) covered, {len(failed)} failed, {len(batches)} prompt(s)")
+        return results, failed
+
+    @staticmethod
+    def _split_batch_cards(topics: List[str], cards: List[Dict], num_cards: int) -> Dict[str, List[Dict]]:
+        """Group batch output by its "topic" number (or name), keeping at most num_cards per topic."""
+        by_name = {normalize_text(topic): topic for topic in topics}
+        grouped: Dict[str, List[Dict]] = {}
+        for card in cards:
+            ref = card.get("topic")
+            if isinstance(ref, str) and ref.strip().isdigit():
+                ref = int(ref)
+            if isinstance(ref, int) and 1 <= ref <= len(topics):
+                topic = topics[ref - 1]
+            elif len(topics) == 1:
+                topic = topics[0]
+            else:
+                topic = by_name.get(normalize_text(ref))
+            if topic is None or not card.get("question") or not card.get("answer"):
+                continue
+            bucket = grouped.setdefault(topic, [])
+            if len(bucket) < num_cards:
+                bucket.append({"question": card["question"], "answer": card["answer"]})
+        return grouped
+
+    def _flashcard_fetch(self, topic: str, num_cards: int, subject: Optional[str]):
+        """Poll function for coalesced waiters in other workers: cards from the pool once it is filled."""
+        if not get_response_cache("flashcards"):
+            return None
+        return lambda: self._cached_flashcards(topic, num_cards, subject, False, count=False)[3]
+
+    def _pool_flashcards(self, cache, key: str, entry: Optional[Dict], cards: List[Dict]):
+        if not cache or not cards:
+            return
+        # Newest cards first; keep older ones so rotation has variety
+        seen = set()
+        pooled = []
+        for card in cards + (entry["cards"] if entry else []):
+            question = normalize_text(card.get("question")) if isinstance(card, dict) else ""
+            if question and question not in seen:
+                seen.add(question)
+                pooled.append(card)
+        pooled = pooled[:FLASHCARD_POOL_SIZE]
+        if pooled:
+            cache.set(key, {
+                "cards": pooled,
+                # Next cache hit starts after the cards this caller just received
+                "cursor": min(len(cards), len(pooled)) % len(pooled),
+                "expires_at": time.time() + cache.ttl,
+            })
     
-    def generate_study_plan(self, subject: str, level: str, days: int, hours_per_day: float) -> List[Dict]:
-        if not self.provider:
-            raise Exception("No AI provider available")
-        
+    def generate_study_plan(self, subject: str, level: str, days: int, hours_per_day: float,
+                            provider: AIProvider = None, lazy: bool = False) -> List[Dict]:
+        """
+        Generate a plan with the given provider, or with the healthiest routed provider.
+        Identical requests for the same provider/model are served from the response cache.
+        With ``lazy`` only day/topic/hours are generated; see generate_day_details.
+        """
+        if provider and not provider.cacheable:
+            if lazy:
+                return self._call(provider, lambda p: p.generate_plan_topics(subject, level, days, hours_per_day))
+            return self._call(provider, lambda p: p.generate_study_plan(subject, level, days, hours_per_day))
+
+        cache = get_response_cache("plan")
+        key = plan_cache_key(subject, level, days, hours_per_day, *self._cache_identity(provider), lazy=lazy)
+        if cache:
+            cached = cache.get(key)
+            if cached:
+                logger.info(f"✅ Study plan served from cache ({self._cache_identity(provider)[0]})")
+                self._local.provider = None
+                return cached
+        similar = self._similar_plan(cache, subject, level, days, hours_per_day, provider, lazy)
+        if similar:
+            return similar
+
+        def generate():
+            if days > PLAN_CHUNK_THRESHOLD:
+                plan = list(self._chunked_plan(subject, level, days, hours_per_day, provider, details=not lazy))
+            elif lazy:
+                plan = self._call(provider, lambda p: p.generate_plan_topics(subject, level, days, hours_per_day))
+            else:
+                plan = self._call(provider, lambda p: p.generate_study_plan(subject, level, days, hours_per_day))
+            if cache and plan:
+                cache.set(key, plan)
+                self._index_plan(key, subject, level, days, hours_per_day, provider, lazy)
+            return plan
+
         try:
-            return self.provider.generate_study_plan(subject, level, days, hours_per_day)
+            return self._coalesced(f"plan:{key}", generate,
+                                   (lambda: cache.get(key, count=False)) if cache else None)
         except Exception as e:
             logger.error(f"Study plan generation failed: {str(e)}")
             raise
 
+    def stream_study_plan(self, subject: str, level: str, days: int, hours_per_day: float,
+                          provider: AIProvider = None, lazy: bool = False) -> Iterator[Dict]:
+        """Streaming variant of generate_study_plan: yields each day as soon as it is parsed."""
+        if provider and not provider.cacheable:
+            yield from self._call_stream(
+                provider, lambda p: p.stream_study_plan(subject, level, days, hours_per_day, details=not lazy))
+            return
+
+        cache = get_response_cache("plan")
+        key = plan_cache_key(subject, level, days, hours_per_day, *self._cache_identity(provider), lazy=lazy)
+        cached = cache.get(key) if cache else None
+        if cached:
+            logger.info(f"✅ Study plan served from cache ({self._cache_identity(provider)[0]})")
+            self._local.provider = None
+            yield from cached
+            return
+        similar = self._similar_plan(cache, subject, level, days, hours_per_day, provider, lazy)
+        if similar:
+            yield from similar
+            return
+
+        def generate():
+            plan = []
+            if days > PLAN_CHUNK_THRESHOLD:
+                days_iter = self._chunked_plan(subject, level, days, hours_per_day, provider, details=not lazy)
+            else:
+                days_iter = self._call_stream(
+                    provider, lambda p: p.stream_study_plan(subject, level, days, hours_per_day, details=not lazy))
+            for day in days_iter:
+                plan.append(day)
+                yield day
+            if cache and plan:
+                cache.set(key, plan)
+                self._index_plan(key, subject, level, days, hours_per_day, provider, lazy)
+
+        yield from self._coalesced_stream(f"plan:{key}", generate,
+                                          (lambda: cache.get(key, count=False)) if cache else None)
+
+    def generate_day_details(self, subject: str, level: str, days: int, day: int, topic: str,
+                             hours: float, provider: AIProvider = None) -> str:
+        """
+        Details for one day of a lazy plan. Cached and coalesced like whole plans,
+        so every user of the same (shared) lazy plan gets them from one LLM call.
+        """
+        if provider and not provider.cacheable:
+            return self._call(provider, lambda p: p.generate_day_details(subject, level, days, day, topic, hours))
+
+        cache = get_response_cache("plan_day")
+        key = day_details_cache_key(subject, level, days, day, topic, *self._cache_identity(provider))
+        cached = cache.get(key) if cache else None
+        if cached:
+            self._local.provider = None
+            return cached
+
+        def generate():
+            details = self._call(provider, lambda p: p.generate_day_details(subject, level, days, day, topic, hours))
+            if cache and details:
+                cache.set(key, details)
+            return details
+
+        return self._coalesced(f"plan_day:{key}", generate,
+                               (lambda: cache.get(key, count=False)) if cache else None)
+
+    def _chunked_plan(self, subject: str, level: str, days: int, hours_per_day: float,
+                      provider: AIProvider = None, details: bool = True) -> Iterator[Dict]:
+        """
+        Long plans in windows of PLAN_CHUNK_DAYS: a compact outline first, then every
+        window generated in parallel (see _fan_out) and yielded in day order, renumbered 1..days.
+        Wall-clock time is roughly outline + one window instead of the whole plan.
+        A window that fails (or comes back short) is filled from the local planner so the
+        plan stays complete; only when every window fails does the whole call fail.
+        """
+        windows = [(start, min(days, start + PLAN_CHUNK_DAYS - 1))
+                   for start in range(1, days + 1, PLAN_CHUNK_DAYS)]
+        try:
+            outline = self._call(provider, lambda p: p.generate_plan_outline(
+                subject, level, days, len(windows), PLAN_CHUNK_DAYS))
+        except Exception as e:
+            logger.warning(f"⚠️ Plan outline failed, generating windows without it: {str(e)[:150]}")
+            outline = []
+        focus = [str(part.get("focus") or "").strip() or None for part in outline if isinstance(part, dict)]
+        focus = (focus + [None] * len(windows))[:len(windows)]
+
+        def window_args(index):
+            start, end = windows[index]
+            return (subject, level, days, hours_per_day, start, end, focus[index],
+                    focus[index - 1] if index > 0 else None,
+                    focus[index + 1] if index + 1 < len(windows) else None,
+                    details)
+
+        def run(index):
+            days_out = self._call(provider, lambda p: p.generate_plan_window(*window_args(index)))
+            return days_out, self.last_provider_name()
+
+        async def arun(index):
+            return await self._acall(provider, lambda p: p.agenerate_plan_window(*window_args(index)))
+
+        futures, pool = [], None
+        try:
+            futures, pool = self._fan_out(get_async_runtime(), run, arun, range(len(windows)),
+                                          PLAN_CHUNK_WORKERS, "ai-plan")
+            failed = 0
+            used_provider = None
+            local_days = None
+            for index, future in enumerate(futures):
+                start, end = windows[index]
+                try:
+                    window_days, used_provider = future.result()
+                    window_days = [d for d in window_days if isinstance(d, dict)]
+                except Exception as e:
+                    failed += 1
+                    if failed == len(windows):
+                        raise
+                    logger.warning(f"⚠️ Plan days {start}-{end} failed, using the local planner: {str(e)[:150]}")
+                    window_days = []
+                # Models number windows inconsistently; stitch by position and renumber
+                for offset, day in enumerate(range(start, end + 1)):
+                    if offset < len(window_days):
+                        item = dict(window_days[offset], day=day)
+                    else:
+                        if local_days is None:
+                            local_days = local_planner.build_plan(subject, level, days, hours_per_day, details)
+                        item = dict(local_days[day - 1], day=day)
+                    yield item
+                if index == 0:
+                    self._local.provider = used_provider
+            if failed:
+                logger.warning(f"⚠️ {failed}/{len(windows)} plan window(s) filled from the local planner")
+            logger.info(f"✅ Generated {days}-day plan in {len(windows)} window(s)")
+        finally:
+            for future in futures:
+                future.cancel()
+            if pool:
+                pool.shutdown(wait=False)
+
 
 # =============================================================================
 # SINGLETON INSTANCE
@@ -568,31 +2468,43 @@ def get_ai_service() -> AIStudyService:
     return _ai_service_instance
 
 
+def warm_up_ollama():
+    """
+    With OLLAMA_WARMUP=true, load the Ollama model in the background at worker
+    boot so the first request doesn't pay for it.
+    """
+    if os.getenv("OLLAMA_WARMUP", "false").lower() not in ("1", "true", "yes"):
+        return
+
+    def run():
+        try:
+            provider = _provider_pool.get("ollama")
+            if provider and provider.available:
+                provider.warm_up()
+        except Exception as e:
+            logger.warning(f"⚠️ Ollama warm-up failed: {e}")
+
+    threading.Thread(target=run, name="ollama-warmup", daemon=True).start()
+
+
 # =============================================================================
 # PER-REQUEST PROVIDER FACTORY
 # =============================================================================
 
-_PROVIDER_MAP = {
-    "groq": GroqProvider,
-    "gemini": GeminiProvider,
-    "ollama": OllamaProvider,
-    "huggingface": HuggingFaceProvider,
-}
-
 def get_provider_by_name(provider_name: str, model: str = None) -> Optional["AIProvider"]:
     """
-    Instantiate a specific provider by name with an optional model override.
+    Get a specific provider by name with an optional model override.
     Returns None if the provider is unavailable or misconfigured.
-    Used for per-request provider selection from the frontend.
+    Used for per-request provider selection from the frontend; instances
+    come from the shared provider pool, so repeated calls are cheap.
     """
-    cls = _PROVIDER_MAP.get(provider_name.lower())
-    if not cls:
+    if provider_name.lower() not in _PROVIDER_MAP:
         logger.warning(f"Unknown provider requested: {provider_name}")
         return None
     try:
-        instance = cls(model_override=model) if model else cls()
+        instance = _provider_pool.get(provider_name, model)
         if instance.available:
-            logger.info(f"✅ Per-request provider: {provider_name} / {model or 'default'}")
+            logger.debug(f"Per-request provider: {provider_name} / {model or 'default'}")
             return instance
         logger.warning(f"⚠️ Provider {provider_name} not available (check API key / config)")
         return None
@@ -1,16 +1,30 @@
 import os
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import jwt
 from functools import wraps
 from dotenv import load_dotenv
-from sqlalchemy import func, text
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 
-from models import db, User, StudyPlan, UserProgress, StudyNotes, StudySession, Flashcard, PomodoroSession, StudyStreak
+from models import db, User, StudyPlan, UserProgress, StudyNotes, StudySession, Flashcard, PomodoroSession, StudyStreak, GenerationJob
 from config import get_config
-from ai_service import get_ai_service, get_provider_by_name
+from ai_service import (get_ai_service, get_provider_by_name, get_provider_pool, get_parse_stats, get_token_budget,
+                        warm_up_ollama)
+from ai_cache import get_response_cache
+from jobs import JobRunner, JobQueueFull
+from rate_limit import RateLimited
+from auth_cache import Principal, get_principal_cache, invalidate_principal
+from auth_tokens import ACCESS, ACCESS_TTL, REFRESH, access_token, get_revocation_set, issue_tokens, revoke_user_tokens
+from login_throttle import LoginThrottled, get_login_throttle
+from passwords import HashPoolBusy, get_password_hasher
+from user_import import UserImportError, build_report, check_rows, detect_format, drop_taken, find_taken, \
+    hash_passwords, insert_users, parse_rows
+from migrations import pending_migrations, run_migrations
+from deadlines import DeadlineExceeded, current_deadline, request_deadline, reset_deadline, set_deadline
 import json
 
 load_dotenv(override=True)
@@ -62,14 +76,67 @@ def create_app():
         else:
             response.headers['Access-Control-Allow-Origin'] = '*'
         
-        response.headers['Access-Control-Allow-Headers'] = 'Authorization, Content-Type, Accept, Origin'
+        response.headers['Access-Control-Allow-Headers'] = 'Authorization, Content-Type, Accept, Origin, X-Request-Timeout'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         return response
 
+    # Per-request time budget for AI calls (X-Request-Timeout header, else AI_REQUEST_TIMEOUT)
+    @app.before_request
+    def start_request_deadline():
+        if request.path.startswith('/api/'):
+            g.deadline_token = set_deadline(request_deadline(request.headers.get('X-Request-Timeout')))
+
+    @app.teardown_request
+    def clear_request_deadline(error=None):
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            try:
+                reset_deadline(token)
+            except ValueError:
+                # Streamed responses tear down from a different context
+                set_deadline(None)
+
     # ===============================
     # AUTH DECORATORS
     # ===============================
+    def load_principal(user_id):
+        """Only the columns the decorators and provider routing need, not the whole User row."""
+        row = db.session.query(User.id, User.is_active, User.is_admin, User.ai_provider, User.ai_model) \
+            .filter(User.id == user_id).first()
+        return Principal(row.id, bool(row.is_active), bool(row.is_admin), row.ai_provider, row.ai_model) \
+            if row else None
+
+    def get_principal(user_id):
+        principals = get_principal_cache()
+        return principals.get(user_id, load_principal) if principals else load_principal(user_id)
+
+    def decode_token(token, expected_type=ACCESS):
+        data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+        # Tokens from before claims were added have no type and count as access tokens
+        if data.get("type", ACCESS) != expected_type:
+            raise jwt.InvalidTokenError(f"Expected a {expected_type} token")
+        return data
+
+    def token_revoked(data):
+        revocations = get_revocation_set()
+        return data.get("type") == ACCESS and revocations is not None \
+            and revocations.is_revoked(data["user_id"], data.get("iat"))
+
+    def principal_for(data):
+        """The token's own claims when they can be trusted (not revoked), else a lookup."""
+        if data.get("type") == ACCESS and get_revocation_set():
+            return Principal(data["user_id"], bool(data.get("active")), data.get("role") == "admin")
+        return get_principal(data["user_id"])
+
+    def revoke_user(user_id):
+        """Changed role/status or deleted: drop cached principal and outstanding access tokens."""
+        invalidate_principal(user_id)
+        try:
+            revoke_user_tokens(user_id)
+        except Exception as e:
+            logger.error(f"❌ Could not revoke tokens for user {user_id}: {e}")
+
     def token_required(f):
         @wraps(f)
         def decorated(*args, **kwargs):
@@ -86,11 +153,7 @@ def create_app():
             logger.debug(f"🔍 Token to decode: {token[:50]}...")
 
             try:
-                data = jwt.decode(
-                    token,
-                    app.config["SECRET_KEY"],
-                    algorithms=["HS256"]
-                )
+                data = decode_token(token)
                 current_user_id = data["user_id"]
                 logger.debug(f"✅ Token valid for user {current_user_id}")
             except jwt.ExpiredSignatureError:
@@ -100,7 +163,10 @@ def create_app():
                 logger.error(f"❌ Invalid token: {str(e)}")
                 return jsonify({"error": "Invalid token"}), 401
 
-            current_user = User.query.get(current_user_id)
+            if token_revoked(data):
+                return jsonify({"error": "Token revoked"}), 401
+
+            current_user = principal_for(data)
             if not current_user:
                 logger.error(f"❌ User {current_user_id} not found")
                 return jsonify({"error": "User not found"}), 404
@@ -123,18 +189,17 @@ def create_app():
             token = auth_header.split(" ")[1]
 
             try:
-                data = jwt.decode(
-                    token,
-                    app.config["SECRET_KEY"],
-                    algorithms=["HS256"]
-                )
+                data = decode_token(token)
                 current_user_id = data["user_id"]
             except jwt.ExpiredSignatureError:
                 return jsonify({"error": "Token expired"}), 401
             except Exception:
                 return jsonify({"error": "Invalid token"}), 401
 
-            current_user = User.query.get(current_user_id)
+            if token_revoked(data):
+                return jsonify({"error": "Token revoked"}), 401
+
+            current_user = principal_for(data)
             if not current_user:
                 return jsonify({"error": "User not found"}), 404
             if not current_user.is_active:
@@ -160,10 +225,12 @@ def create_app():
             if not username or not email or not password:
                 return jsonify({"error": "Missing fields"}), 400
 
-            if User.query.filter_by(username=username).first():
+            # Names and emails that differ only in case count as taken (as in bulk imports)
+            taken_usernames, taken_emails = find_taken([str(username)], [str(email)])
+            if taken_usernames:
                 return jsonify({"error": "Username already exists"}), 400
 
-            if User.query.filter_by(email=email).first():
+            if taken_emails:
                 return jsonify({"error": "Email already exists"}), 400
 
             admin_emails = {
@@ -184,21 +251,9 @@ def create_app():
             db.session.add(user)
             db.session.commit()
 
-            # Create expiration as Unix timestamp (required by PyJWT)
-            exp_timestamp = int((datetime.utcnow() + timedelta(days=7)).timestamp())
-
-            token = jwt.encode(
-                {
-                    "user_id": user.id,
-                    "exp": exp_timestamp,
-                },
-                app.config["SECRET_KEY"],
-                algorithm="HS256",
-            )
-
             return jsonify({
                 "message": "User created successfully",
-                "token": token,
+                **issue_tokens(user, app.config["SECRET_KEY"]),
                 "user": {
                     "id": user.id,
                     "username": username,
@@ -208,10 +263,21 @@ def create_app():
                 }
             }), 201
 
+        except HashPoolBusy as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 503, {"Retry-After": str(int(e.retry_after))}
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
 
+    def client_ip():
+        """Client address; behind a proxy (Render) the X-Forwarded-For hop it appended."""
+        hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+        trusted = int(os.getenv('TRUSTED_PROXY_COUNT', '1'))
+        if hops and trusted > 0:
+            return hops[-min(trusted, len(hops))]
+        return request.remote_addr
+
     @app.route("/api/login", methods=["POST"])
     def login():
         try:
@@ -221,10 +287,29 @@ def create_app():
             
             logger.info(f"🔐 Login attempt for user: {username}")
 
+            # Throttled before any password hashing happens
+            throttle = get_login_throttle()
+            if throttle:
+                throttle.check(client_ip(), username)
+
             user = User.query.filter_by(username=username).first()
             if not user or not user.check_password(password):
                 logger.error(f"❌ Invalid credentials for {username}")
+                if throttle:
+                    throttle.record_failure(client_ip(), username)
                 return jsonify({"error": "Invalid credentials"}), 401
+            if throttle:
+                throttle.record_success(client_ip(), username)
+
+            # Upgrade hashes made with older parameters while we have the plain password
+            if get_password_hasher().needs_rehash(user.password):
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                    logger.info(f"🔐 Rehashed password for user {user.id}")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"⚠️ Password rehash skipped for user {user.id}: {e}")
 
             if not user.is_active:
                 logger.error(f"❌ Account disabled for {username}")
@@ -232,24 +317,13 @@ def create_app():
             
             secret_key = app.config["SECRET_KEY"]
             logger.info(f"🔑 Using SECRET_KEY: {secret_key[:20]}... for token creation")
-            
-            # Create expiration as Unix timestamp (required by PyJWT)
-            exp_timestamp = int((datetime.utcnow() + timedelta(days=7)).timestamp())
-            
-            token = jwt.encode(
-                {
-                    "user_id": user.id,
-                    "exp": exp_timestamp,
-                },
-                secret_key,
-                algorithm="HS256"
-            )
-            
-            logger.info(f"✅ Token created for user {user.id}: {token[:30]}... (exp: {exp_timestamp})")
-            
+
+            tokens = issue_tokens(user, secret_key)
+            logger.info(f"✅ Tokens created for user {user.id} (access expires in {tokens['expires_in']}s)")
+
             return jsonify({
                 "message": "Login successful",
-                "token": token,
+                **tokens,
                 "user": {
                     "id": user.id,
                     "username": user.username,
@@ -258,10 +332,36 @@ def create_app():
                     "is_active": user.is_active
                 }
             }), 200
+        except LoginThrottled as e:
+            return jsonify({"error": str(e)}), 429, {"Retry-After": str(int(e.retry_after) + 1)}
+        except HashPoolBusy as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": str(int(e.retry_after))}
         except Exception as e:
             logger.error(f"❌ Login error: {str(e)}")
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/api/token/refresh", methods=["POST"])
+    def refresh_token():
+        """Exchange a refresh token for a new access token with the user's current role and status."""
+        data = request.json or {}
+        try:
+            claims = decode_token(data.get("refresh_token") or "", expected_type=REFRESH)
+        except jwt.ExpiredSignatureError:
+            return jsonify({"error": "Refresh token expired"}), 401
+        except Exception:
+            return jsonify({"error": "Invalid refresh token"}), 401
+
+        user = get_principal(claims["user_id"])
+        if not user:
+            return jsonify({"error": "User not found"}), 401
+        if not user.is_active:
+            return jsonify({"error": "Account disabled"}), 403
+
+        return jsonify({
+            "token": access_token(user, app.config["SECRET_KEY"]),
+            "expires_in": ACCESS_TTL,
+        }), 200
+
     # ===============================
     # HEALTH CHECK
     # ===============================
@@ -269,6 +369,31 @@ def create_app():
     def health():
         return jsonify({"status": "healthy", "message": "Backend is running"}), 200
 
+    # ===============================
+    # AI PROVIDER PREFERENCES
+    # ===============================
+    def get_preferred_provider(current_user_id):
+        """Return the pooled provider saved in the user's AI settings, or None to use the default service."""
+        # Read through the principal cache: no User query per generation request
+        principal = get_principal(current_user_id)
+        # NULL provider: no preference saved
+        if not principal or not principal.ai_provider:
+            return None
+        return get_provider_by_name(principal.ai_provider, principal.ai_model or None)
+
+    def resolve_provider(current_user_id, req_provider, req_model):
+        """
+        Pick the provider for a generation request: the one named in the request,
+        else the user's saved preference. Returns None to use the default AI service.
+        Raises if an explicitly requested provider is not available.
+        """
+        if req_provider:
+            provider = get_provider_by_name(req_provider, req_model or None)
+            if not provider:
+                raise Exception(f'Provider "{req_provider}" is not available. Check its API key in .env.')
+            return provider
+        return get_preferred_provider(current_user_id)
+
     # ===============================
     # PLAN ROUTES
     # ===============================
@@ -292,83 +417,333 @@ def create_app():
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
-    @app.route("/api/generate-plan", methods=["POST"])
-    @token_required
-    def generate_plan(current_user_id):
+    def fallback_plan_data(params):
+        """Catalog-based plan from the local engine, used when AI generation fails"""
+        return get_ai_service().local_study_plan(params["subject"], params["level"], params["days"], params["hours"])
+
+    def save_study_plan(current_user_id, params, plan_data, ai_generated=True, job_id=None):
+        """
+        Persist a generated plan and build the API response payload.
+        With job_id the payload is committed as the job's result in the same
+        transaction; if that job already saved a plan, its result is returned.
+        """
+        plan = StudyPlan(
+            user_id=current_user_id,
+            subject=params["subject"],
+            level=params["level"],
+            days=params["days"],
+            hours_per_day=params["hours"],
+            plan_data=plan_data,
+            completion_percentage=0,
+            job_id=job_id,
+        )
+
+        db.session.add(plan)
         try:
-            data = request.json or {}
+            db.session.flush()
+        except IntegrityError:
+            if job_id is None:
+                raise
+            # Another run of the same job got there first
+            db.session.rollback()
+            logger.warning(f"⚠️ Job {job_id} already saved its plan; keeping that one")
+            return db.session.get(GenerationJob, job_id).result
+
+        result = {
+            "id": plan.id,
+            "subject": params["subject"],
+            "level": params["level"],
+            "days": params["days"],
+            "plan": plan_data,
+            "total_hours": params["days"] * params["hours"],
+            "ai_generated": ai_generated,
+            "lazy": bool(params.get("lazy")),
+        }
+        if job_id is not None:
+            JobRunner.store_result(job_id, result)
+        db.session.commit()
+        return result
 
-            subject = data.get("subject", "DSA")
-            days = int(data.get("days", 7))
-            hours = float(data.get("hours", 2))
-            level = data.get("level", "Beginner")
-            req_provider = data.get("provider", "").strip().lower()
-            req_model = data.get("model", "").strip()
+    def create_study_plan(current_user_id, params, job_id=None):
+        """Generate and persist a study plan. Shared by the sync route and background jobs."""
+        subject = params["subject"]
+        days = params["days"]
+        hours = params["hours"]
 
-            # ── AI-powered plan generation ──
-            try:
-                if req_provider:
-                    provider = get_provider_by_name(req_provider, req_model or None)
-                    if not provider:
-                        raise Exception(f'Provider "{req_provider}" is not available.')
-                    plan_data = provider.generate_study_plan(
-                        subject=subject,
-                        level=level,
-                        days=days,
-                        hours_per_day=hours,
-                    )
-                else:
-                    ai = get_ai_service()
-                    if not ai.provider:
-                        raise Exception('No AI provider configured.')
-                    plan_data = ai.generate_study_plan(
-                        subject=subject,
-                        level=level,
-                        days=days,
-                        hours_per_day=hours,
-                    )
-            except Exception as ai_err:
-                # Graceful fallback: static placeholder topics
-                import logging
-                logging.getLogger(__name__).warning(f"AI plan gen failed, using fallback: {ai_err}")
-                plan_data = [
-                    {
-                        "day": i,
-                        "topics": [
-                            {"name": f"{subject} - Topic {j}", "completed": False, "hours": round(hours / 2, 1)}
-                            for j in range(1, 3)
-                        ],
-                    }
-                    for i in range(1, days + 1)
-                ]
-
-            plan = StudyPlan(
-                user_id=current_user_id,
+        # ── AI-powered plan generation ──
+        ai_generated = True
+        try:
+            provider = resolve_provider(current_user_id, params.get("provider"), params.get("model"))
+            ai = get_ai_service()
+            if not provider and not ai.provider:
+                raise Exception('No AI provider configured.')
+            plan_data = ai.generate_study_plan(
                 subject=subject,
-                level=level,
+                level=params["level"],
                 days=days,
                 hours_per_day=hours,
-                plan_data=plan_data,
-                completion_percentage=0,
+                provider=provider,
+                lazy=bool(params.get("lazy")),
             )
+        except Exception as ai_err:
+            # Graceful fallback: catalog-based plan from the local engine
+            logger.warning(f"AI plan gen failed, using local plan: {ai_err}")
+            plan_data = fallback_plan_data(params)
+            ai_generated = False
+
+        return save_study_plan(current_user_id, params, plan_data, ai_generated, job_id=job_id)
+
+    max_plan_days = int(os.getenv("PLAN_MAX_DAYS", "365"))
+
+    def parse_plan_params(data):
+        """Plan request fields; ValueError (a 400) for days or hours out of range."""
+        days = int(data.get("days", 7))
+        hours = float(data.get("hours", 2))
+        # Long plans fan out one AI call per week, so the length is capped
+        if not 1 <= days <= max_plan_days:
+            raise ValueError(f"days must be between 1 and {max_plan_days}")
+        if not 0 < hours <= 24:
+            raise ValueError("hours must be more than 0 and at most 24")
+        return {
+            "subject": data.get("subject", "DSA"),
+            "days": days,
+            "hours": hours,
+            "level": data.get("level", "Beginner"),
+            "provider": data.get("provider", "").strip().lower(),
+            "model": data.get("model", "").strip(),
+            # Lazy: topics only now, each day's details generated when first opened
+            "lazy": data.get("lazy") is True,
+        }
 
-            db.session.add(plan)
-            db.session.commit()
+    def plan_topics(plan_data):
+        """Distinct topic names of a plan, in order. Handles AI {"topic"} and fallback {"topics": [...]} days."""
+        if isinstance(plan_data, str):
+            try:
+                plan_data = json.loads(plan_data)
+            except ValueError:
+                plan_data = []
+        topics = []
+        seen = set()
+        for d in plan_data if isinstance(plan_data, list) else []:
+            if not isinstance(d, dict):
+                continue
+            if isinstance(d.get("topics"), list):
+                names = [t.get("name") if isinstance(t, dict) else t for t in d["topics"]]
+            else:
+                names = [d.get("topic")]
+            for name in names:
+                name = str(name or "").strip()[:255]
+                if name and name.lower() not in seen:
+                    seen.add(name.lower())
+                    topics.append(name)
+        return topics
+
+    def generate_plan_flashcards(job):
+        """Job handler: flashcards for every topic of a plan, inserted in one transaction."""
+        params = job.params
+        plan = StudyPlan.query.filter_by(id=params["plan_id"], user_id=job.user_id).first()
+        if not plan:
+            raise Exception("Plan not found")
+
+        topics = plan_topics(plan.plan_data)
+        if params.get("skip_existing", True):
+            existing = {
+                row[0].lower() for row in
+                db.session.query(Flashcard.topic).filter_by(plan_id=plan.id).distinct()
+            }
+            topics = [t for t in topics if t.lower() not in existing]
+        if not topics:
+            return {"plan_id": plan.id, "topics": 0, "count": 0, "by_topic": {}, "failed_topics": []}
+
+        provider = resolve_provider(job.user_id, params.get("provider"), params.get("model"))
+        ai = get_ai_service()
+        if not provider and not ai.provider:
+            raise Exception('No AI provider configured.')
+        by_topic, failed = ai.generate_plan_flashcards(
+            topics,
+            num_cards=params["num_cards"],
+            subject=plan.subject,
+            provider=provider,
+            # Leave headroom below 100 for the insert
+            progress=lambda done, total: job_runner.set_progress(job.id, done * 95 // total),
+        )
+
+        rows = [
+            {'plan_id': plan.id, 'question': c['question'].strip(), 'answer': c['answer'].strip(),
+             'topic': topic, 'created_at': datetime.utcnow()}
+            for topic, cards in by_topic.items()
+            for c in cards
+            if str(c.get('question') or '').strip() and str(c.get('answer') or '').strip()
+        ]
+        db.session.bulk_insert_mappings(Flashcard, rows)
+        db.session.commit()
+        return {
+            "plan_id": plan.id,
+            "topics": len(topics),
+            "count": len(rows),
+            "by_topic": {topic: len(cards) for topic, cards in by_topic.items()},
+            "failed_topics": failed,
+        }
 
-            return jsonify({
-                "id": plan.id,
-                "subject": subject,
-                "level": level,
-                "days": days,
-                "plan": plan_data,
-                "total_hours": days * hours,
-                "ai_generated": True,
-            }), 201
+    def import_users_job(job):
+        """Job: hash and insert the rows an admin import validated; report like import_users()."""
+        params = job.params
+        passwords = job_runner.payload(job.id)
+        if passwords is None:
+            raise Exception("The import's passwords are no longer available; upload the file again")
+        pending = [(number, dict(mapping, password=password))
+                   for (number, mapping), password in zip(params["rows"], passwords)]
+        errors = list(params["errors"])
+        hash_passwords(pending, get_password_hasher())
+        job_runner.set_progress(job.id, 50)
+
+        # Names taken since the request was validated
+        pending = drop_taken(pending, errors)
+        created = insert_users(pending, errors, progress=lambda done: job_runner.set_progress(
+            job.id, 50 + done * 49 // max(1, len(pending))))
+        logger.info(f"👥 Admin {job.user_id} imported {created} users ({len(errors)} rejected)")
+        return build_report(params["total"], pending, errors, created, False)
+
+    job_runner = JobRunner(app)
+    job_runner.register("generate_plan", lambda job: create_study_plan(job.user_id, job.params, job_id=job.id))
+    job_runner.register("generate_plan_flashcards", generate_plan_flashcards)
+    # Passwords stay in the submitting worker's memory; they are never written to the job row
+    job_runner.register("import_users", import_users_job, transient=True)
+    app.extensions["job_runner"] = job_runner
+
+    @app.route("/api/generate-plan", methods=["POST"])
+    @token_required
+    def generate_plan(current_user_id):
+        """Generate a plan. With "async": true (or ?async=1) returns 202 and a job id instead of waiting."""
+        try:
+            data = request.json or {}
+            try:
+                params = parse_plan_params(data)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+
+            run_async = data.get("async") is True or request.args.get("async", "").lower() in ("1", "true")
+            if run_async:
+                try:
+                    job = job_runner.submit(current_user_id, "generate_plan", params)
+                except JobQueueFull as e:
+                    return jsonify({"error": str(e)}), 503
+                return jsonify({
+                    "job_id": job.id,
+                    "status": job.status,
+                    "status_url": f"/api/jobs/{job.id}",
+                }), 202
+
+            return jsonify(create_study_plan(current_user_id, params)), 201
 
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/api/jobs/<job_id>", methods=["GET"])
+    @token_required
+    def get_job(current_user_id, job_id):
+        """Get status (and result, once finished) of a background generation job"""
+        try:
+            job = GenerationJob.query.filter_by(id=job_id, user_id=current_user_id).first()
+            if not job:
+                return jsonify({"error": "Job not found"}), 404
+
+            return jsonify({
+                "id": job.id,
+                "kind": job.kind,
+                "status": job.status,
+                "progress": job.progress,
+                "result": job.result,
+                "error": job.error,
+                "created_at": job.created_at.isoformat(),
+                "started_at": job.started_at.isoformat() if job.started_at else None,
+                "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            }), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    def sse_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def cancel_on_disconnect(events):
+        """
+        Run an SSE generator under the request's deadline and cancel it when the client goes away,
+        so pending AI calls and retries stop. Call from the view: by the time the server iterates
+        the response, teardown has already cleared the deadline from the context.
+        """
+        deadline = current_deadline()
+
+        def run():
+            set_deadline(deadline)
+            try:
+                for event in events:
+                    yield event
+            except GeneratorExit:
+                if deadline is not None:
+                    deadline.cancel()
+                    logger.info("🔌 Stream client disconnected; cancelling AI work")
+                events.close()
+                raise
+            finally:
+                set_deadline(None)
+
+        return run()
+
+    def plan_day_number(day):
+        try:
+            return int(day.get("day"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    @app.route("/api/generate-plan/stream", methods=["POST"])
+    @token_required
+    def generate_plan_stream(current_user_id):
+        """Generate a plan over Server-Sent Events: one "day" event per parsed day, then "done"."""
+        try:
+            params = parse_plan_params(request.json or {})
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        def events():
+            plan_data = []
+            ai_generated = True
+            try:
+                provider = resolve_provider(current_user_id, params["provider"], params["model"])
+                ai = get_ai_service()
+                if not provider and not ai.provider:
+                    raise Exception('No AI provider configured.')
+                for day in ai.stream_study_plan(
+                    subject=params["subject"],
+                    level=params["level"],
+                    days=params["days"],
+                    hours_per_day=params["hours"],
+                    provider=provider,
+                    lazy=params["lazy"],
+                ):
+                    plan_data.append(day)
+                    yield sse_event("day", day)
+            except Exception as ai_err:
+                logger.warning(f"AI plan stream failed after {len(plan_data)} day(s): {ai_err}")
+                # Same graceful fallback as the non-streaming route. A partial plan keeps its AI days
+                # (which may have arrived out of order) and only the missing day numbers are filled in.
+                ai_generated = bool(plan_data)
+                sent = {plan_day_number(day) for day in plan_data}
+                for day in fallback_plan_data(params):
+                    if plan_day_number(day) not in sent:
+                        plan_data.append(day)
+                        yield sse_event("day", day)
+                plan_data.sort(key=lambda day: plan_day_number(day) or 0)
+
+            try:
+                yield sse_event("done", save_study_plan(current_user_id, params, plan_data, ai_generated))
+            except Exception as e:
+                db.session.rollback()
+                yield sse_event("error", {"error": str(e)})
+
+        return Response(stream_with_context(cancel_on_disconnect(events())), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     @app.route("/api/plans/<int:plan_id>", methods=["GET"])
     @token_required
     def get_plan(current_user_id, plan_id):
@@ -391,6 +766,111 @@ def create_app():
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    # ---- Lazy plans: day details on demand ----
+
+    prefetch_pool = ThreadPoolExecutor(
+        max_workers=int(os.getenv("AI_LAZY_PREFETCH_WORKERS", "2")), thread_name_prefix="ai-prefetch")
+
+    def load_plan_days(plan):
+        plan_data = plan.plan_data
+        if isinstance(plan_data, str):
+            try:
+                plan_data = json.loads(plan_data)
+            except ValueError:
+                plan_data = []
+        return list(plan_data) if isinstance(plan_data, list) else []
+
+    def find_plan_day(plan_data, day):
+        for index, d in enumerate(plan_data):
+            if isinstance(d, dict) and str(d.get("day")) == str(day):
+                return index, d
+        return None, None
+
+    def fill_day_details(current_user_id, plan, day):
+        """Return the plan's day entry, generating and saving its details first if missing."""
+        index, entry = find_plan_day(load_plan_days(plan), day)
+        if entry is None or entry.get("details"):
+            return entry
+
+        if isinstance(entry.get("topics"), list):
+            topic = ", ".join(str(t.get("name") if isinstance(t, dict) else t) for t in entry["topics"])
+        else:
+            topic = str(entry.get("topic") or plan.subject)
+        details = get_ai_service().generate_day_details(
+            subject=plan.subject,
+            level=plan.level,
+            days=plan.days,
+            day=day,
+            topic=topic,
+            hours=entry.get("hours") or plan.hours_per_day,
+            provider=get_preferred_provider(current_user_id),
+        )
+
+        # Re-read the row so details filled concurrently for other days are kept
+        plan = StudyPlan.query.filter_by(id=plan.id).with_for_update().first()
+        plan_data = load_plan_days(plan)
+        index, entry = find_plan_day(plan_data, day)
+        if entry is None:
+            return None
+        entry = dict(entry, details=details)
+        plan_data[index] = entry
+        plan.plan_data = plan_data  # reassign: in-place JSON edits are not tracked
+        db.session.commit()
+        return entry
+
+    def prefetch_day_details(current_user_id, plan_id, days):
+        def run():
+            with app.app_context():
+                for day in days:
+                    try:
+                        plan = StudyPlan.query.filter_by(id=plan_id, user_id=current_user_id).first()
+                        if not plan:
+                            return
+                        fill_day_details(current_user_id, plan, day)
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.warning(f"Prefetch of plan {plan_id} day {day} failed: {e}")
+                        return
+        prefetch_pool.submit(run)
+
+    @app.route("/api/plans/<int:plan_id>/days/<int:day>", methods=["GET"])
+    @token_required
+    def get_plan_day(current_user_id, plan_id, day):
+        """
+        Get one day of a plan. Details missing from lazy plans are generated on first
+        request and saved; the next ?prefetch=N days (default AI_LAZY_PREFETCH_DAYS) are
+        filled in the background.
+        """
+        try:
+            plan = StudyPlan.query.filter_by(id=plan_id, user_id=current_user_id).first()
+            if not plan:
+                return jsonify({"error": "Plan not found"}), 404
+
+            try:
+                entry = fill_day_details(current_user_id, plan, day)
+            except Exception as ai_err:
+                db.session.rollback()
+                logger.error(f"Day details generation failed: {ai_err}")
+                return jsonify({"error": str(ai_err)}), 503
+            if entry is None:
+                return jsonify({"error": "Day not found"}), 404
+
+            prefetch = request.args.get("prefetch", os.getenv("AI_LAZY_PREFETCH_DAYS", "1"))
+            prefetch = max(0, min(int(prefetch), 3)) if str(prefetch).isdigit() else 0
+            plan_data = load_plan_days(plan)
+            upcoming = []
+            for next_day in range(day + 1, day + 1 + prefetch):
+                _, next_entry = find_plan_day(plan_data, next_day)
+                if next_entry is not None and not next_entry.get("details"):
+                    upcoming.append(next_day)
+            if upcoming:
+                prefetch_day_details(current_user_id, plan_id, upcoming)
+
+            return jsonify({"plan_id": plan_id, "day": entry}), 200
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
     @app.route("/api/plans/<int:plan_id>", methods=["DELETE"])
     @token_required
     def delete_plan(current_user_id, plan_id):
@@ -687,7 +1167,14 @@ def create_app():
     def admin_stats(current_admin_id):
         """Admin stats overview"""
         try:
-            return jsonify(build_admin_stats()), 200
+            principals = get_principal_cache()
+            revocations = get_revocation_set()
+            throttle = get_login_throttle()
+            return jsonify(dict(build_admin_stats(),
+                                auth_cache=principals.stats() if principals else None,
+                                token_revocations=revocations.stats() if revocations else None,
+                                password_hashing=get_password_hasher().stats(),
+                                login_throttle=throttle.stats() if throttle else None)), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -740,7 +1227,7 @@ def create_app():
                 if data.get('is_active') is False:
                     return jsonify({'error': 'Cannot disable your own account'}), 400
 
-            user = User.query.get(user_id)
+            user = db.session.get(User, user_id)
             if not user:
                 return jsonify({'error': 'User not found'}), 404
 
@@ -751,6 +1238,7 @@ def create_app():
                 user.is_admin = bool(data.get('is_admin'))
 
             db.session.commit()
+            revoke_user(user.id)
             return jsonify({
                 'message': 'User updated',
                 'user': {
@@ -773,18 +1261,73 @@ def create_app():
             if current_admin_id == user_id:
                 return jsonify({'error': 'Cannot delete your own account'}), 400
 
-            user = User.query.get(user_id)
+            user = db.session.get(User, user_id)
             if not user:
                 return jsonify({'error': 'User not found'}), 404
 
             db.session.delete(user)
             db.session.commit()
+            revoke_user(user_id)
 
             return jsonify({'message': 'User deleted'}), 200
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/admin/users/import', methods=['POST'])
+    @admin_required
+    def admin_import_users(current_admin_id):
+        """
+        Admin: bulk-create users from CSV or NDJSON (multipart "file" or the raw body).
+        Rows are validated here; hashing and inserting run as a background job, so this
+        returns 202 with the validation report and a job id (poll /api/jobs/<id> for the
+        final report). ?dry_run=1 only validates and returns the report with 200.
+        """
+        try:
+            upload = request.files.get('file')
+            if upload:
+                content = upload.read().decode('utf-8-sig')
+                filename, content_type = upload.filename, upload.mimetype
+            else:
+                content = request.get_data(as_text=True)
+                filename, content_type = None, request.mimetype
+            fmt = (request.args.get('format') or detect_format(filename, content_type, content)).lower()
+            rows = parse_rows(content, fmt)
+
+            max_rows = int(os.getenv('USER_IMPORT_MAX_ROWS', '2000'))
+            if len(rows) > max_rows:
+                return jsonify({'error': f'Too many rows ({len(rows)}); the limit is {max_rows}. '
+                                         f'Use import_users.py for larger imports.'}), 413
+            if not rows:
+                return jsonify({'error': 'No rows to import'}), 400
+
+            dry_run = request.args.get('dry_run', '').lower() in ('1', 'true')
+            pending, errors = check_rows(rows)
+            report = build_report(len(rows), pending, errors, 0, dry_run)
+            if dry_run or not pending:
+                return jsonify(report), 200
+
+            try:
+                job = job_runner.submit(current_admin_id, 'import_users', {
+                    'total': len(rows),
+                    'rows': [[number, {k: v for k, v in mapping.items() if k != 'password'}]
+                             for number, mapping in pending],
+                    'errors': errors,
+                }, payload=[mapping['password'] for _, mapping in pending])
+            except JobQueueFull as e:
+                return jsonify({'error': str(e)}), 503
+            return jsonify({
+                **report,
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': f'/api/jobs/{job.id}',
+            }), 202
+        except (UserImportError, UnicodeDecodeError) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/api/admin/export', methods=['GET'])
     @admin_required
     def admin_export(current_admin_id):
@@ -808,8 +1351,50 @@ def create_app():
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/admin/ai-stats', methods=['GET'])
+    @admin_required
+    def admin_ai_stats(current_admin_id):
+        """Admin: AI layer runtime stats (per worker process)"""
+        try:
+            plan_cache = get_response_cache('plan')
+            flashcard_cache = get_response_cache('flashcards')
+            return jsonify({
+                'provider_pool': get_provider_pool().stats(),
+                'plan_cache': plan_cache.stats() if plan_cache else None,
+                'flashcard_cache': flashcard_cache.stats() if flashcard_cache else None,
+                'routing': get_ai_service().routing_state(),
+                'rate_limits': get_ai_service().rate_limit_state(),
+                'single_flight': get_ai_service().single_flight_state(),
+                'semantic_cache': get_ai_service().semantic_cache_state(),
+                'async': get_ai_service().async_state(),
+                'parsing': get_parse_stats().snapshot(),
+                'token_budget': get_token_budget().snapshot(),
+            }), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     # ==================== AI ENDPOINTS ====================
 
+    def save_flashcards(plan_id, topic, cards_data):
+        """Add generated cards to the session; caller commits. Returns the saved cards."""
+        saved = []
+        for c in cards_data:
+            question = c.get('question', '').strip()
+            answer = c.get('answer', '').strip()
+            if not question or not answer:
+                continue
+            fc = Flashcard(plan_id=plan_id, question=question, answer=answer, topic=topic)
+            db.session.add(fc)
+            db.session.flush()
+            saved.append({
+                'id': fc.id,
+                'plan_id': fc.plan_id,
+                'question': fc.question,
+                'answer': fc.answer,
+                'topic': fc.topic,
+            })
+        return saved
+
     @app.route('/api/ai/generate-flashcards', methods=['POST'])
     @token_required
     def ai_generate_flashcards(current_user_id):
@@ -821,6 +1406,7 @@ def create_app():
             num_cards = min(int(data.get('num_cards', 5)), 10)  # max 10
             req_provider = data.get('provider', '').strip().lower()  # optional: groq / gemini
             req_model = data.get('model', '').strip()               # optional: specific model
+            fresh = bool(data.get('fresh', False))                  # optional: skip the shared card cache
 
             if not plan_id or not topic:
                 return jsonify({'error': 'plan_id and topic are required'}), 400
@@ -829,50 +1415,35 @@ def create_app():
             if not plan:
                 return jsonify({'error': 'Plan not found'}), 404
 
-            # Resolve provider: use per-request if specified, else fall back to default
-            combined_topic = f"{topic} (in the context of studying {plan.subject})"
+            # Resolve provider: use per-request if specified, else the user's preference, else default
             try:
-                if req_provider:
-                    provider = get_provider_by_name(req_provider, req_model or None)
-                    if not provider:
-                        return jsonify({
-                            'error': f'Provider "{req_provider}" is not available. Check its API key in .env.'
-                        }), 503
-                    cards_data = provider.generate_flashcards(topic=combined_topic, num_cards=num_cards)
-                    used_provider = req_provider
-                else:
-                    ai = get_ai_service()
-                    if not ai.provider:
-                        return jsonify({'error': 'No AI provider configured. Add GROQ_API_KEY or GEMINI_API_KEY to .env'}), 503
-                    cards_data = ai.generate_flashcards(topic=combined_topic, num_cards=num_cards)
-                    used_provider = type(ai.provider).__name__.replace('Provider', '').lower()
+                provider = resolve_provider(current_user_id, req_provider, req_model)
+                ai = get_ai_service()
+                if not provider and not ai.provider:
+                    return jsonify({'error': 'No AI provider configured. Add GROQ_API_KEY or GEMINI_API_KEY to .env'}), 503
+                cards_data = ai.generate_flashcards(
+                    topic=topic,
+                    num_cards=num_cards,
+                    subject=plan.subject,
+                    provider=provider,
+                    fresh=fresh,
+                )
+                used_provider = provider.name if provider else (ai.last_provider_name() or 'cache')
 
                 if not cards_data:
                     return jsonify({'error': 'Could not generate flashcards. Please try again.'}), 503
 
+            except RateLimited as ai_error:
+                # Every usable provider is out of quota: tell the client when to come back
+                return jsonify({'error': str(ai_error)}), 429, {'Retry-After': str(int(ai_error.retry_after) + 1)}
+            except DeadlineExceeded as ai_error:
+                return jsonify({'error': str(ai_error)}), 504
             except Exception as ai_error:
                 error_msg = str(ai_error)
                 logger.error(f"AI service error: {error_msg}")
                 return jsonify({'error': error_msg}), 503
 
-            # Save to DB
-            saved = []
-            for c in cards_data:
-                question = c.get('question', '').strip()
-                answer = c.get('answer', '').strip()
-                if not question or not answer:
-                    continue
-                fc = Flashcard(plan_id=plan_id, question=question, answer=answer, topic=topic)
-                db.session.add(fc)
-                db.session.flush()
-                saved.append({
-                    'id': fc.id,
-                    'plan_id': fc.plan_id,
-                    'question': fc.question,
-                    'answer': fc.answer,
-                    'topic': fc.topic,
-                })
-
+            saved = save_flashcards(plan_id, topic, cards_data)
             db.session.commit()
             return jsonify({
                 'message': f'✅ Generated {len(saved)} flashcards for "{topic}"',
@@ -886,6 +1457,112 @@ def create_app():
             logger.error(f"Flashcard generation error: {e}")
             return jsonify({'error': f'Error: {str(e)[:100]}'}), 500
 
+    @app.route('/api/ai/plans/<int:plan_id>/generate-flashcards', methods=['POST'])
+    @token_required
+    def ai_generate_plan_flashcards(current_user_id, plan_id):
+        """
+        AI: Flashcards for every topic in a plan, as a background job.
+        Returns 202 with a job id; poll /api/jobs/<id> for progress and per-topic counts.
+        """
+        try:
+            data = request.json or {}
+            plan = StudyPlan.query.filter_by(id=plan_id, user_id=current_user_id).first()
+            if not plan:
+                return jsonify({'error': 'Plan not found'}), 404
+
+            params = {
+                'plan_id': plan_id,
+                'num_cards': max(1, min(int(data.get('num_cards', 3)), 10)),  # per topic, max 10
+                'provider': data.get('provider', '').strip().lower(),
+                'model': data.get('model', '').strip(),
+                'skip_existing': data.get('skip_existing', True) is not False,  # skip topics that already have cards
+            }
+            try:
+                resolve_provider(current_user_id, params['provider'], params['model'])
+                job = job_runner.submit(current_user_id, 'generate_plan_flashcards', params)
+            except JobQueueFull as e:
+                return jsonify({'error': str(e)}), 503
+            except Exception as ai_error:
+                return jsonify({'error': str(ai_error)}), 503
+
+            return jsonify({
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': f'/api/jobs/{job.id}',
+            }), 202
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Error: {str(e)[:100]}'}), 500
+
+    @app.route('/api/ai/generate-flashcards/stream', methods=['POST'])
+    @token_required
+    def ai_generate_flashcards_stream(current_user_id):
+        """AI: Stream generated flashcards over Server-Sent Events ("card" events, then "done")."""
+        try:
+            data = request.json or {}
+            plan_id = data.get('plan_id')
+            topic = data.get('topic', '').strip()
+            num_cards = min(int(data.get('num_cards', 5)), 10)  # max 10
+            req_provider = data.get('provider', '').strip().lower()
+            req_model = data.get('model', '').strip()
+            fresh = bool(data.get('fresh', False))
+
+            if not plan_id or not topic:
+                return jsonify({'error': 'plan_id and topic are required'}), 400
+
+            plan = StudyPlan.query.filter_by(id=plan_id, user_id=current_user_id).first()
+            if not plan:
+                return jsonify({'error': 'Plan not found'}), 404
+
+            try:
+                provider = resolve_provider(current_user_id, req_provider, req_model)
+            except Exception as ai_error:
+                return jsonify({'error': str(ai_error)}), 503
+            ai = get_ai_service()
+            if not provider and not ai.provider:
+                return jsonify({'error': 'No AI provider configured. Add GROQ_API_KEY or GEMINI_API_KEY to .env'}), 503
+            subject = plan.subject
+        except Exception as e:
+            return jsonify({'error': f'Error: {str(e)[:100]}'}), 500
+
+        def events():
+            cards_data = []
+            partial = False
+            try:
+                for card in ai.stream_flashcards(
+                    topic=topic,
+                    num_cards=num_cards,
+                    subject=subject,
+                    provider=provider,
+                    fresh=fresh,
+                ):
+                    cards_data.append(card)
+                    yield sse_event('card', card)
+            except Exception as ai_error:
+                logger.error(f"AI flashcard stream error: {ai_error}")
+                if not cards_data:
+                    yield sse_event('error', {'error': str(ai_error)})
+                    return
+                # Keep the cards already sent as they are; no fallback cards are mixed in
+                partial = True
+
+            try:
+                saved = save_flashcards(plan_id, topic, cards_data)
+                db.session.commit()
+                yield sse_event('done', {
+                    'message': f'✅ Generated {len(saved)} flashcards for "{topic}"',
+                    'flashcards': saved,
+                    'count': len(saved),
+                    'partial': partial,
+                    'provider': provider.name if provider else (ai.last_provider_name() or 'cache'),
+                })
+            except Exception as e:
+                db.session.rollback()
+                yield sse_event('error', {'error': f'Error: {str(e)[:100]}'})
+
+        return Response(stream_with_context(cancel_on_disconnect(events())), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
     # ==================== FLASHCARD ENDPOINTS ====================
     
 
@@ -957,7 +1634,7 @@ def create_app():
     def get_flashcard(current_user_id, flashcard_id):
         """Get a specific flashcard"""
         try:
-            flashcard = Flashcard.query.get(flashcard_id)
+            flashcard = db.session.get(Flashcard, flashcard_id)
             if not flashcard:
                 return jsonify({'error': 'Flashcard not found'}), 404
             
@@ -982,7 +1659,7 @@ def create_app():
     def update_flashcard(current_user_id, flashcard_id):
         """Update a flashcard"""
         try:
-            flashcard = Flashcard.query.get(flashcard_id)
+            flashcard = db.session.get(Flashcard, flashcard_id)
             if not flashcard:
                 return jsonify({'error': 'Flashcard not found'}), 404
             
@@ -1015,7 +1692,7 @@ def create_app():
     def delete_flashcard(current_user_id, flashcard_id):
         """Delete a flashcard"""
         try:
-            flashcard = Flashcard.query.get(flashcard_id)
+            flashcard = db.session.get(Flashcard, flashcard_id)
             if not flashcard:
                 return jsonify({'error': 'Flashcard not found'}), 404
             
@@ -1040,25 +1717,27 @@ def create_app():
         """Save user's AI model preferences"""
         try:
             data = request.json or {}
-            user = User.query.get(current_user_id)
+            user = db.session.get(User, current_user_id)
             if not user:
                 return jsonify({'error': 'User not found'}), 404
             
-            provider = data.get('provider', 'gemini').lower()
-            model = data.get('model', 'gemini-2.0-flash')
+            # No provider (or null) clears the preference: generation uses the routed default
+            provider = (data.get('provider') or '').strip().lower() or None
+            model = ((data.get('model') or '').strip() or None) if provider else None
             
             # Validate provider
-            valid_providers = ['gemini', 'ollama', 'huggingface', 'openai']
-            if provider not in valid_providers:
+            valid_providers = ['groq', 'gemini', 'ollama', 'huggingface', 'openai', 'local']
+            if provider and provider not in valid_providers:
                 return jsonify({'error': f'Invalid provider. Must be one of: {", ".join(valid_providers)}'}), 400
             
             user.ai_provider = provider
             user.ai_model = model
             db.session.commit()
+            invalidate_principal(current_user_id)
             
-            logger.info(f"User {current_user_id} switched to {provider}/{model}")
+            logger.info(f"User {current_user_id} switched to {provider or 'default'}/{model or 'default'}")
             return jsonify({
-                'message': f'✅ Switched to {provider}',
+                'message': f'✅ Switched to {provider}' if provider else '✅ Using the default provider',
                 'provider': provider,
                 'model': model,
             }), 200
@@ -1073,13 +1752,14 @@ def create_app():
     def get_ai_model_settings(current_user_id):
         """Get user's AI model preferences"""
         try:
-            user = User.query.get(current_user_id)
+            user = db.session.get(User, current_user_id)
             if not user:
                 return jsonify({'error': 'User not found'}), 404
             
+            # null: no preference saved
             return jsonify({
-                'provider': getattr(user, 'ai_provider', 'gemini'),
-                'model': getattr(user, 'ai_model', 'gemini-2.0-flash'),
+                'provider': user.ai_provider,
+                'model': user.ai_model,
             }), 200
             
         except Exception as e:
@@ -1089,33 +1769,9 @@ def create_app():
     return app
 
 
-def ensure_user_columns(app):
-    """Lightweight SQLite migration for new user columns."""
-    with app.app_context():
-        if db.engine.dialect.name != 'sqlite':
-            return
-
-        columns = [row[1] for row in db.session.execute(text("PRAGMA table_info(users)"))]
-        if 'is_admin' not in columns:
-            db.session.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0"))
-            db.session.execute(text("UPDATE users SET is_admin = 0 WHERE is_admin IS NULL"))
-        if 'is_active' not in columns:
-            db.session.execute(text("ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT 1"))
-            db.session.execute(text("UPDATE users SET is_active = 1 WHERE is_active IS NULL"))
-        if 'ai_provider' not in columns:
-            db.session.execute(text("ALTER TABLE users ADD COLUMN ai_provider VARCHAR(50) DEFAULT 'gemini'"))
-        if 'ai_model' not in columns:
-            db.session.execute(text("ALTER TABLE users ADD COLUMN ai_model VARCHAR(100) DEFAULT 'gemini-2.0-flash'"))
-
-        db.session.commit()
-
-
-
 def ensure_admin_user(app):
     """Ensure admin user exists with correct password in development mode"""
     with app.app_context():
-        admin = User.query.filter_by(username='admin').first()
-        
         try:
             admin_emails = [e.strip().lower() for e in os.getenv('ADMIN_EMAILS', '').split(',') if e.strip()]
             admin_usernames = [u.strip().lower() for u in os.getenv('ADMIN_USERNAMES', '').split(',') if u.strip()]
@@ -1124,10 +1780,14 @@ def ensure_admin_user(app):
             for username in admin_usernames:
                 admin_user = User.query.filter_by(username=username).first()
                 if admin_user:
+                    promoted = not (admin_user.is_admin and admin_user.is_active)
                     admin_user.is_admin = True
                     admin_user.is_active = True
                     admin_user.set_password(admin_password)
                     db.session.commit()
+                    if promoted:
+                        invalidate_principal(admin_user.id)
+                        revoke_user_tokens(admin_user.id)
                     print(f"[*] Admin user {username} updated with correct password")
                 else:
                     email = admin_emails[0] if admin_emails else f"{username}@example.com"
@@ -1140,15 +1800,35 @@ def ensure_admin_user(app):
             print(f"[!] Error ensuring admin user: {e}")
 
 
+def prepare_database(app):
+    """Apply migrations when AUTO_MIGRATE is set, then make sure the admin user exists."""
+    # Schema changes run once per deploy and after each pull (python migrations.py). AUTO_MIGRATE=true
+    # lets a single process apply them itself; never with several workers starting at once.
+    with app.app_context():
+        if os.getenv('AUTO_MIGRATE', 'false').lower() in ('1', 'true', 'yes'):
+            run_migrations(db.engine)
+        if pending_migrations(db.engine):
+            logger.error("❌ Database has pending migrations; run `python migrations.py`")
+            return
+    ensure_admin_user(app)
+
+
+def start_server(app):
+    """
+    Startup work for a serving process: database checks, the background job pool and the
+    Ollama warm-up. Called by gunicorn.conf.py in each worker and by `python app.py`;
+    importing this module (tests, CLI scripts) starts nothing.
+    """
+    prepare_database(app)
+    # Start the background job pool (also re-queues jobs left over from a previous run)
+    app.extensions["job_runner"].start()
+    # Optionally load the local Ollama model now rather than on the first request
+    warm_up_ollama()
+
+
 # Create app at module level so gunicorn can import it as `app:app`
 app = create_app()
 
-# Initialize database and admin on startup
-with app.app_context():
-    db.create_all()
-    ensure_user_columns(app)
-    ensure_admin_user(app)
-
 
 if __name__ == '__main__':
     env = os.getenv('FLASK_ENV', 'development')
@@ -1164,4 +1844,5 @@ if __name__ == '__main__':
         print(f"SECRET_KEY: {app.config['SECRET_KEY'][:20]}...")
         print("="*60 + "\n")
 
+    start_server(app)
     app.run(debug=(env == 'development'), use_reloader=False, host='0.0.0.0', port=5000)
@@ -0,0 +1,179 @@
+"""
+Auth Cache - Short-lived per-worker cache of user principals
+
+token_required and admin_required only need a user's id, is_active and
+is_admin after the JWT is verified, and generation routes only the user's
+saved AI provider and model. Loading the User row for that on every request
+is roughly half the database work of the busiest endpoints, so principals
+are cached per worker process for AUTH_CACHE_TTL seconds
+(bounded to AUTH_CACHE_MAX_ENTRIES, least recently used evicted first).
+
+Changes to a user (admin update/delete, account changes, admin scripts) call
+invalidate(user_id). That drops the entry in this worker at once and appends
+to an invalidation log in the shared state SQLite file, which every other
+worker reads at most AUTH_CACHE_SYNC_INTERVAL seconds apart. A disabled
+account is therefore rejected everywhere within that interval, and never
+later than the TTL even if the shared file is unavailable.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Callable, Dict, Optional
+
+import shared_state
+
+logger = logging.getLogger(__name__)
+
+# ai_provider/ai_model: the saved AI preference (None when not loaded or not set)
+Principal = namedtuple("Principal", ["id", "is_active", "is_admin", "ai_provider", "ai_model"],
+                       defaults=(None, None))
+
+
+class PrincipalCache:
+    """Bounded TTL cache of Principals with cross-worker invalidation. Thread-safe."""
+
+    def __init__(self, ttl: float = 30, max_entries: int = 10000, sync_interval: float = 1, path: str = None):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.sync_interval = sync_interval
+        self.path = path or shared_state.get_state_db_path()
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+        self._last_seq = None
+        self._epoch = 0  # bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.shared = True
+        try:
+            conn = shared_state.connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS auth_invalidations ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, created_at REAL NOT NULL)"
+            )
+            # Start from the current end of the log; older rows predate this worker's cache
+            self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM auth_invalidations").fetchone()[0]
+        except Exception as e:
+            logger.warning(f"⚠️ Auth cache invalidation log unavailable, relying on TTL only: {e}")
+            self.shared = False
+
+    def get(self, user_id: int, loader: Callable[[int], Optional[Principal]]) -> Optional[Principal]:
+        """Cached principal for user_id, else loader(user_id) (cached unless None)."""
+        now = time.monotonic()
+        self._sync(now)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            epoch = self._epoch
+        principal = loader(user_id)
+        if principal is not None:
+            with self._lock:
+                if epoch != self._epoch:
+                    # Invalidated while loading; the row we read may already be stale
+                    return principal
+                self._entries[user_id] = (principal, now + self.ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Forget one user (or everyone, with None) here and in every other worker."""
+        self._drop(user_id)
+        if not self.shared:
+            return
+        try:
+            conn = shared_state.connect(self.path)
+            conn.execute("INSERT INTO auth_invalidations (user_id, created_at) VALUES (?, ?)",
+                         (user_id, time.time()))
+            # Entries cached before an old invalidation have expired by now
+            conn.execute("DELETE FROM auth_invalidations WHERE created_at < ?",
+                         (time.time() - max(2 * self.ttl, 60),))
+        except Exception as e:
+            logger.warning(f"⚠️ Could not publish auth invalidation for user {user_id}: {e}")
+
+    def _drop(self, user_id: Optional[int]):
+        with self._lock:
+            self.invalidations += 1
+            self._epoch += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def _sync(self, now: float):
+        """Apply invalidations published by other workers since the last check."""
+        if not self.shared or now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if now - self._synced_at < self.sync_interval:
+                return
+            self._synced_at = now
+            last_seq = self._last_seq
+        try:
+            rows = shared_state.connect(self.path).execute(
+                "SELECT seq, user_id FROM auth_invalidations WHERE seq > ? ORDER BY seq", (last_seq,)
+            ).fetchall()
+        except Exception as e:
+            logger.warning(f"⚠️ Auth cache sync failed: {e}")
+            return
+        if not rows:
+            return
+        with self._lock:
+            self._last_seq = max(self._last_seq, rows[-1][0])
+            self._epoch += 1
+            for _, user_id in rows:
+                if user_id is None:
+                    self._entries.clear()
+                else:
+                    self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "invalidations": self.invalidations,
+                "shared": self.shared,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_principal_cache() -> Optional[PrincipalCache]:
+    """Shared principal cache, or None when AUTH_CACHE_TTL is 0."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = float(os.getenv("AUTH_CACHE_TTL", "30"))
+                if ttl <= 0:
+                    _cache = False
+                else:
+                    _cache = PrincipalCache(
+                        ttl=ttl,
+                        max_entries=int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000")),
+                        sync_interval=float(os.getenv("AUTH_CACHE_SYNC_INTERVAL", "1")),
+                    )
+    return _cache or None
+
+
+def invalidate_principal(user_id: Optional[int] = None):
+    """Invalidate a cached principal after changing or deleting a user (None: all users)."""
+    cache = get_principal_cache()
+    if cache:
+        cache.invalidate(user_id)
@@ -0,0 +1,211 @@
+"""
+Auth Tokens - Short-lived claims tokens, refresh tokens and a revocation set
+
+login and register return two JWTs:
+
+- an access token (AUTH_ACCESS_TOKEN_TTL, default 15 minutes) that carries the
+  user's role and active flag, so the auth decorators can authorize a request
+  without reading the users table;
+- a refresh token (AUTH_REFRESH_TOKEN_TTL, default 7 days) that POST
+  /api/token/refresh exchanges for a new access token with current claims,
+  without a password check.
+
+Disabling, demoting, promoting or deleting a user revokes the access tokens
+issued to them before that moment. Revocations live in the token_revocations
+table of the app database, so every worker and host sees them and they
+survive restarts; each worker mirrors the revoked user ids in a bloom filter,
+so the common case (user not revoked) is one in-memory check and only filter
+hits read the row. Rows older than the access token lifetime are pruned,
+since every token they could reject has expired.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+import jwt
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+ACCESS_TTL = int(os.getenv("AUTH_ACCESS_TOKEN_TTL", "900"))
+REFRESH_TTL = int(os.getenv("AUTH_REFRESH_TOKEN_TTL", str(7 * 86400)))
+
+
+def _encode(payload: Dict, secret: str, ttl: int) -> str:
+    now = time.time()
+    # Sub-second iat so a token minted right after a revocation is not rejected by it
+    return jwt.encode(dict(payload, iat=now, exp=int(now + ttl)), secret, algorithm="HS256")
+
+
+def issue_tokens(user, secret: str) -> Dict:
+    """Access and refresh token for a user (anything with id, is_admin and is_active)."""
+    return {
+        "token": access_token(user, secret),
+        "refresh_token": _encode({"user_id": user.id, "type": REFRESH}, secret, REFRESH_TTL),
+        "expires_in": ACCESS_TTL,
+    }
+
+
+def access_token(user, secret: str) -> str:
+    return _encode({
+        "user_id": user.id,
+        "type": ACCESS,
+        "role": "admin" if user.is_admin else "user",
+        "active": bool(user.is_active),
+    }, secret, ACCESS_TTL)
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over integer keys."""
+
+    def __init__(self, bits: int = 8192, hashes: int = 4):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key: int):
+        digest = hashlib.blake2b(str(key).encode(), digest_size=4 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[4 * i:4 * i + 4], "little") % self.bits
+
+    def add(self, key: int):
+        for pos in self._positions(key):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: int) -> bool:
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationSet:
+    """Users whose earlier access tokens are no longer valid. Thread-safe."""
+
+    def __init__(self, engine, ttl: float = ACCESS_TTL, sync_interval: float = 1, bits: int = 8192):
+        # Revocations only matter while tokens issued before them can still be unexpired
+        self.ttl = ttl + 60
+        self.sync_interval = sync_interval
+        self.bits = bits
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._filter = BloomFilter(bits)
+        self._version = None
+        self._synced_at = 0.0
+        self.checks = 0
+        self.filter_hits = 0
+        self.rejected = 0
+        if not inspect(engine).has_table("token_revocations"):
+            raise RuntimeError("token_revocations table missing; run python migrations.py")
+
+    def revoke(self, user_id: int):
+        """Reject the user's access tokens issued before now, in every worker."""
+        now = time.time()
+        params = {"user_id": user_id, "now": now}
+        try:
+            with self.engine.begin() as conn:
+                updated = conn.execute(text(
+                    "UPDATE token_revocations SET revoked_at = :now WHERE user_id = :user_id"), params).rowcount
+                if not updated:
+                    conn.execute(text(
+                        "INSERT INTO token_revocations (user_id, revoked_at) VALUES (:user_id, :now)"), params)
+        except IntegrityError:
+            # Another worker inserted the row first
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    "UPDATE token_revocations SET revoked_at = :now WHERE user_id = :user_id"), params)
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM token_revocations WHERE revoked_at < :cutoff"),
+                         {"cutoff": now - self.ttl})
+        with self._lock:
+            self._filter.add(user_id)
+            self._synced_at = 0.0
+
+    def is_revoked(self, user_id: int, issued_at: float) -> bool:
+        self._sync()
+        with self._lock:
+            self.checks += 1
+            if user_id not in self._filter:
+                return False
+            self.filter_hits += 1
+        with self.engine.connect() as conn:
+            row = conn.execute(text("SELECT revoked_at FROM token_revocations WHERE user_id = :user_id"),
+                               {"user_id": user_id}).fetchone()
+        revoked = row is not None and float(issued_at or 0) < row[0]
+        if revoked:
+            with self._lock:
+                self.rejected += 1
+        return revoked
+
+    def _sync(self):
+        """Rebuild the filter when the table changed (another worker revoked, or rows were pruned)."""
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if now - self._synced_at < self.sync_interval:
+                return
+            self._synced_at = now
+        with self.engine.connect() as conn:
+            version = tuple(conn.execute(text("SELECT COUNT(*), MAX(revoked_at) FROM token_revocations")).fetchone())
+            if version == self._version:
+                return
+            rebuilt = BloomFilter(self.bits)
+            for (user_id,) in conn.execute(text("SELECT user_id FROM token_revocations")):
+                rebuilt.add(user_id)
+        with self._lock:
+            self._filter = rebuilt
+            self._version = version
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "checks": self.checks,
+                "filter_hits": self.filter_hits,
+                "rejected": self.rejected,
+            }
+
+
+_revocations = None
+_revocations_failed_at = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocation_set() -> Optional[RevocationSet]:
+    """
+    Shared revocation set on the app database (call within an app context), or
+    None if its table is unavailable; callers then look every user up instead
+    of trusting token claims. An unavailable table (migrations not yet applied)
+    is checked again every AUTH_REVOCATION_RETRY seconds.
+    """
+    global _revocations, _revocations_failed_at
+    if _revocations is None:
+        retry = float(os.getenv("AUTH_REVOCATION_RETRY", "30"))
+        if _revocations_failed_at is not None and time.monotonic() - _revocations_failed_at < retry:
+            return None
+        with _revocations_lock:
+            if _revocations is None and (_revocations_failed_at is None
+                                         or time.monotonic() - _revocations_failed_at >= retry):
+                try:
+                    from models import db
+                    _revocations = RevocationSet(
+                        db.engine,
+                        sync_interval=float(os.getenv("AUTH_CACHE_SYNC_INTERVAL", "1")),
+                    )
+                    _revocations_failed_at = None
+                except Exception as e:
+                    logger.warning(f"⚠️ Token revocation set unavailable, retrying in {retry:.0f}s: {e}")
+                    _revocations_failed_at = time.monotonic()
+    return _revocations
+
+
+def revoke_user_tokens(user_id: int):
+    """Call after disabling, demoting, promoting or deleting a user."""
+    revocations = get_revocation_set()
+    if revocations:
+        revocations.revoke(user_id)
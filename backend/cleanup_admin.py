@@ -8,10 +8,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from models import db, User
-from app import create_app
+from migrations import cli_app
+from auth_cache import invalidate_principal
+from auth_tokens import revoke_user_tokens
 
 def complete_reset():
-    app = create_app()
+    app = cli_app()
     
     with app.app_context():
         print("🗑️  COMPLETE ADMIN RESET\n")
@@ -25,8 +27,10 @@ def complete_reset():
         for user in all_users:
             print(f"  Deleting: {user.username} (ID: {user.id}, is_admin: {user.is_admin})")
             db.session.delete(user)
+            revoke_user_tokens(user.id)
         
         db.session.commit()
+        invalidate_principal()
         print("✅ All users deleted!\n")
         
         # Step 2: Create fresh admin user
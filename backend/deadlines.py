@@ -0,0 +1,174 @@
+"""
+Deadlines - Per-request time budgets, retries with backoff and cancellation for AI calls
+
+A Deadline is set once per request (X-Request-Timeout header or
+AI_REQUEST_TIMEOUT) and carried in a context variable, so every layer below
+the route (routing, rate-limit waits, provider calls, retries) can size its
+own timeouts from what is left instead of using fixed values. Worker
+threads and event-loop tasks started for a request receive the same
+Deadline explicitly (see run_in_context).
+
+A Deadline can also be cancelled, e.g. when an SSE client disconnects;
+pending retries and not-yet-started calls then stop with DeadlineExceeded.
+
+RetryPolicy retries transient upstream failures (5xx, timeouts, dropped
+connections) with exponential backoff and full jitter, never sleeping past
+the deadline.
+"""
+
+import os
+import time
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out, or the client went away."""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.cancelled = False
+
+    def remaining(self) -> float:
+        return 0.0 if self.cancelled else max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        if self.cancelled:
+            raise DeadlineExceeded("Request cancelled by the client")
+        if self.expired:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s exceeded")
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("ai_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def set_deadline(deadline: Optional[Deadline]):
+    """Install a deadline for the current context; returns a token for reset_deadline."""
+    return _current.set(deadline)
+
+
+def reset_deadline(token):
+    _current.reset(token)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def request_deadline(header_value: str = None) -> Deadline:
+    """
+    Deadline for an incoming request: the client's X-Request-Timeout (seconds),
+    else AI_REQUEST_TIMEOUT, never above AI_REQUEST_TIMEOUT_MAX.
+    """
+    default = float(os.getenv("AI_REQUEST_TIMEOUT", "90"))
+    ceiling = float(os.getenv("AI_REQUEST_TIMEOUT_MAX", "300"))
+    seconds = default
+    if header_value:
+        try:
+            seconds = float(header_value)
+        except ValueError:
+            pass
+    return Deadline(max(1.0, min(seconds, ceiling)))
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current request's deadline has passed or was cancelled."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def cap_timeout(timeout: Optional[float]) -> Optional[float]:
+    """A call timeout no longer than what is left of the current deadline."""
+    deadline = _current.get()
+    if deadline is None:
+        return timeout
+    deadline.check()
+    remaining = deadline.remaining()
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def run_in_context(fn, *args):
+    """Callable for a worker thread that runs fn(*args) with a copy of the caller's context (and deadline)."""
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn, *args)
+
+
+# =============================================================================
+# RETRIES
+# =============================================================================
+
+_TRANSIENT_STATUS = {500, 502, 503, 504}
+_TRANSIENT_NAMES = ("timeout", "connecterror", "connectionerror", "remoteprotocolerror",
+                    "serviceunavailable", "internalservererror", "badgateway", "apiconnectionerror")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """5xx responses, timeouts and dropped connections; never quota or deadline errors."""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in _TRANSIENT_STATUS
+    if any(marker in type(error).__name__.lower() for marker in _TRANSIENT_NAMES):
+        return True
+    # "<Provider> returned 503" from the HTTP-based providers
+    message = str(error)
+    return any(f"returned {code}" in message for code in _TRANSIENT_STATUS)
+
+
+class RetryPolicy:
+    """Bounded retries with exponential backoff and full jitter (sleep = uniform(0, base * 2^n), capped)."""
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8):
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def backoff(self, attempt: int, error: Exception) -> Optional[float]:
+        """Seconds to wait before retrying after failed attempt ``attempt`` (0-based), or None to give up."""
+        if attempt >= self.max_retries or not is_transient_error(error):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        deadline = _current.get()
+        # Leave the retry at least as much time as the backoff itself
+        if deadline is not None and deadline.remaining() < 2 * delay + self.base_delay:
+            return None
+        self.retries += 1
+        return delay
+
+
+_retry_policy = RetryPolicy(
+    max_retries=int(os.getenv("AI_RETRY_MAX", "2")),
+    base_delay=float(os.getenv("AI_RETRY_BASE_DELAY", "0.5")),
+    max_delay=float(os.getenv("AI_RETRY_MAX_DELAY", "8")),
+)
+
+
+def get_retry_policy() -> RetryPolicy:
+    return _retry_policy
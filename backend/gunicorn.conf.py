@@ -0,0 +1,10 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn starts from the backend folder
+(`gunicorn app:app`). Background work starts here rather than on import of app.py.
+"""
+
+
+def post_worker_init(worker):
+    # Threads do not survive fork: each worker starts its own job pool once it has loaded the app
+    from app import app, start_server
+    start_server(app)
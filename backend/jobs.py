@@ -0,0 +1,254 @@
+"""
+Background Jobs - Durable AI generation jobs run on a bounded worker pool
+
+Jobs are rows in the generation_jobs table, so queued work survives a worker
+restart. Each gunicorn worker runs a small thread pool; a job is claimed with
+a conditional UPDATE (queued -> running), so when several workers pick up the
+same job only one of them runs it. A periodic sweep re-queues jobs whose
+worker died mid-run (no heartbeat for AI_JOB_STALE_AFTER seconds, at most
+AI_JOB_MAX_ATTEMPTS runs) and picks up queued jobs nobody is working on.
+
+While a handler runs, a heartbeat thread keeps the job's updated_at fresh,
+so a long LLM call is not mistaken for a dead worker. Handlers whose side
+effects must not happen twice commit them together with job.result (see
+store_result); a re-run then finishes with the stored result instead of
+running the handler again.
+
+Kinds registered as transient take input that must never be stored (e.g.
+the passwords of a user import): submit(payload=...) keeps it in this
+process's memory only. Such a job runs only in the worker that submitted it;
+if that worker dies, the sweep fails the job instead of re-running it.
+"""
+
+import os
+import uuid
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from models import db, GenerationJob
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when the local worker pool already has its maximum number of pending jobs."""
+
+
+class JobRunner:
+    """Runs GenerationJob rows through registered handlers on a thread pool."""
+
+    def __init__(self, app, max_workers: int = None, max_pending: int = None,
+                 stale_after: float = None, sweep_interval: float = None, max_attempts: int = None):
+        self.app = app
+        self.max_workers = max_workers or int(os.getenv("AI_JOB_WORKERS", "2"))
+        self.max_pending = max_pending or int(os.getenv("AI_JOB_MAX_PENDING", "50"))
+        # A running job not touched for this long is assumed orphaned by a dead worker
+        self.stale_after = stale_after or float(os.getenv("AI_JOB_STALE_AFTER", "600"))
+        self.sweep_interval = sweep_interval or float(os.getenv("AI_JOB_SWEEP_INTERVAL", "60"))
+        self.heartbeat_interval = min(60.0, self.stale_after / 4)
+        # Runs (claims) per job before a job that keeps losing its worker is marked failed
+        self.max_attempts = max_attempts or int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ai-job")
+        self.handlers: Dict[str, Callable] = {}
+        self._transient_kinds = set()
+        self._payloads: Dict[str, Any] = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def register(self, kind: str, handler: Callable, transient: bool = False):
+        """
+        Register handler(job) -> result dict for a job kind. Transient kinds get their
+        in-memory input from payload(job.id) and are never re-run by another worker.
+        """
+        self.handlers[kind] = handler
+        if transient:
+            self._transient_kinds.add(kind)
+
+    def start(self):
+        """Recover durable jobs and start the periodic sweep. Call once per worker process."""
+        if self._started:
+            return
+        self._started = True
+        thread = threading.Thread(target=self._sweep_loop, name="ai-job-sweep", daemon=True)
+        thread.start()
+
+    def submit(self, user_id: int, kind: str, params: Dict, payload: Any = None) -> GenerationJob:
+        """
+        Persist a new job and schedule it. Must be called inside an app context.
+        payload (transient kinds only) stays in memory and is not written to the job row.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if payload is not None and kind not in self._transient_kinds:
+            raise ValueError(f"Job kind '{kind}' does not take an in-memory payload")
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise JobQueueFull("Too many generation jobs in progress. Please try again shortly.")
+
+        job = GenerationJob(id=uuid.uuid4().hex, user_id=user_id, kind=kind, params=params,
+                            status='queued', progress=0, attempts=0)
+        if kind in self._transient_kinds:
+            self._payloads[job.id] = payload
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except Exception:
+            self._payloads.pop(job.id, None)
+            raise
+        self._schedule(job.id)
+        return job
+
+    def payload(self, job_id: str) -> Any:
+        """In-memory input of a transient job submitted by this process (None if it is gone)."""
+        return self._payloads.get(job_id)
+
+    def set_progress(self, job_id: str, progress: int):
+        """Record progress (0-100) for a running job; also serves as its heartbeat."""
+        GenerationJob.query.filter_by(id=job_id).update({
+            'progress': max(0, min(100, int(progress))),
+            'updated_at': datetime.utcnow(),
+        })
+        db.session.commit()
+
+    @staticmethod
+    def store_result(job_id: str, result: Dict):
+        """Stage a job's result in the current transaction, so it commits with the handler's own writes."""
+        GenerationJob.query.filter_by(id=job_id).update({'result': result}, synchronize_session=False)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _schedule(self, job_id: str):
+        with self._lock:
+            if job_id in self._pending:
+                return
+            self._pending.add(job_id)
+        self.executor.submit(self._run, job_id)
+
+    def _run(self, job_id: str):
+        try:
+            with self.app.app_context():
+                now = datetime.utcnow()
+                claim = GenerationJob.query.filter_by(id=job_id, status='queued')
+                if job_id not in self._payloads and self._transient_kinds:
+                    # Only the worker holding a transient job's input may run it
+                    claim = claim.filter(GenerationJob.kind.notin_(self._transient_kinds))
+                claimed = claim.update({
+                    'status': 'running',
+                    'started_at': now,
+                    'updated_at': now,
+                    'attempts': GenerationJob.attempts + 1,
+                })
+                db.session.commit()
+                if not claimed:
+                    return  # Another worker got there first, or the job is already done
+
+                job = db.session.get(GenerationJob, job_id)
+                handler = self.handlers.get(job.kind)
+                stop = threading.Event()
+                threading.Thread(target=self._heartbeat, args=(job_id, stop), name="ai-job-heartbeat",
+                                 daemon=True).start()
+                try:
+                    if job.result is not None:
+                        # An earlier run committed its work but died before finishing the job
+                        logger.info(f"♻️ Job {job_id} ({job.kind}) already has a result; not re-running")
+                        result = job.result
+                    elif handler is None:
+                        raise Exception(f"No handler for job kind '{job.kind}'")
+                    else:
+                        result = handler(job)
+                    job.status = 'succeeded'
+                    job.result = result
+                    job.progress = 100
+                except Exception as e:
+                    db.session.rollback()
+                    job = db.session.get(GenerationJob, job_id)
+                    logger.error(f"❌ Job {job_id} ({job.kind}) failed: {e}")
+                    job.status = 'failed'
+                    job.error = str(e)[:500]
+                finally:
+                    stop.set()
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"❌ Job runner error for {job_id}: {e}")
+        finally:
+            self._payloads.pop(job_id, None)
+            with self._lock:
+                self._pending.discard(job_id)
+
+    def _heartbeat(self, job_id: str, stop: threading.Event):
+        """Touch a running job's updated_at until stop is set, so recover() leaves it alone."""
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                with self.app.app_context():
+                    GenerationJob.query.filter_by(id=job_id, status='running') \
+                        .update({'updated_at': datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Job heartbeat failed for {job_id}: {e}")
+
+    def recover(self):
+        """Re-queue orphaned running jobs (or fail them after max_attempts) and schedule queued ones."""
+        with self.app.app_context():
+            now = datetime.utcnow()
+            stale = now - timedelta(seconds=self.stale_after)
+            lost = 0
+            if self._transient_kinds:
+                local = list(self._payloads)
+                if local:
+                    # Heartbeat for our transient jobs still waiting for a thread
+                    GenerationJob.query.filter(GenerationJob.id.in_(local), GenerationJob.status == 'queued') \
+                        .update({'updated_at': now}, synchronize_session=False)
+                # A stale transient job's input died with its worker: fail it, never re-run it
+                lost = GenerationJob.query.filter(
+                    GenerationJob.kind.in_(self._transient_kinds),
+                    GenerationJob.status.in_(('queued', 'running')),
+                    GenerationJob.updated_at < stale,
+                    GenerationJob.id.notin_(local),
+                ).update({
+                    'status': 'failed',
+                    'error': "Worker stopped before the job finished; its input was not stored. Submit it again.",
+                    'finished_at': now,
+                }, synchronize_session=False)
+            orphaned = (
+                GenerationJob.status == 'running',
+                GenerationJob.updated_at < stale,
+            )
+            given_up = GenerationJob.query.filter(*orphaned, GenerationJob.attempts >= self.max_attempts).update({
+                'status': 'failed',
+                'error': f"Worker stopped responding {self.max_attempts} times; giving up",
+                'finished_at': now,
+            }, synchronize_session=False)
+            requeued = GenerationJob.query.filter(*orphaned).update({'status': 'queued'}, synchronize_session=False)
+            db.session.commit()
+            if lost:
+                logger.error(f"❌ Failed {lost} transient job(s) whose worker stopped")
+            if given_up:
+                logger.error(f"❌ Failed {given_up} generation job(s) after {self.max_attempts} attempts")
+            if requeued:
+                logger.warning(f"⚠️ Re-queued {requeued} orphaned generation job(s)")
+
+            free_slots = self.max_pending - self.pending_count()
+            if free_slots <= 0:
+                return
+            queued = GenerationJob.query.filter_by(status='queued')
+            if self._transient_kinds:
+                queued = queued.filter(GenerationJob.kind.notin_(self._transient_kinds))
+            queued = queued.order_by(GenerationJob.created_at).limit(free_slots).all()
+            for job in queued:
+                self._schedule(job.id)
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                self.recover()
+            except Exception as e:
+                logger.error(f"❌ Job sweep failed: {e}")
+            time.sleep(self.sweep_interval)
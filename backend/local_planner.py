@@ -0,0 +1,378 @@
+"""
+Local Planner - Deterministic study plans from curated topic catalogs
+
+Builds plans in the same {"day", "topic", "hours", "details"} format the LLM
+providers return, without any network call. Used as the "local" provider
+and as the fallback when every AI provider fails, so an outage still yields
+a real curriculum instead of placeholder topics.
+
+Allocation:
+- Fewer days than topics: consecutive topics are grouped into one day
+- More days than topics: topics span several days (Part 1/2, ...), every
+  7th day is a review day and the last day a recap; long plans also pull in
+  the next level's topics as stretch material
+- hours_per_day is split into concepts / practice / review by level
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Topic catalogs, kept in sync with SUBJECTS_DB in frontend/src/App.jsx
+CATALOG = {
+    "DSA": {
+        "full_name": "Data Structures & Algorithms",
+        "aliases": ["data structures", "algorithms", "data structures and algorithms", "dsa"],
+        "Beginner": [
+            "Arrays & Strings - Indexing, searching, sorting basics",
+            "Linked Lists - Singly linked list, operations",
+            "Stacks & Queues - LIFO/FIFO operations",
+            "Hash Tables - Hashing, collision handling",
+            "Sorting Basics - Bubble, selection, insertion sort",
+            "Big O Notation - Time & space complexity analysis",
+        ],
+        "Intermediate": [
+            "Binary Search Trees - BST operations, traversals",
+            "Graphs & BFS/DFS - Graph representations, traversals",
+            "Dynamic Programming Intro - Memoization basics",
+            "Greedy Algorithms - Activity selection, fractional knapsack",
+            "Backtracking - N-Queens, permutations, combinations",
+            "Heaps & Priority Queues - Min/Max heap implementation",
+        ],
+        "Advanced": [
+            "Advanced DP - Longest subsequences, matrix chain multiplication",
+            "Network Flow - Max flow, Ford-Fulkerson algorithm",
+            "Segment Trees - Range queries, updates",
+            "Tries & String Matching - KMP, Rabin-Karp algorithms",
+            "NP-Complete Problems - Recognition & approximation",
+            "Graph Algorithms - Dijkstra, Floyd-Warshall, Bellman-Ford",
+        ],
+    },
+    "Python": {
+        "full_name": "Python Programming",
+        "aliases": ["python", "python programming", "python3"],
+        "Beginner": [
+            "Syntax & Variables - Data types, variable assignment",
+            "Control Flow - if/else statements, loops (for, while)",
+            "Functions & Scope - Function definition, parameters, return values",
+            "Data Types - Lists, tuples, dictionaries, sets",
+            "String Operations - String methods, f-strings, formatting",
+            "File I/O - Reading, writing, file operations",
+        ],
+        "Intermediate": [
+            "OOP Basics - Classes, objects, inheritance, polymorphism",
+            "Modules & Packages - Import system, creating modules",
+            "Exception Handling - Try-except blocks, custom exceptions",
+            "Decorators & Closures - Function decorators, nested functions",
+            "Generators & Iterators - yield keyword, generator functions",
+            "List Comprehensions - Concise list creation, nested comprehensions",
+        ],
+        "Advanced": [
+            "Async Programming - asyncio, async/await, event loops",
+            "Metaclasses - Class creation, __new__, __init__",
+            "Performance Optimization - Profiling, caching, optimization",
+            "Testing & Debugging - unittest, pytest, debugging techniques",
+            "Design Patterns - Singleton, Factory, Observer, Strategy",
+            "Memory Management - Garbage collection, optimization tips",
+        ],
+    },
+    "Web Dev": {
+        "full_name": "Web Development",
+        "aliases": ["web dev", "web development", "webdev", "full stack", "fullstack"],
+        "Beginner": [
+            "HTML Basics - Semantic HTML, forms, accessibility",
+            "CSS Styling - Flexbox, Grid, responsive design",
+            "JavaScript Fundamentals - Variables, functions, DOM",
+            "DOM Manipulation - querySelector, event listeners",
+            "Forms & Validation - Form handling, client-side validation",
+            "Responsive Design - Media queries, mobile-first approach",
+        ],
+        "Intermediate": [
+            "React Hooks - useState, useEffect, custom hooks",
+            "Component Architecture - Composition, reusable components",
+            "REST APIs - Fetch API, axios, error handling",
+            "Routing - React Router, navigation, params",
+            "CSS Frameworks - Tailwind CSS, Bootstrap integration",
+            "Local Storage & Session - Browser storage APIs",
+        ],
+        "Advanced": [
+            "Performance Optimization - Code splitting, lazy loading, memoization",
+            "Testing - Jest, React Testing Library, E2E testing",
+            "Deployment - Vercel, Netlify, GitHub Pages, CI/CD",
+            "Security - CORS, XSS prevention, CSRF tokens, authentication",
+            "Advanced Patterns - HOC, Render Props, Compound Components",
+            "Server-Side Rendering - Next.js, SSR concepts",
+        ],
+    },
+    "Machine Learning": {
+        "full_name": "Machine Learning & AI",
+        "aliases": ["machine learning", "ml", "ai", "machine learning and ai", "deep learning"],
+        "Beginner": [
+            "Python for ML - NumPy arrays, Pandas dataframes",
+            "Data Preprocessing - Cleaning, handling missing values",
+            "Exploratory Data Analysis - Statistics, visualization",
+            "Linear Regression - Cost function, gradient descent",
+            "Logistic Regression - Binary classification, probability",
+            "Decision Trees - Tree construction, pruning, visualization",
+        ],
+        "Intermediate": [
+            "Random Forests - Ensemble methods, bagging, feature importance",
+            "K-Means Clustering - Unsupervised learning, centroid updates",
+            "Principal Component Analysis - Dimensionality reduction",
+            "Support Vector Machines - Kernel methods, margin maximization",
+            "Neural Networks Basics - Perceptron, backpropagation",
+            "Model Evaluation - Confusion matrix, precision, recall, F1-score",
+        ],
+        "Advanced": [
+            "Deep Learning - CNNs for image recognition, RNNs for sequences",
+            "Natural Language Processing - Tokenization, embeddings, BERT",
+            "Computer Vision - Image classification, object detection",
+            "Reinforcement Learning - Q-learning, policy gradient",
+            "Transfer Learning - Pre-trained models, fine-tuning",
+            "Model Deployment - TensorFlow Serving, containerization",
+        ],
+    },
+    "JavaScript": {
+        "full_name": "JavaScript Mastery",
+        "aliases": ["javascript", "js", "ecmascript", "es6"],
+        "Beginner": [
+            "Variables & Scope - var, let, const, block scope",
+            "Data Types & Operators - Primitives, type coercion",
+            "Functions & Arrow Functions - Function declarations, arrow syntax",
+            "Objects & Arrays - Object methods, array manipulation",
+            "DOM & Events - Event handling, event delegation",
+            "Promise Basics - Promise creation, then/catch chaining",
+        ],
+        "Intermediate": [
+            "Async/Await - Async functions, error handling with try-catch",
+            "Closures & Hoisting - Variable hoisting, closure patterns",
+            "Prototypes & Inheritance - Prototype chain, constructor functions",
+            "Modules - ES6 import/export, module patterns",
+            "Error Handling - Custom errors, error stack traces",
+            "Regular Expressions - Regex patterns, exec, match, replace",
+        ],
+        "Advanced": [
+            "Advanced Closures - Module pattern, data privacy",
+            "Event Loop & Microtasks - Execution context, call stack",
+            "Web Workers - Multi-threading in JavaScript",
+            "Memory Leaks - Detecting and preventing memory issues",
+            "Design Patterns - Singleton, Observer, Module pattern",
+            "Advanced Async - Race conditions, concurrent operations",
+        ],
+    },
+    "React": {
+        "full_name": "React & Frontend",
+        "aliases": ["react", "reactjs", "react.js", "react and frontend", "frontend"],
+        "Beginner": [
+            "JSX & Components - Function components, JSX syntax",
+            "Props & State - Component props, useState hook",
+            "Hooks (useState, useEffect) - Managing component lifecycle",
+            "Conditional Rendering - if/else, ternary, logical AND",
+            "Lists & Keys - Rendering lists, key prop importance",
+            "Form Handling - Controlled components, input handling",
+        ],
+        "Intermediate": [
+            "Context API - Creating context, useContext hook",
+            "Custom Hooks - Building reusable hooks, hook rules",
+            "useReducer - Complex state management, reducer pattern",
+            "Performance Optimization - useMemo, useCallback, React.memo",
+            "Code Splitting - Dynamic imports, lazy loading",
+            "Error Boundaries - Error handling in components",
+        ],
+        "Advanced": [
+            "Advanced Patterns - HOC, Render Props, composition",
+            "Server Components - RSC concepts, async components",
+            "Suspense & Lazy Loading - Code splitting, data fetching",
+            "Concurrent Features - Transitions, startTransition",
+            "React Testing - Component testing, hooks testing",
+            "State Management - Redux, Zustand, Jotai integration",
+        ],
+    },
+}
+
+# Curriculum shape for subjects without a catalog; "{subject}" is filled in
+GENERIC_TOPICS = {
+    "Beginner": [
+        "Introduction & Setup - What {subject} is, tools and key terminology",
+        "Core Concepts - The fundamental ideas of {subject}",
+        "Basic Techniques - Essential methods with worked examples",
+        "Common Patterns - Typical problems and how to approach them",
+        "Guided Practice - Small exercises applying the basics",
+        "Mini Project - Combine the fundamentals in one small project",
+    ],
+    "Intermediate": [
+        "Fundamentals Refresher - Quick review of {subject} basics",
+        "Intermediate Concepts - Building on the core ideas of {subject}",
+        "Applied Techniques - Using {subject} on realistic problems",
+        "Problem Solving - Structured approaches and trade-offs",
+        "Tools & Best Practices - Standard tooling and conventions",
+        "Project Work - A medium-sized project end to end",
+    ],
+    "Advanced": [
+        "Advanced Concepts - Deeper theory behind {subject}",
+        "Edge Cases & Pitfalls - Failure modes and how to avoid them",
+        "Performance & Optimization - Measuring and improving results",
+        "Real-World Case Studies - How {subject} is used in practice",
+        "Current Trends - Recent developments and open questions",
+        "Capstone Project - Design and build a complete solution",
+    ],
+}
+
+LEVELS = ["Beginner", "Intermediate", "Advanced"]
+
+# Share of each day spent on (concepts, practice, review)
+LEVEL_SPLIT = {
+    "Beginner": (0.5, 0.35, 0.15),
+    "Intermediate": (0.4, 0.45, 0.15),
+    "Advanced": (0.3, 0.55, 0.15),
+}
+
+REVIEW_EVERY = 7
+
+
+def _normalize(value: str) -> str:
+    value = (value or "").lower().replace("&", " and ")
+    return " ".join(re.sub(r"[^a-z0-9+#.]+", " ", value).split())
+
+
+def find_subject(subject: str) -> Optional[str]:
+    """Catalog key for a free-text subject ("data structures and algos" -> "DSA"), or None."""
+    text = _normalize(subject)
+    if not text:
+        return None
+    for key, entry in CATALOG.items():
+        names = [key, entry["full_name"]] + entry["aliases"]
+        if text in (_normalize(name) for name in names):
+            return key
+    # Partial match: the longest catalog name contained in the subject wins
+    best, best_len = None, 0
+    words = f" {text} "
+    for key, entry in CATALOG.items():
+        for name in [key, entry["full_name"]] + entry["aliases"]:
+            name = _normalize(name)
+            if len(name) > 2 and f" {name} " in words and len(name) > best_len:
+                best, best_len = key, len(name)
+    return best
+
+
+def normalize_level(level: str) -> str:
+    for known in LEVELS:
+        if (level or "").strip().lower() == known.lower():
+            return known
+    return "Beginner"
+
+
+def _split_topic(entry: str) -> Tuple[str, str]:
+    name, _, focus = entry.partition(" - ")
+    return name.strip(), focus.strip()
+
+
+def _label(subject: str) -> str:
+    return (subject or "").strip() or "General Studies"
+
+
+def _topics(subject: str, level: str) -> List[Tuple[str, str]]:
+    key = find_subject(subject)
+    if key:
+        return [_split_topic(t) for t in CATALOG[key][level]]
+    return [_split_topic(t.replace("{subject}", _label(subject))) for t in GENERIC_TOPICS[level]]
+
+
+def _hours_split(level: str, hours: float) -> str:
+    concepts, practice, review = (round(hours * share, 1) for share in LEVEL_SPLIT[level])
+    return f"{concepts}h concepts, {practice}h hands-on practice, {review}h review"
+
+
+def _curriculum(subject: str, level: str, study_days: int) -> List[Tuple[str, str]]:
+    """Topics for the level, extended with the next level's topics when there is time for them."""
+    topics = _topics(subject, level)
+    index = LEVELS.index(level)
+    # More than two days per topic: move on to stretch material rather than stretching thin
+    while study_days > 2 * len(topics) and index + 1 < len(LEVELS):
+        index += 1
+        topics = topics + _topics(subject, LEVELS[index])
+    return topics
+
+
+def _study_sessions(topics: List[Tuple[str, str]], study_days: int) -> List[Tuple[str, str, int, int]]:
+    """(name, focus, part, parts) per study day, grouping or spreading topics over study_days."""
+    if study_days <= 0:
+        return []
+    if study_days < len(topics):
+        sessions = []
+        for i in range(study_days):
+            group = topics[i * len(topics) // study_days:(i + 1) * len(topics) // study_days]
+            sessions.append((" & ".join(n for n, _ in group), "; ".join(f for _, f in group if f), 1, 1))
+        return sessions
+    base, extra = divmod(study_days, len(topics))
+    sessions = []
+    for i, (name, focus) in enumerate(topics):
+        parts = base + (1 if i < extra else 0)
+        sessions.extend((name, focus, part, parts) for part in range(1, parts + 1))
+    return sessions
+
+
+def _session_details(name: str, focus: str, part: int, parts: int, level: str, hours: float) -> str:
+    if parts == 1:
+        step = f"Learn {focus or name}, then solve practice problems on it."
+    elif part == 1:
+        step = f"Introduce {focus or name}: read the core material and work through examples."
+    elif part == parts:
+        step = f"Consolidate {name}: harder exercises and a short self-test."
+    else:
+        step = f"Go deeper into {name}: practice problems and variations."
+    return f"{step} Suggested split: {_hours_split(level, hours)}."
+
+
+def build_plan(subject: str, level: str, days: int, hours_per_day: float, details: bool = True) -> List[Dict]:
+    """A complete plan of ``days`` days; same shape as the AI providers' output."""
+    level = normalize_level(level)
+    days = max(1, int(days))
+    hours = round(float(hours_per_day), 1)
+
+    # Review every REVIEW_EVERY-th day and a final recap, once there is room for them
+    review_days = set()
+    topics = _topics(subject, level)
+    if days > len(topics):
+        review_days = {d for d in range(REVIEW_EVERY, days, REVIEW_EVERY)}
+        review_days.add(days)
+    # Generic curricula name the subject so the topics stand on their own
+    prefix = "" if find_subject(subject) else f"{_label(subject)}: "
+    sessions = _study_sessions(_curriculum(subject, level, days - len(review_days)), days - len(review_days))
+
+    plan = []
+    covered = []
+    for day in range(1, days + 1):
+        if day in review_days:
+            recent = list(dict.fromkeys(covered))[-4:]
+            final = day == days
+            entry = {
+                "day": day,
+                "topic": "Final Review & Recap" if final else "Weekly Review & Practice",
+                "hours": hours,
+            }
+            if details:
+                scope = "everything covered" if final else ", ".join(recent) or "this week's topics"
+                entry["details"] = (f"Revisit {scope}. Redo the hardest exercises, summarize key ideas "
+                                    f"in your own words and note gaps to revisit. "
+                                    f"Suggested split: {_hours_split(level, hours)}.")
+            plan.append(entry)
+            continue
+        name, focus, part, parts = sessions.pop(0)
+        covered.append(name)
+        topic = name if parts == 1 else f"{name} (Part {part}/{parts})"
+        entry = {"day": day, "topic": prefix + topic, "hours": hours}
+        if details:
+            entry["details"] = _session_details(name, focus, part, parts, level, hours)
+        plan.append(entry)
+    return plan
+
+
+def day_details(subject: str, level: str, days: int, day: int, topic: str, hours: float) -> str:
+    """Details for one day; matches build_plan when the topic is the one it planned for that day."""
+    plan = build_plan(subject, level, days, hours)
+    for entry in plan:
+        if entry["day"] == int(day) and entry["topic"] == topic:
+            return entry["details"]
+    level = normalize_level(level)
+    return (f"Study {topic}: read the core material, work through examples and finish with practice "
+            f"problems. Suggested split: {_hours_split(level, round(float(hours), 1))}.")
@@ -0,0 +1,144 @@
+"""
+Login Throttle - Sliding-window limits on login attempts, shared by all workers
+
+Every login attempt costs a password hash, so /api/login is throttled before
+any hashing happens:
+
+- per client IP: at most LOGIN_IP_MAX_FAILURES failed attempts in
+  LOGIN_IP_WINDOW seconds, which caps credential stuffing from one source
+  without locking out busy shared addresses (offices, NAT) whose users sign
+  in successfully;
+- per username and client network (IPv4 /24, IPv6 /64): at most
+  LOGIN_USER_MAX_FAILURES failed attempts in LOGIN_USER_WINDOW seconds, which
+  caps password guessing against one account. Keying on the network as well
+  means failures sent from elsewhere can't lock the owner out of their
+  account. A successful login clears the account's failures from that network.
+
+Attempts are logged in the shared state SQLite file, so the limits hold
+across gunicorn workers on a host.
+"""
+
+import os
+import time
+import ipaddress
+import logging
+import threading
+from typing import Dict, Optional
+
+import shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class LoginThrottled(Exception):
+    """Too many login attempts; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def account_key(ip: str, username: str) -> str:
+    """Per-account throttle key: the normalized username within the client's network."""
+    username = (username or "").strip().lower()
+    if not username:
+        return ""
+    try:
+        address = ipaddress.ip_address(ip)
+        network = ipaddress.ip_network(f"{address}/{24 if address.version == 4 else 64}", strict=False)
+    except ValueError:
+        network = ip or "-"
+    return f"{username}@{network}"
+
+
+class LoginThrottle:
+    """Sliding-window attempt log per IP and per username within a network. Thread-safe."""
+
+    def __init__(self, ip_limit: int = 20, ip_window: float = 60, user_limit: int = 5, user_window: float = 900,
+                 path: str = None):
+        self.ip_limit = ip_limit
+        self.ip_window = ip_window
+        self.user_limit = user_limit
+        self.user_window = user_window
+        self.path = path or shared_state.get_state_db_path()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.blocked = 0
+        conn = shared_state.connect(self.path)
+        conn.execute("CREATE TABLE IF NOT EXISTS login_attempts (scope TEXT NOT NULL, key TEXT NOT NULL, at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS login_attempts_key ON login_attempts (scope, key, at)")
+
+    def _retry_after(self, conn, scope: str, key: str, limit: int, window: float, now: float) -> Optional[float]:
+        """Seconds until the window has room again, or None if it has room now."""
+        if limit <= 0 or not key:
+            return None
+        rows = conn.execute(
+            "SELECT at FROM login_attempts WHERE scope = ? AND key = ? AND at > ? ORDER BY at DESC LIMIT ?",
+            (scope, key, now - window, limit),
+        ).fetchall()
+        if len(rows) < limit:
+            return None
+        # The oldest of the last `limit` attempts has to leave the window
+        return max(1.0, rows[-1][0] + window - now)
+
+    def check(self, ip: str, username: str):
+        """Raise LoginThrottled if this IP, or this username from its network, has too many recent failures."""
+        now = time.time()
+        conn = shared_state.connect(self.path)
+        for scope, key, limit, window in (("ip", ip, self.ip_limit, self.ip_window),
+                                          ("user", account_key(ip, username), self.user_limit, self.user_window)):
+            retry_after = self._retry_after(conn, scope, key, limit, window, now)
+            if retry_after is not None:
+                with self._lock:
+                    self.blocked += 1
+                logger.warning(f"🚫 Login throttled ({scope}: {key})")
+                raise LoginThrottled("Too many login attempts. Please try again later.", retry_after)
+
+    def record_failure(self, ip: str, username: str):
+        now = time.time()
+        conn = shared_state.connect(self.path)
+        rows = [(scope, key, now) for scope, key in (("ip", ip), ("user", account_key(ip, username))) if key]
+        conn.executemany("INSERT INTO login_attempts (scope, key, at) VALUES (?, ?, ?)", rows)
+        self._maybe_prune(conn, now)
+
+    def record_success(self, ip: str, username: str):
+        shared_state.connect(self.path).execute(
+            "DELETE FROM login_attempts WHERE scope = 'user' AND key = ?", (account_key(ip, username),))
+
+    def _maybe_prune(self, conn, now: float):
+        with self._lock:
+            self._writes += 1
+            if self._writes % 100:
+                return
+        conn.execute("DELETE FROM login_attempts WHERE at < ?", (now - max(self.ip_window, self.user_window),))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"blocked": self.blocked}
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle() -> Optional[LoginThrottle]:
+    """Shared throttle, or None when LOGIN_THROTTLE is off or the shared state file is unavailable."""
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                if os.getenv("LOGIN_THROTTLE", "true").lower() in ("0", "false", "no", "off"):
+                    _throttle = False
+                else:
+                    try:
+                        _throttle = LoginThrottle(
+                            ip_limit=int(os.getenv("LOGIN_IP_MAX_FAILURES",
+                                                   os.getenv("LOGIN_IP_MAX_ATTEMPTS", "20"))),
+                            ip_window=float(os.getenv("LOGIN_IP_WINDOW", "60")),
+                            user_limit=int(os.getenv("LOGIN_USER_MAX_FAILURES", "5")),
+                            user_window=float(os.getenv("LOGIN_USER_WINDOW", "900")),
+                        )
+                    except Exception as e:
+                        logger.warning(f"⚠️ Login throttle unavailable: {e}")
+                        _throttle = False
+    return _throttle or None
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+Migrations - Versioned schema changes for SQLite and PostgreSQL
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. Column additions check the live schema first (via
+SQLAlchemy's inspector), and indexes use CREATE INDEX IF NOT EXISTS, so a
+migration is also safe on databases that already have part of it (e.g.
+tables created by db.create_all() from the current models).
+
+Run once per deploy, before the workers start:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending ones
+
+app.py only reports pending migrations at startup (and skips its admin
+user setup until they are applied). AUTO_MIGRATE=true makes it apply them
+itself, which is only safe for a single process.
+
+To change the schema, append a (version, name, function) entry to
+MIGRATIONS and update the models to match. Never edit an applied one;
+migrations spell out their DDL instead of reading it from the models, so
+a fresh database goes through the same steps as an old one.
+"""
+
+import os
+import sys
+import logging
+from datetime import datetime
+from typing import List
+
+from dotenv import load_dotenv
+from flask import Flask
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, JSON, MetaData, String, Table, Text, \
+    inspect, text
+
+from config import get_config
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Serializes concurrent runners on PostgreSQL (pg_advisory_xact_lock key)
+_PG_LOCK_KEY = 727100
+
+
+def _add_column(conn, table: str, column: str, ddl: str, backfill: str = None):
+    if column in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    if backfill is not None:
+        conn.execute(text(f"UPDATE {table} SET {column} = {backfill} WHERE {column} IS NULL"))
+
+
+def _create_index(conn, name: str, table: str, *columns: str, unique: bool = False):
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+# The tables as migration 1 created them, copied from the models of that time. Frozen like the
+# migration itself: later model changes belong in a new migration, never here.
+_BASE_TABLES = MetaData()
+
+Table(
+    "users", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("username", String(80), unique=True, nullable=False),
+    Column("email", String(120), unique=True, nullable=False),
+    Column("password", String(255), nullable=False),
+    Column("is_admin", Boolean, nullable=False),
+    Column("is_active", Boolean, nullable=False),
+    Column("ai_provider", String(50), nullable=False),
+    Column("ai_model", String(100), nullable=False),
+    Column("created_at", DateTime),
+)
+Table(
+    "study_plans", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("subject", String(100), nullable=False),
+    Column("level", String(50), nullable=False),
+    Column("days", Integer, nullable=False),
+    Column("hours_per_day", Float, nullable=False),
+    Column("plan_data", JSON, nullable=False),
+    Column("completion_percentage", Float),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+Table(
+    "user_progress", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("plan_id", Integer, ForeignKey("study_plans.id"), nullable=False),
+    Column("day", Integer, nullable=False),
+    Column("topic", String(255), nullable=False),
+    Column("completed", Boolean),
+    Column("time_spent", Integer),
+    Column("created_at", DateTime),
+)
+Table(
+    "study_notes", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("plan_id", Integer, ForeignKey("study_plans.id"), nullable=False),
+    Column("topic", String(255), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("created_at", DateTime),
+)
+Table(
+    "study_sessions", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("plan_id", Integer, ForeignKey("study_plans.id"), nullable=False),
+    Column("topic", String(255), nullable=False),
+    Column("duration", Integer, nullable=False),
+    Column("completed_at", DateTime),
+)
+Table(
+    "flashcards", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("plan_id", Integer, ForeignKey("study_plans.id"), nullable=False),
+    Column("question", Text, nullable=False),
+    Column("answer", Text, nullable=False),
+    Column("topic", String(255), nullable=False),
+    Column("created_at", DateTime),
+)
+Table(
+    "pomodoro_sessions", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("plan_id", Integer, ForeignKey("study_plans.id"), nullable=False),
+    Column("topic", String(255), nullable=False),
+    Column("focus_duration", Integer),
+    Column("completed", Boolean),
+    Column("created_at", DateTime),
+)
+Table(
+    "study_streaks", _BASE_TABLES,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("current_streak", Integer),
+    Column("longest_streak", Integer),
+    Column("last_study_date", DateTime),
+    Column("updated_at", DateTime),
+)
+Table(
+    "generation_jobs", _BASE_TABLES,
+    Column("id", String(32), primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("kind", String(50), nullable=False),
+    Column("status", String(20), nullable=False),
+    Column("params", JSON, nullable=False),
+    Column("result", JSON),
+    Column("error", Text),
+    Column("progress", Integer),
+    Column("attempts", Integer),
+    Column("created_at", DateTime),
+    Column("started_at", DateTime),
+    Column("finished_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+# token_revocations as migration 5 created it
+_TOKEN_REVOCATIONS = MetaData()
+
+Table(
+    "token_revocations", _TOKEN_REVOCATIONS,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("revoked_at", Float, nullable=False),
+)
+
+
+def _create_tables(conn):
+    """Tables that predate versioned migrations (no-op for existing ones)."""
+    _BASE_TABLES.create_all(conn, checkfirst=True)
+
+
+def _user_columns(conn):
+    """Role, status and AI preference columns (formerly ensure_user_columns, SQLite only)."""
+    _add_column(conn, "users", "is_admin", "BOOLEAN DEFAULT FALSE", backfill="FALSE")
+    _add_column(conn, "users", "is_active", "BOOLEAN DEFAULT TRUE", backfill="TRUE")
+    _add_column(conn, "users", "ai_provider", "VARCHAR(50) DEFAULT 'gemini'")
+    _add_column(conn, "users", "ai_model", "VARCHAR(100) DEFAULT 'gemini-2.0-flash'")
+
+
+def _indexes(conn):
+    """Foreign keys and hot filters; composite indexes also serve lookups on their first column."""
+    _create_index(conn, "ix_users_created_at", "users", "created_at")
+    _create_index(conn, "ix_study_plans_user_id_created_at", "study_plans", "user_id", "created_at")
+    _create_index(conn, "ix_user_progress_plan_id_completed", "user_progress", "plan_id", "completed")
+    _create_index(conn, "ix_study_notes_plan_id", "study_notes", "plan_id")
+    _create_index(conn, "ix_study_sessions_plan_id", "study_sessions", "plan_id")
+    _create_index(conn, "ix_flashcards_plan_id_topic", "flashcards", "plan_id", "topic")
+    _create_index(conn, "ix_pomodoro_sessions_plan_id", "pomodoro_sessions", "plan_id")
+    _create_index(conn, "ix_study_streaks_user_id", "study_streaks", "user_id")
+    _create_index(conn, "ix_generation_jobs_user_id", "generation_jobs", "user_id")
+    _create_index(conn, "ix_generation_jobs_status_created_at", "generation_jobs", "status", "created_at")
+
+
+def _plan_job_id(conn):
+    """Link plans to the background job that created them, so a re-run job cannot save a second plan."""
+    _add_column(conn, "study_plans", "job_id", "VARCHAR(32)")
+    _create_index(conn, "uq_study_plans_job_id", "study_plans", "job_id", unique=True)
+
+
+def _token_revocations(conn):
+    """Revoked access tokens, shared by every worker and host and kept across restarts."""
+    _TOKEN_REVOCATIONS.create_all(conn, checkfirst=True)
+
+
+def _user_lower_indexes(conn):
+    """Expression indexes for the case-insensitive username and email checks."""
+    _create_index(conn, "ix_users_lower_username", "users", "lower(username)")
+    _create_index(conn, "ix_users_lower_email", "users", "lower(email)")
+
+
+def _nullable_ai_preference(conn):
+    """
+    NULL ai_provider/ai_model means "no preference". The old column defaults made an explicit
+    gemini/gemini-2.0-flash choice look the same as never choosing; rows still on them become NULL.
+    """
+    if conn.dialect.name == "sqlite":
+        # SQLite can't alter a column's constraints: rebuild the table (users as of this version)
+        conn.execute(text(
+            "CREATE TABLE users_v7 ("
+            " id INTEGER NOT NULL, username VARCHAR(80) NOT NULL, email VARCHAR(120) NOT NULL,"
+            " password VARCHAR(255) NOT NULL, is_admin BOOLEAN NOT NULL, is_active BOOLEAN NOT NULL,"
+            " ai_provider VARCHAR(50), ai_model VARCHAR(100), created_at DATETIME,"
+            " PRIMARY KEY (id), UNIQUE (username), UNIQUE (email))"
+        ))
+        conn.execute(text(
+            "INSERT INTO users_v7 (id, username, email, password, is_admin, is_active, ai_provider, ai_model,"
+            " created_at) SELECT id, username, email, password, COALESCE(is_admin, FALSE), COALESCE(is_active, TRUE),"
+            " ai_provider, ai_model, created_at FROM users"
+        ))
+        conn.execute(text("DROP TABLE users"))
+        conn.execute(text("ALTER TABLE users_v7 RENAME TO users"))
+        _create_index(conn, "ix_users_created_at", "users", "created_at")
+        _user_lower_indexes(conn)
+    else:
+        for column in ("ai_provider", "ai_model"):
+            conn.execute(text(f"ALTER TABLE users ALTER COLUMN {column} DROP NOT NULL"))
+            conn.execute(text(f"ALTER TABLE users ALTER COLUMN {column} DROP DEFAULT"))
+    conn.execute(text("UPDATE users SET ai_provider = NULL, ai_model = NULL"
+                      " WHERE ai_provider = 'gemini' AND ai_model = 'gemini-2.0-flash'"))
+
+
+MIGRATIONS = [
+    (1, "create base tables", _create_tables),
+    (2, "user role, status and AI preference columns", _user_columns),
+    (3, "foreign key and filter indexes", _indexes),
+    (4, "study plan job id", _plan_job_id),
+    (5, "token revocations", _token_revocations),
+    (6, "case-insensitive user lookup indexes", _user_lower_indexes),
+    (7, "nullable AI preference columns", _nullable_ai_preference),
+]
+
+
+def _ensure_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def _applied(conn) -> set:
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def pending_migrations(engine) -> List[tuple]:
+    """Migrations not yet applied to this database."""
+    if not inspect(engine).has_table("schema_migrations"):
+        return list(MIGRATIONS)
+    with engine.connect() as conn:
+        applied = _applied(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def run_migrations(engine) -> List[int]:
+    """Apply pending migrations in order; returns the versions applied by this call."""
+    _ensure_table(engine)
+    done = []
+    for version, name, migrate in MIGRATIONS:
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+            # Re-checked under the lock: another runner may have just applied it
+            if version in _applied(conn):
+                continue
+            logger.info(f"🗄️ Applying migration {version}: {name}")
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                         {"v": version, "n": name, "t": datetime.utcnow()})
+        done.append(version)
+    return done
+
+
+def cli_app():
+    """Minimal app for CLI scripts: database config only, none of app.py's routes or startup work."""
+    load_dotenv(override=True)
+    app = Flask(__name__)
+    app.config.from_object(get_config(os.getenv("FLASK_ENV", "production")))
+    db.init_app(app)
+    return app
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    logging.basicConfig(level=logging.INFO)
+    app = cli_app()
+    with app.app_context():
+        engine = db.engine
+        if "--status" in argv:
+            pending = {m[0] for m in pending_migrations(engine)}
+            print(f"🗄️ Database: {engine.url.render_as_string(hide_password=True)}")
+            for version, name, _ in MIGRATIONS:
+                print(f"   {'⏳ pending' if version in pending else '✅ applied'}  {version:>3}  {name}")
+            return 0
+        applied = run_migrations(engine)
+        print(f"✅ Applied migrations: {', '.join(map(str, applied))}" if applied else "✅ Schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
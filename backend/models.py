@@ -1,12 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import get_password_hasher
 
 db = SQLAlchemy()
 
+# Indexes are declared here for db.create_all(); existing databases get them from migrations.py
+
 class User(db.Model):
     """User model"""
     __tablename__ = 'users'
+    __table_args__ = (db.Index('ix_users_created_at', 'created_at'),)
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -14,23 +17,34 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
-    ai_provider = db.Column(db.String(50), default='gemini', nullable=False)
-    ai_model = db.Column(db.String(100), default='gemini-2.0-flash', nullable=False)
+    # Saved AI preference; NULL means none, use the routed default
+    ai_provider = db.Column(db.String(50))
+    ai_model = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     plans = db.relationship('StudyPlan', backref='user', lazy=True, cascade='all, delete-orphan')
     streak = db.relationship('StudyStreak', backref='user', lazy=True, cascade='all, delete-orphan', uselist=False)
+    jobs = db.relationship('GenerationJob', backref='user', lazy=True, cascade='all, delete-orphan')
     
+    # Hashing runs in the password pool; both raise passwords.HashPoolBusy when it is saturated
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = get_password_hasher().hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return get_password_hasher().verify(self.password, password)
+
+# Case-insensitive username/email lookups (register and bulk import)
+db.Index('ix_users_lower_username', db.func.lower(User.username))
+db.Index('ix_users_lower_email', db.func.lower(User.email))
 
 class StudyPlan(db.Model):
     """Study plan model"""
     __tablename__ = 'study_plans'
+    __table_args__ = (
+        db.Index('ix_study_plans_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('uq_study_plans_job_id', 'job_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -40,6 +54,7 @@ class StudyPlan(db.Model):
     hours_per_day = db.Column(db.Float, nullable=False)
     plan_data = db.Column(db.JSON, nullable=False)
     completion_percentage = db.Column(db.Float, default=0)
+    job_id = db.Column(db.String(32))  # GenerationJob that created it; at most one plan per job
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -53,6 +68,7 @@ class StudyPlan(db.Model):
 class UserProgress(db.Model):
     """Track progress on topics"""
     __tablename__ = 'user_progress'
+    __table_args__ = (db.Index('ix_user_progress_plan_id_completed', 'plan_id', 'completed'),)
     
     id = db.Column(db.Integer, primary_key=True)
     plan_id = db.Column(db.Integer, db.ForeignKey('study_plans.id'), nullable=False)
@@ -65,6 +81,7 @@ class UserProgress(db.Model):
 class StudyNotes(db.Model):
     """Store study notes"""
     __tablename__ = 'study_notes'
+    __table_args__ = (db.Index('ix_study_notes_plan_id', 'plan_id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     plan_id = db.Column(db.Integer, db.ForeignKey('study_plans.id'), nullable=False)
@@ -75,6 +92,7 @@ class StudyNotes(db.Model):
 class StudySession(db.Model):
     """Track study sessions"""
     __tablename__ = 'study_sessions'
+    __table_args__ = (db.Index('ix_study_sessions_plan_id', 'plan_id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     plan_id = db.Column(db.Integer, db.ForeignKey('study_plans.id'), nullable=False)
@@ -85,6 +103,7 @@ class StudySession(db.Model):
 class Flashcard(db.Model):
     """Study flashcards"""
     __tablename__ = 'flashcards'
+    __table_args__ = (db.Index('ix_flashcards_plan_id_topic', 'plan_id', 'topic'),)
     
     id = db.Column(db.Integer, primary_key=True)
     plan_id = db.Column(db.Integer, db.ForeignKey('study_plans.id'), nullable=False)
@@ -96,6 +115,7 @@ class Flashcard(db.Model):
 class PomodoroSession(db.Model):
     """Track Pomodoro sessions (25 min focus + 5 min break)"""
     __tablename__ = 'pomodoro_sessions'
+    __table_args__ = (db.Index('ix_pomodoro_sessions_plan_id', 'plan_id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     plan_id = db.Column(db.Integer, db.ForeignKey('study_plans.id'), nullable=False)
@@ -107,6 +127,7 @@ class PomodoroSession(db.Model):
 class StudyStreak(db.Model):
     """Track study streaks"""
     __tablename__ = 'study_streaks'
+    __table_args__ = (db.Index('ix_study_streaks_user_id', 'user_id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -114,3 +135,32 @@ class StudyStreak(db.Model):
     longest_streak = db.Column(db.Integer, default=0)
     last_study_date = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class GenerationJob(db.Model):
+    """Background AI generation job (async plan generation)"""
+    __tablename__ = 'generation_jobs'
+    __table_args__ = (
+        db.Index('ix_generation_jobs_user_id', 'user_id'),
+        db.Index('ix_generation_jobs_status_created_at', 'status', 'created_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, succeeded, failed
+    params = db.Column(db.JSON, nullable=False)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    progress = db.Column(db.Integer, default=0)  # percent
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TokenRevocation(db.Model):
+    """Access tokens issued to the user before revoked_at are rejected (see auth_tokens)"""
+    __tablename__ = 'token_revocations'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    revoked_at = db.Column(db.Float, nullable=False)  # unix time, compared with the token's iat
@@ -0,0 +1,181 @@
+"""
+Passwords - Password hashing off the request workers
+
+Werkzeug's scrypt hashes deliberately cost tens of milliseconds of CPU. Done
+inline, a burst of logins (or a credential-stuffing run) occupies every
+request worker. Hashing and verification instead run in a small process pool
+per worker process (AUTH_HASH_WORKERS), with at most AUTH_HASH_MAX_PENDING
+operations in progress; beyond that HashPoolBusy is raised at once and the
+route answers 503 rather than letting logins starve the rest of the API. A
+slot stays taken until its hash finishes, even if the caller gave up
+waiting, and bulk hashing (hash_many) waits for slots instead of bypassing
+them.
+
+PASSWORD_HASH_METHOD takes any Werkzeug method string ("scrypt",
+"scrypt:65536:8:1", "pbkdf2:sha256:1000000"). Hashes made with other
+parameters are reported by needs_rehash() and upgraded on the next login.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashPoolBusy(Exception):
+    """Too many password hashes in progress; try again shortly."""
+
+    def __init__(self, message: str = "Server busy, please try again shortly.", retry_after: float = 2):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash: str, password: str) -> bool:
+    return check_password_hash(password_hash, password)
+
+
+def _method_prefix(method: str) -> str:
+    """The method string Werkzeug stores in a hash, with its default parameters filled in."""
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2" and len(args) <= 2:
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method '{method}'.")
+
+
+class PasswordHasher:
+    """Bounded process pool for password hashing. workers=0 hashes in the calling thread."""
+
+    def __init__(self, method: str = "scrypt", workers: int = 2, max_pending: int = 16, timeout: float = 10):
+        self.method = method
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid = None
+        self._prefix = _method_prefix(method)
+        self.rejected = 0
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if not self.workers:
+            return None
+        with self._lock:
+            # Created lazily, and again after a fork, so each gunicorn worker owns its pool
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _submit(self, pool: ProcessPoolExecutor, fn, *args) -> Future:
+        """Submit with a slot already taken; the slot is released when the hash finishes."""
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            logger.warning("⚠️ Password hash pool saturated; rejecting request")
+            raise HashPoolBusy()
+        try:
+            pool = self._executor()
+        except BaseException:
+            self._slots.release()
+            raise
+        if pool is None:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        future = self._submit(pool, fn, *args)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # The hash keeps its slot until it completes, so timeouts can't oversubscribe the pool
+            raise HashPoolBusy()
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        if not password_hash or password is None:
+            return False
+        return self._run(_verify, password_hash, password)
+
+    def hash_many(self, passwords: List[str]) -> List[str]:
+        """
+        Hash a batch across the pool (bulk imports). Shares max_pending with logins,
+        waiting for free slots rather than failing, and takes at most half of them.
+        """
+        pool = self._executor()
+        if pool is None:
+            return [_hash(p, self.method) for p in passwords]
+        share = threading.BoundedSemaphore(max(1, self.max_pending // 2))
+        futures = []
+        for password in passwords:
+            share.acquire()
+            self._slots.acquire()
+            try:
+                future = self._submit(pool, _hash, password, self.method)
+            except BaseException:
+                share.release()
+                raise
+            future.add_done_callback(lambda _: share.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True if the hash was made with a different method or parameters than the current ones."""
+        return (password_hash or "").split("$", 1)[0] != self._prefix
+
+    def stats(self) -> Dict:
+        return {
+            "method": self.method,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    method=os.getenv("PASSWORD_HASH_METHOD", "scrypt"),
+                    workers=int(os.getenv("AUTH_HASH_WORKERS", "2")),
+                    max_pending=int(os.getenv("AUTH_HASH_MAX_PENDING", "16")),
+                    timeout=float(os.getenv("AUTH_HASH_TIMEOUT", "10")),
+                )
+    return _hasher
@@ -0,0 +1,203 @@
+"""
+Provider Rate Limiting - Quota-aware token buckets shared by all workers
+
+Each (provider, model) gets one token bucket per published limit, e.g. Groq's
+30 requests/minute and 14,400 requests/day. Bucket state lives in the shared
+state SQLite file, so every gunicorn worker draws from the same quota.
+
+acquire() takes one token from every bucket of a provider/model. If a bucket
+is empty it waits (briefly) for the refill instead of failing; if the wait
+would exceed the caller's deadline it raises RateLimited so the caller can
+spill over to another provider. A 429 with Retry-After blocks the buckets
+for that long.
+
+Limits (AI_RATE_LIMITS) use the format "provider=30/m,14400/d;other=15/m".
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import shared_state
+
+logger = logging.getLogger(__name__)
+
+# Published free-tier limits; ollama is local and unlimited
+DEFAULT_LIMITS = "groq=30/m,14400/d;gemini=15/m,1500/d;huggingface=60/m"
+
+_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class RateLimited(Exception):
+    """No quota for this provider within the allowed wait."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_limits(spec: str) -> Dict[str, List[Tuple[str, float, float]]]:
+    """Parse a limit spec into {provider: [(period_name, capacity, refill_per_second)]}."""
+    limits = {}
+    for part in (spec or "").split(";"):
+        if "=" not in part:
+            continue
+        provider, rules = part.split("=", 1)
+        parsed = []
+        for rule in rules.split(","):
+            rule = rule.strip()
+            if "/" not in rule:
+                continue
+            count, period = rule.split("/", 1)
+            period = period.strip().lower()
+            if period not in _PERIODS:
+                continue
+            capacity = float(count)
+            parsed.append((period, capacity, capacity / _PERIODS[period]))
+        if parsed:
+            limits[provider.strip().lower()] = parsed
+    return limits
+
+
+class TokenBucketLimiter:
+    """Token buckets per provider/model stored in SQLite; safe across threads and processes."""
+
+    def __init__(self, limits: Dict[str, List[Tuple[str, float, float]]], path: str = None,
+                 default_penalty: float = 30):
+        self.limits = limits
+        self.path = path or shared_state.get_state_db_path()
+        self.default_penalty = default_penalty
+        self.waits = 0
+        self.rejections = 0
+        self._lock = threading.Lock()
+        shared_state.connect(self.path).execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " bucket TEXT PRIMARY KEY, tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL, blocked_until REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _buckets(self, provider: str, model: Optional[str]):
+        return [
+            (f"{provider}:{model or 'default'}:{period}", capacity, rate)
+            for period, capacity, rate in self.limits.get(provider, [])
+        ]
+
+    def _try_take(self, buckets) -> float:
+        """Take one token from every bucket atomically. Returns 0 on success, else seconds to wait."""
+        conn = shared_state.connect(self.path)
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            states = []
+            wait = 0.0
+            for bucket, capacity, rate in buckets:
+                row = conn.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM rate_buckets WHERE bucket = ?",
+                    (bucket,),
+                ).fetchone()
+                tokens, updated_at, blocked_until = row if row else (capacity, now, 0.0)
+                tokens = min(capacity, tokens + (now - updated_at) * rate)
+                if blocked_until > now:
+                    wait = max(wait, blocked_until - now)
+                elif tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                states.append((bucket, tokens, blocked_until))
+
+            if wait == 0:
+                for bucket, tokens, blocked_until in states:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO rate_buckets (bucket, tokens, updated_at, blocked_until)"
+                        " VALUES (?, ?, ?, ?)",
+                        (bucket, tokens - 1, now, blocked_until),
+                    )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self, provider: str, model: Optional[str] = None, max_wait: float = 0):
+        """Take one request's worth of quota, queueing up to max_wait seconds. Raises RateLimited."""
+        buckets = self._buckets(provider, model)
+        if not buckets:
+            return
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            wait = self._try_take(buckets)
+            if wait == 0:
+                if waited:
+                    with self._lock:
+                        self.waits += 1
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                with self._lock:
+                    self.rejections += 1
+                raise RateLimited(f"{provider} rate limit reached", retry_after=wait)
+            waited = True
+            time.sleep(wait)
+
+    def penalize(self, provider: str, model: Optional[str] = None, retry_after: float = None):
+        """Block a provider/model after an upstream 429, honouring Retry-After when given."""
+        buckets = self._buckets(provider, model)
+        if not buckets:
+            return
+        blocked_until = time.time() + (retry_after if retry_after is not None else self.default_penalty)
+        conn = shared_state.connect(self.path)
+        for bucket, capacity, rate in buckets:
+            conn.execute(
+                "INSERT INTO rate_buckets (bucket, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(bucket) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                (bucket, capacity, time.time(), blocked_until),
+            )
+        logger.warning(f"⚠️ {provider} rate limited upstream; blocked for {blocked_until - time.time():.0f}s")
+
+    def snapshot(self) -> Dict:
+        rows = shared_state.connect(self.path).execute(
+            "SELECT bucket, tokens, updated_at, blocked_until FROM rate_buckets"
+        ).fetchall()
+        now = time.time()
+        rates = {}
+        for provider, rules in self.limits.items():
+            for period, capacity, rate in rules:
+                rates[(provider, period)] = (capacity, rate)
+        buckets = {}
+        for bucket, tokens, updated_at, blocked_until in rows:
+            # bucket = "provider:model:period"; model names may contain ":" (e.g. llama2:13b)
+            provider, period = bucket.split(":", 1)[0], bucket.rsplit(":", 1)[1]
+            capacity, rate = rates.get((provider, period), (tokens, 0))
+            buckets[bucket] = {
+                "tokens": round(min(capacity, tokens + (now - updated_at) * rate), 2),
+                "capacity": capacity,
+                "blocked_for": round(max(0.0, blocked_until - now), 1),
+            }
+        with self._lock:
+            return {"buckets": buckets, "queued_waits": self.waits, "rejections": self.rejections}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[TokenBucketLimiter]:
+    """Shared limiter configured by AI_RATE_LIMITS, or None if disabled/unavailable."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                spec = os.getenv("AI_RATE_LIMITS", DEFAULT_LIMITS).strip()
+                if spec.lower() in ("", "none", "off"):
+                    _limiter = False
+                else:
+                    try:
+                        _limiter = TokenBucketLimiter(
+                            parse_limits(spec),
+                            default_penalty=float(os.getenv("AI_RATE_LIMIT_PENALTY", "30")),
+                        )
+                    except Exception as e:
+                        logger.warning(f"⚠️ Rate limiter unavailable: {e}")
+                        _limiter = False
+    return _limiter or None
@@ -0,0 +1,266 @@
+"""
+Semantic Plan Cache - Reuse plans generated for differently worded subjects
+
+Exact-key caching only helps when a subject is typed the same way twice.
+"DSA", "Data Structures & Algorithms" and "data structures and algos" are
+the same request in practice, so generated plans are also indexed by
+subject similarity: character n-gram TF-IDF vectors compared by cosine.
+
+A request reuses an indexed plan when level, day count, plan mode and
+provider identity match, hours per day are within
+AI_SEMANTIC_CACHE_HOURS_TOLERANCE hours, the subject is at least
+AI_SEMANTIC_CACHE_THRESHOLD similar, and both subjects name the same thing
+(same_subject). Similarity alone is not enough: "Inorganic Chemistry" and
+"Organic Chemistry", or "React Native" and "React", share most n-grams.
+The reused plan is adapted to the requested hours. Subjects matching a
+local_planner catalog also carry the catalog name, so abbreviations land
+near their full names.
+
+The index rows live in the shared state SQLite file (every worker sees
+every plan); each worker keeps its own NumPy matrix, rebuilt when the
+table changes. Requires numpy; without it the cache is disabled.
+"""
+
+import os
+import re
+import time
+import zlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import shared_state
+import local_planner
+from ai_cache import normalize_text
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+# Words that do not change what a subject is about
+_STOPWORDS = {"a", "an", "and", "for", "in", "of", "on", "the", "to", "with"}
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _signature(text: str) -> Tuple[str, ...]:
+    """Sorted content words of a subject: lower case, "&" as "and", plurals stripped."""
+    words = re.sub(r"[^a-z0-9+#.]+", " ", normalize_text(text).replace("&", " and ")).split()
+    return tuple(sorted({_stem(w) for w in words if w not in _STOPWORDS}))
+
+
+def _same_words(a: Tuple[str, ...], b: Tuple[str, ...]) -> bool:
+    """Same words, allowing abbreviations by prefix ("algo" ~ "algorithm") of at least 4 letters."""
+    if len(a) != len(b):
+        return False
+    remaining = list(b)
+    for word in a:
+        match = next((other for other in remaining if other == word or (
+            min(len(word), len(other)) >= 4 and (other.startswith(word) or word.startswith(other)))), None)
+        if match is None:
+            return False
+        remaining.remove(match)
+    return True
+
+
+def _canonical_names(key: str) -> List[Tuple[str, ...]]:
+    """Signatures that name a whole catalog entry: its key and full name (and aliases spelling those)."""
+    entry = local_planner.CATALOG[key]
+    canonical = {_signature(key), _signature(entry["full_name"])}
+    return sorted(canonical | {_signature(alias) for alias in entry["aliases"] if _signature(alias) in canonical})
+
+
+def same_subject(a: str, b: str) -> bool:
+    """
+    True if two subjects ask for the same plan. A subject in the local_planner
+    catalog only matches subjects of the same catalog entry, and the words must
+    agree: the subject's own words, or for the entry's key or full name ("DSA",
+    "Data Structures & Algorithms") either of those. Narrower aliases
+    ("algorithms") only match their own words, so a plan for part of an entry
+    is never served for another part or for the whole.
+    """
+    key_a, key_b = local_planner.find_subject(a), local_planner.find_subject(b)
+    if key_a != key_b:
+        return False
+
+    def signatures(subject, key):
+        own = _signature(subject)
+        if key and own in _canonical_names(key):
+            return _canonical_names(key)
+        return [own]
+
+    return any(_same_words(x, y) for x in signatures(a, key_a) for y in signatures(b, key_b))
+
+
+class SemanticPlanIndex:
+    """Similarity index over cached plans' subjects. Thread-safe."""
+
+    # Hashed n-gram feature space; small enough that a few thousand plans fit in a few MB
+    DIMENSIONS = 1024
+    NGRAMS = (3, 4)
+
+    def __init__(self, path: str = None, threshold: float = 0.8, hours_tolerance: float = 0.5,
+                 max_entries: int = 2000, refresh_interval: float = 5):
+        if np is None:
+            raise ImportError("numpy is required for the semantic plan cache")
+        self.path = path or shared_state.get_state_db_path()
+        self.threshold = threshold
+        self.hours_tolerance = hours_tolerance
+        self.max_entries = max(1, max_entries)
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._rows: List[Tuple] = []
+        self._matrix = None
+        self._idf = None
+        self.lookups = 0
+        self.hits = 0
+        shared_state.connect(self.path).execute(
+            "CREATE TABLE IF NOT EXISTS ai_plan_index ("
+            " key TEXT PRIMARY KEY, subject TEXT NOT NULL, level TEXT NOT NULL, days INTEGER NOT NULL,"
+            " hours REAL NOT NULL, identity TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def subject_text(subject: str) -> str:
+        """Normalized subject, extended with its catalog names when it matches one."""
+        text = normalize_text(subject)
+        key = local_planner.find_subject(subject)
+        if key:
+            text = f"{text} | {normalize_text(key)} {normalize_text(local_planner.CATALOG[key]['full_name'])}"
+        return text
+
+    def _features(self, text: str):
+        padded = f" {text} "
+        counts = np.zeros(self.DIMENSIONS, dtype=np.float32)
+        for n in self.NGRAMS:
+            for i in range(len(padded) - n + 1):
+                counts[zlib.crc32(padded[i:i + n].encode("utf-8")) % self.DIMENSIONS] += 1
+        return counts
+
+    def _refresh(self):
+        """Rebuild the matrix if another worker (or this one) changed the index. Caller holds the lock."""
+        now = time.monotonic()
+        if self._matrix is not None and now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        conn = shared_state.connect(self.path)
+        version = conn.execute("SELECT COUNT(*), MAX(created_at) FROM ai_plan_index").fetchone()
+        if version == self._version and self._matrix is not None:
+            return
+        rows = conn.execute("SELECT key, subject, level, days, hours, identity FROM ai_plan_index").fetchall()
+        tf = np.zeros((len(rows), self.DIMENSIONS), dtype=np.float32)
+        for i, row in enumerate(rows):
+            tf[i] = self._features(self.subject_text(row[1]))
+        df = (tf > 0).sum(axis=0)
+        self._idf = (np.log((1 + len(rows)) / (1 + df)) + 1).astype(np.float32)
+        weighted = tf * self._idf
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        self._matrix = weighted / np.maximum(norms, 1e-9)
+        self._rows = rows
+        self._version = version
+
+    def lookup(self, subject: str, level: str, days: int, hours_per_day: float,
+               identity: str) -> Optional[Tuple[str, float]]:
+        """(cache key, similarity) of the closest indexed plan for this request, or None."""
+        with self._lock:
+            self.lookups += 1
+            self._refresh()
+            if not self._rows:
+                return None
+            level = normalize_text(level)
+            hours = float(hours_per_day)
+            mask = np.array([
+                row[2] == level and row[3] == int(days) and row[5] == identity
+                and abs(row[4] - hours) <= self.hours_tolerance + 1e-9
+                for row in self._rows
+            ])
+            if not mask.any():
+                return None
+            query = self._features(self.subject_text(subject)) * self._idf
+            query /= max(float(np.linalg.norm(query)), 1e-9)
+            scores = np.where(mask, self._matrix @ query, -1.0)
+            for best in np.argsort(-scores):
+                if scores[best] < self.threshold:
+                    break
+                if same_subject(subject, self._rows[best][1]):
+                    return self._rows[best][0], float(scores[best])
+            return None
+
+    def add(self, key: str, subject: str, level: str, days: int, hours_per_day: float, identity: str):
+        conn = shared_state.connect(self.path)
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_plan_index (key, subject, level, days, hours, identity, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, subject, normalize_text(level), int(days), float(hours_per_day), identity, time.time()),
+        )
+        conn.execute(
+            "DELETE FROM ai_plan_index WHERE key IN ("
+            " SELECT key FROM ai_plan_index ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        with self._lock:
+            self._checked_at = 0.0  # pick up our own write on the next lookup
+
+    def remove(self, key: str):
+        """Drop an entry whose plan is no longer in the response cache."""
+        shared_state.connect(self.path).execute("DELETE FROM ai_plan_index WHERE key = ?", (key,))
+        with self._lock:
+            self._checked_at = 0.0
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._rows),
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "llm_calls_saved": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0,
+            }
+
+
+def adapt_plan(plan: List[Dict], hours_per_day: float) -> List[Dict]:
+    """A cached plan with each day's hours set to the requested hours_per_day."""
+    hours = round(float(hours_per_day), 1)
+    return [dict(day, hours=hours) if isinstance(day, dict) and "hours" in day else day for day in plan]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_semantic_index() -> Optional[SemanticPlanIndex]:
+    """Shared index, or None when AI_SEMANTIC_CACHE is off, numpy is missing or caching is disabled."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                enabled = os.getenv("AI_SEMANTIC_CACHE", "true").lower() not in ("0", "false", "no", "off")
+                cache_off = os.getenv("AI_CACHE_BACKEND", "sqlite").strip().lower() in ("none", "off", "disabled")
+                if not enabled or cache_off:
+                    _index = False
+                elif np is None:
+                    logger.info("numpy not installed; semantic plan cache disabled")
+                    _index = False
+                else:
+                    try:
+                        _index = SemanticPlanIndex(
+                            threshold=float(os.getenv("AI_SEMANTIC_CACHE_THRESHOLD", "0.8")),
+                            hours_tolerance=float(os.getenv("AI_SEMANTIC_CACHE_HOURS_TOLERANCE", "0.5")),
+                            max_entries=int(os.getenv("AI_SEMANTIC_CACHE_MAX_ENTRIES", "2000")),
+                        )
+                    except Exception as e:
+                        logger.warning(f"⚠️ Semantic plan cache unavailable: {e}")
+                        _index = False
+    return _index or None
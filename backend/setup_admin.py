@@ -9,15 +9,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from models import db, User
-from app import create_app
+from auth_cache import invalidate_principal
+from migrations import cli_app, run_migrations
+from auth_tokens import revoke_user_tokens
 
 def setup_admin():
-    app = create_app()
+    app = cli_app()
     
     with app.app_context():
-        # Create all tables
-        print("📦 Creating database tables...")
-        db.create_all()
+        # Create tables and apply schema changes
+        print("📦 Migrating database...")
+        run_migrations(db.engine)
         print("✅ Database tables ready")
         
         # Admin credentials from environment
@@ -43,6 +45,8 @@ def setup_admin():
                 print(f"\n⚠️  Updating admin status...")
                 admin_user.is_admin = True
                 db.session.commit()
+                invalidate_principal(admin_user.id)
+                revoke_user_tokens(admin_user.id)
                 print(f"✅ Admin status updated!")
         else:
             # Create admin user
@@ -0,0 +1,42 @@
+"""
+Shared State - SQLite file shared by all gunicorn workers on a host
+
+The AI layer keeps small pieces of cross-worker state (response cache,
+counters, locks) in a local SQLite file next to the app database. Each
+thread gets its own connection; WAL mode lets readers and writers in
+different processes proceed without blocking each other.
+"""
+
+import os
+import sqlite3
+import threading
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_local = threading.local()
+
+
+def get_state_db_path() -> str:
+    """Path of the shared state file (AI_STATE_DB, default: instance/ai_state.db)."""
+    path = os.getenv("AI_STATE_DB", "").strip()
+    if not path:
+        path = os.path.join(_BACKEND_DIR, "instance", "ai_state.db")
+    return path
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """Return this thread's connection to the shared state file, opening it on first use."""
+    path = path or get_state_db_path()
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; callers open explicit transactions when they need them
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+    return conn
@@ -0,0 +1,261 @@
+"""
+Single-Flight - Coalesce identical in-flight AI generations
+
+When many users ask for the same plan or flashcards at once, only one
+upstream LLM call should run. Within a process, callers with the same key
+wait on the first caller (the leader) and receive its result or error.
+
+Across gunicorn workers, the leader also takes a lease row in the shared
+state SQLite file. A leader in another worker that finds the lease taken
+does not call the provider; it polls the shared response cache (via the
+caller's ``fetch``) until the lease owner has stored the result. If the
+lease owner dies or the lease expires without a result, the waiter takes
+over and generates itself.
+
+Waiting is bounded by the caller's request deadline (see deadlines): a
+waiter whose deadline passes, or whose client disconnects, stops with
+DeadlineExceeded. A leader that stops that way abandons the flight, so the
+other waiters retry under their own deadlines instead of sharing its error.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+import shared_state
+from deadlines import DeadlineExceeded, cap_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Per-key call coalescing, in-process with a cross-worker lease. Thread-safe."""
+
+    def __init__(self, path: str = None, lease_ttl: float = 180, poll_interval: float = 0.25):
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.path = path
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced_local": 0, "coalesced_remote": 0, "takeovers": 0}
+        try:
+            self.path = path or shared_state.get_state_db_path()
+            shared_state.connect(self.path).execute(
+                "CREATE TABLE IF NOT EXISTS ai_flights ("
+                " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Cross-worker single-flight unavailable, coalescing in-process only: {e}")
+            self.path = None
+
+    # ---- in-process ----
+
+    def _join(self, key: str):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self._counters["coalesced_local"] += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self._counters["leaders"] += 1
+            return flight, True
+
+    def _finish(self, key: str, flight: _Flight, result=None, error: Exception = None, abandoned=False):
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.result, flight.error, flight.abandoned = result, error, abandoned
+        flight.done.set()
+
+    def _wait(self, flight: _Flight):
+        """Wait for the leader, giving up with DeadlineExceeded when the caller's deadline passes."""
+        try:
+            while not flight.done.wait(cap_timeout(self.poll_interval)):
+                pass
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+
+    def _incr(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    # ---- cross-worker lease ----
+
+    def _try_lease(self, key: str, owner: str) -> bool:
+        now = time.time()
+        cursor = shared_state.connect(self.path).execute(
+            "INSERT INTO ai_flights (key, owner, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE ai_flights.expires_at < ?",
+            (key, owner, now + self.lease_ttl, now),
+        )
+        return cursor.rowcount > 0
+
+    def _lease_held(self, key: str) -> bool:
+        row = shared_state.connect(self.path).execute(
+            "SELECT expires_at FROM ai_flights WHERE key = ?", (key,)
+        ).fetchone()
+        return bool(row) and row[0] >= time.time()
+
+    def _release(self, key: str, owner: str):
+        try:
+            shared_state.connect(self.path).execute(
+                "DELETE FROM ai_flights WHERE key = ? AND owner = ?", (key, owner))
+        except Exception as e:
+            logger.warning(f"⚠️ Could not release single-flight lease: {e}")
+
+    def _acquire_or_fetch(self, key: str, fetch: Optional[Callable]):
+        """
+        Returns (owner, None) once this worker holds the lease, or (None, result)
+        when another worker's leader produced the result first.
+        """
+        if fetch is None or self.path is None:
+            return None, None
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        counted = False
+        while True:
+            try:
+                if self._try_lease(key, owner):
+                    if counted:
+                        self._incr("takeovers")
+                    return owner, None
+            except Exception as e:
+                logger.warning(f"⚠️ Single-flight lease failed, generating without it: {e}")
+                return None, None
+            if not counted:
+                counted = True
+                self._incr("coalesced_remote")
+            # Another worker is generating: wait for its result to land in the shared cache
+            while True:
+                result = fetch()
+                if result:
+                    return None, result
+                if not self._lease_held(key):
+                    break  # Owner finished without a result, or died; try to take over
+                time.sleep(cap_timeout(self.poll_interval))
+
+    # ---- public API ----
+
+    def run(self, key: str, fn: Callable, fetch: Optional[Callable] = None):
+        """
+        Return fn(), sharing one execution among concurrent callers with the same key.
+
+        ``fetch`` reads a finished result from shared storage (the response cache);
+        it enables cross-worker coalescing and must see what fn() stores there.
+        """
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            self._wait(flight)
+            if flight.abandoned:
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        owner = None
+        try:
+            owner, result = self._acquire_or_fetch(key, fetch)
+            if not result:
+                result = fn()
+        except DeadlineExceeded:
+            # This caller ran out of time; waiters may still have some
+            self._finish(key, flight, abandoned=True)
+            raise
+        except Exception as e:
+            self._finish(key, flight, error=e)
+            raise
+        except BaseException:
+            self._finish(key, flight, abandoned=True)
+            raise
+        finally:
+            if owner:
+                self._release(key, owner)
+        self._finish(key, flight, result=result)
+        return result
+
+    def stream(self, key: str, make_stream: Callable[[], Iterator], fetch: Optional[Callable] = None) -> Iterator:
+        """
+        Streaming run(): the leader yields items as they arrive; coalesced callers
+        receive the complete list once the leader has finished.
+        """
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            self._wait(flight)
+            if flight.abandoned:
+                continue
+            if flight.error is not None:
+                raise flight.error
+            yield from flight.result
+            return
+
+        owner = None
+        items = []
+        try:
+            owner, result = self._acquire_or_fetch(key, fetch)
+            if result:
+                items = list(result)
+                yield from items
+            else:
+                for item in make_stream():
+                    items.append(item)
+                    yield item
+        except DeadlineExceeded:
+            self._finish(key, flight, abandoned=True)
+            raise
+        except Exception as e:
+            self._finish(key, flight, error=e)
+            raise
+        except BaseException:
+            # Client went away mid-stream: let a waiter generate instead of sharing a partial result
+            self._finish(key, flight, abandoned=True)
+            raise
+        finally:
+            if owner:
+                self._release(key, owner)
+        self._finish(key, flight, result=items)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                coalesced=self._counters["coalesced_local"] + self._counters["coalesced_remote"],
+                in_flight=len(self._flights),
+                waiting=sum(f.waiters for f in self._flights.values()),
+            )
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Shared coalescer, or None when AI_SINGLE_FLIGHT is disabled."""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                if os.getenv("AI_SINGLE_FLIGHT", "true").lower() in ("0", "false", "no", "off"):
+                    _single_flight = False
+                else:
+                    _single_flight = SingleFlight(
+                        lease_ttl=float(os.getenv("AI_SINGLE_FLIGHT_LEASE", "180")),
+                        poll_interval=float(os.getenv("AI_SINGLE_FLIGHT_POLL", "0.25")),
+                    )
+    return _single_flight or None
@@ -0,0 +1,82 @@
+"""
+Pytest setup for the backend behaviour tests
+
+Run from the backend folder:  python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Backend modules are imported as top-level modules, like app.py does
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Throwaway app database and cross-worker state file (caches, locks, throttles)
+_TMP = tempfile.mkdtemp(prefix='study-planner-tests-')
+os.environ.setdefault('AI_STATE_DB', os.path.join(_TMP, 'ai_state.db'))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_TMP, 'app.db'))
+os.environ.setdefault('AUTO_MIGRATE', 'true')
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-that-is-long-enough-for-hs256')
+# Cheap hashes, computed inline
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+os.environ.setdefault('AUTH_HASH_WORKERS', '0')
+
+# Manual scripts that call live APIs or a running server
+collect_ignore = [
+    'ai_service_old.py',
+    'list_models.py',
+    'setup.py',
+    'test_admin_login.py',
+    'test_gemini.py',
+    'test_groq.py',
+    'test_register_admin.py',
+    'verify.py',
+]
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    """The module-level app from app.py, on the throwaway database."""
+    # Migrations and the admin user only: no background sweep, tests call recover() themselves
+    from app import app, prepare_database
+    prepare_database(app)
+    return app
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    """Register a fresh user; returns (user, tokens response)."""
+    import uuid
+
+    def register_user(**fields):
+        name = fields.pop('username', f'user-{uuid.uuid4().hex[:10]}')
+        response = client.post('/api/register', json=dict(
+            username=name, email=fields.pop('email', f'{name}@example.com'), password=fields.pop('password', 'secret')))
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()
+
+    return register_user
+
+
+@pytest.fixture
+def auth_headers(register):
+    return {'Authorization': f"Bearer {register()['token']}"}
+
+
+@pytest.fixture
+def admin_headers(client, flask_app, register):
+    """Access token for a freshly promoted admin (logged in after the promotion)."""
+    from models import User, db
+    user = register()['user']
+    with flask_app.app_context():
+        db.session.get(User, user['id']).is_admin = True
+        db.session.commit()
+    response = client.post('/api/login', json={'username': user['username'], 'password': 'secret'})
+    assert response.status_code == 200, response.get_json()
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
@@ -0,0 +1,79 @@
+"""Response cache: keys, TTL and LRU bounds, and read-only hits on the SQLite backend"""
+import time
+
+import pytest
+
+import ai_cache
+from ai_cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend, make_key, plan_cache_key
+
+
+def test_keys_ignore_case_and_whitespace():
+    assert make_key("Python  Basics", None) == make_key("python basics", None)
+    assert plan_cache_key("Python", "beginner", 7, 2, "groq", "m") != \
+        plan_cache_key("Python", "beginner", 7, 2, "groq", "m", lazy=True)
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set("plan", "a", "1", ttl=60)
+    backend.set("plan", "b", "2", ttl=60)
+    backend.get("plan", "a")
+    backend.set("plan", "c", "3", ttl=60)
+    assert backend.get("plan", "b") is None
+    assert backend.get("plan", "a") == "1"
+    assert backend.get("plan", "c") == "3"
+
+
+def test_memory_backend_expires_entries(monkeypatch):
+    backend = MemoryCacheBackend()
+    backend.set("plan", "a", "1", ttl=10)
+    now = time.time()
+    monkeypatch.setattr(ai_cache.time, "time", lambda: now + 11)
+    assert backend.get("plan", "a") is None
+    assert backend.size("plan") == 0
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    return SQLiteCacheBackend(path=str(tmp_path / "cache.db"), max_entries=3, flush_every=1000,
+                              flush_interval=3600)
+
+
+def test_sqlite_backend_bounds_size_by_last_access(sqlite_backend):
+    for key in "abcd":
+        sqlite_backend.set("plan", key, key, ttl=60)
+    assert sqlite_backend.size("plan") == 3
+    assert sqlite_backend.get("plan", "a") is None
+    assert sqlite_backend.get("plan", "d") == "d"
+
+
+def test_sqlite_hits_do_not_write(sqlite_backend):
+    cache = ResponseCache(sqlite_backend, "plan", ttl=60)
+    cache.set("k", {"days": 3})
+    own = sqlite_backend._conn()
+    changes = own.total_changes
+    for _ in range(20):
+        assert cache.get("k") == {"days": 3}
+    assert own.total_changes == changes  # no access-time update, no counter write
+
+    stats = cache.stats()  # flushes the buffered counters
+    assert stats["hits"] == 20
+    assert own.total_changes > changes
+
+
+def test_sqlite_access_time_refreshed_after_interval(sqlite_backend, monkeypatch):
+    sqlite_backend.set("plan", "k", "v", ttl=3600)
+    now = time.time()
+    monkeypatch.setattr(ai_cache.time, "time", lambda: now + sqlite_backend.touch_interval + 1)
+    own = sqlite_backend._conn()
+    changes = own.total_changes
+    assert sqlite_backend.get("plan", "k") == "v"
+    assert own.total_changes == changes + 1
+
+
+def test_cache_failures_are_swallowed():
+    class Broken:
+        def get(self, *args):
+            raise RuntimeError("disk gone")
+
+    assert ResponseCache(Broken(), "plan", ttl=60).get("k") is None
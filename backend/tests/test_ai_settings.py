@@ -0,0 +1,68 @@
+"""Saved AI provider preference: read through the principal cache on generation requests"""
+import pytest
+from sqlalchemy import event
+
+from models import db
+
+
+@pytest.fixture
+def provider_lookups(monkeypatch):
+    import app as app_module
+    lookups = []
+    # No provider comes back, so plans are built by the local planner
+    monkeypatch.setattr(app_module, "get_provider_by_name", lambda name, model=None: lookups.append((name, model)))
+    return lookups
+
+
+def user_queries(flask_app, fn):
+    """Run fn and return the SQL statements it sent that read the users table."""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with flask_app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return [s for s in statements if "FROM users" in s]
+
+
+def test_generation_reads_the_preference_from_the_principal_cache(client, flask_app, auth_headers,
+                                                                  provider_lookups):
+    def generate():
+        response = client.post("/api/generate-plan", json={"subject": "DSA", "days": 3}, headers=auth_headers)
+        assert response.status_code == 201
+
+    assert client.post("/api/settings/ai-model", json={"provider": "groq", "model": "llama-3.1-8b-instant"},
+                       headers=auth_headers).status_code == 200
+    generate()
+    assert user_queries(flask_app, generate) == []
+    assert provider_lookups == [("groq", "llama-3.1-8b-instant")] * 2
+
+    # Saving new settings drops the cached principal
+    client.post("/api/settings/ai-model", json={"provider": "ollama", "model": "llama3"}, headers=auth_headers)
+    generate()
+    assert provider_lookups[-1] == ("ollama", "llama3")
+
+
+def test_explicit_gemini_choice_is_kept_and_none_clears_it(client, auth_headers, provider_lookups):
+    def generate():
+        client.post("/api/generate-plan", json={"subject": "DSA", "days": 3}, headers=auth_headers)
+
+    assert client.get("/api/settings/ai-model", headers=auth_headers).get_json() == {"provider": None, "model": None}
+    generate()
+    assert provider_lookups == []
+
+    client.post("/api/settings/ai-model", json={"provider": "gemini", "model": "gemini-2.0-flash"},
+                headers=auth_headers)
+    generate()
+    assert provider_lookups == [("gemini", "gemini-2.0-flash")]
+
+    response = client.post("/api/settings/ai-model", json={"provider": None}, headers=auth_headers)
+    assert response.get_json()["provider"] is None
+    generate()
+    assert len(provider_lookups) == 1
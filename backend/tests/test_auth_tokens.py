@@ -0,0 +1,89 @@
+"""Access/refresh tokens and revocation after admin changes"""
+import time
+
+import auth_tokens
+from auth_tokens import BloomFilter, RevocationSet, get_revocation_set
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_refresh_issues_working_access_token(client, register):
+    tokens = register()
+    response = client.post('/api/token/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert response.status_code == 200
+    assert client.get('/api/plans', headers=bearer(response.get_json()['token'])).status_code == 200
+
+
+def test_token_types_are_not_interchangeable(client, register):
+    tokens = register()
+    assert client.get('/api/plans', headers=bearer(tokens['refresh_token'])).status_code == 401
+    response = client.post('/api/token/refresh', json={'refresh_token': tokens['token']})
+    assert response.status_code == 401
+
+
+def test_demoted_admin_token_is_revoked(client, register, admin_headers):
+    other = register()
+    assert client.patch(f"/api/admin/users/{other['user']['id']}", json={'is_admin': True},
+                        headers=admin_headers).status_code == 200
+    promoted = client.post('/api/token/refresh', json={'refresh_token': other['refresh_token']}).get_json()
+    assert client.get('/api/admin/stats', headers=bearer(promoted['token'])).status_code == 200
+
+    assert client.patch(f"/api/admin/users/{other['user']['id']}", json={'is_admin': False},
+                        headers=admin_headers).status_code == 200
+    response = client.get('/api/admin/stats', headers=bearer(promoted['token']))
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Token revoked'
+
+    # A refreshed token carries the new role
+    demoted = client.post('/api/token/refresh', json={'refresh_token': other['refresh_token']}).get_json()
+    assert client.get('/api/admin/stats', headers=bearer(demoted['token'])).status_code == 403
+    assert client.get('/api/plans', headers=bearer(demoted['token'])).status_code == 200
+
+
+def test_disabled_user_cannot_refresh(client, register, admin_headers):
+    user = register()
+    client.patch(f"/api/admin/users/{user['user']['id']}", json={'is_active': False}, headers=admin_headers)
+    assert client.get('/api/plans', headers=bearer(user['token'])).status_code == 401
+    assert client.post('/api/token/refresh', json={'refresh_token': user['refresh_token']}).status_code == 403
+
+
+def test_revocations_survive_restart(flask_app):
+    from models import db
+    with flask_app.app_context():
+        get_revocation_set().revoke(987654)
+        # A fresh set on the same database, as after a restart or on another host
+        restarted = RevocationSet(db.engine, sync_interval=0)
+    assert restarted.is_revoked(987654, issued_at=0)
+    assert not restarted.is_revoked(987654, issued_at=float('inf'))
+    assert not restarted.is_revoked(123, issued_at=0)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(bits=256)
+    for key in range(50):
+        bloom.add(key)
+    assert all(key in bloom for key in range(50))
+
+
+def test_missing_revocation_table_is_checked_again(flask_app, monkeypatch):
+    monkeypatch.setattr(auth_tokens, "_revocations", None)
+    monkeypatch.setattr(auth_tokens, "_revocations_failed_at", None)
+    monkeypatch.setenv("AUTH_REVOCATION_RETRY", "0.2")
+    attempts = []
+
+    def table_missing_once(engine, **kwargs):
+        attempts.append(engine)
+        if len(attempts) == 1:
+            raise RuntimeError("token_revocations table missing")
+        return RevocationSet(engine, **kwargs)
+
+    monkeypatch.setattr(auth_tokens, "RevocationSet", table_missing_once)
+    with flask_app.app_context():
+        assert get_revocation_set() is None
+        assert get_revocation_set() is None  # within the retry interval: no new check
+        assert len(attempts) == 1
+        time.sleep(0.25)
+        assert get_revocation_set() is not None
+        assert len(attempts) == 2
@@ -0,0 +1,122 @@
+"""Background jobs: heartbeats, attempt cap and idempotent plan jobs"""
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JobRunner
+from models import db, GenerationJob, StudyPlan, User
+
+
+@pytest.fixture
+def user_id(flask_app):
+    with flask_app.app_context():
+        user = User(username=f"jobs-{uuid.uuid4().hex[:8]}", email=f"{uuid.uuid4().hex[:8]}@example.com")
+        user.set_password("secret")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def make_job(user_id, kind="test", status="running", attempts=1, idle=0.0):
+    job = GenerationJob(id=uuid.uuid4().hex, user_id=user_id, kind=kind, params={}, status=status,
+                        attempts=attempts, updated_at=datetime.utcnow() - timedelta(seconds=idle))
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def wait_for(job_id, statuses=("succeeded", "failed"), timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        db.session.expire_all()
+        job = db.session.get(GenerationJob, job_id)
+        if job.status in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job still {job.status}")
+
+
+def test_long_running_job_is_not_requeued(flask_app, user_id):
+    runner = JobRunner(flask_app, stale_after=0.4, sweep_interval=3600)
+    calls = []
+
+    def slow(job):
+        calls.append(job.id)
+        time.sleep(1.0)
+        return {"ok": True}
+
+    runner.register("test", slow)
+    with flask_app.app_context():
+        job = runner.submit(user_id, "test", {})
+        for _ in range(8):
+            time.sleep(0.1)
+            runner.recover()
+        job = wait_for(job.id)
+    assert job.status == "succeeded"
+    assert job.attempts == 1
+    assert len(calls) == 1
+
+
+def test_orphaned_job_fails_after_max_attempts(flask_app, user_id):
+    runner = JobRunner(flask_app, stale_after=60, sweep_interval=3600, max_attempts=3)
+    runner.register("test", lambda job: {"ok": True})
+    with flask_app.app_context():
+        retry = make_job(user_id, attempts=2, idle=120)
+        give_up = make_job(user_id, attempts=3, idle=120)
+        alive = make_job(user_id, attempts=3, idle=0)
+        runner.recover()
+        assert wait_for(retry).status == "succeeded"
+        job = db.session.get(GenerationJob, give_up)
+        assert job.status == "failed"
+        assert "3 times" in job.error
+        assert db.session.get(GenerationJob, alive).status == "running"
+
+
+def test_job_with_stored_result_is_not_rerun(flask_app, user_id):
+    runner = JobRunner(flask_app, sweep_interval=3600)
+    runner.register("test", lambda job: pytest.fail("handler ran again"))
+    with flask_app.app_context():
+        job_id = make_job(user_id, status="queued", attempts=1)
+        db.session.get(GenerationJob, job_id).result = {"id": 42}
+        db.session.commit()
+        runner._schedule(job_id)
+        job = wait_for(job_id)
+    assert job.status == "succeeded"
+    assert job.result == {"id": 42}
+
+
+def test_plan_job_saves_one_plan_when_run_twice(flask_app, user_id):
+    handler = flask_app.extensions["job_runner"].handlers["generate_plan"]
+    params = {"subject": "Python", "days": 3, "hours": 1.0, "level": "Beginner",
+              "provider": "local", "model": "", "lazy": False}
+    with flask_app.app_context():
+        job_id = make_job(user_id, kind="generate_plan")
+        job = db.session.get(GenerationJob, job_id)
+        job.params = params
+        db.session.commit()
+
+        first = handler(job)
+        assert db.session.get(GenerationJob, job_id).result == first  # committed with the plan
+        second = handler(db.session.get(GenerationJob, job_id))
+        assert second["id"] == first["id"]
+        assert StudyPlan.query.filter_by(job_id=job_id).count() == 1
+
+
+def test_importing_the_app_starts_no_background_work():
+    # CLI scripts get a minimal app; importing app.py itself (tests, tools) starts no threads
+    script = (
+        "import sys, threading\n"
+        "import cleanup_admin, import_users, setup_admin\n"
+        "assert 'app' not in sys.modules\n"
+        "import app\n"
+        "assert not app.app.extensions['job_runner']._started\n"
+        "assert not any(t.name == 'ai-job-sweep' for t in threading.enumerate())\n"
+    )
+    backend = os.path.join(os.path.dirname(__file__), "..")
+    result = subprocess.run([sys.executable, "-c", script], cwd=backend, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,69 @@
+"""Incremental JSON array parser and item validation shared by all providers"""
+import json
+
+from ai_service import FLASHCARD_SCHEMA, PLAN_DAY_SCHEMA, JsonArrayStreamParser, parse_json_list, validate_item
+
+CARDS = [
+    {"question": "What does [1, 2][0] return?", "answer": "1"},
+    {"question": 'Escape a quote: \\" and a brace }', "answer": "Use a backslash"},
+    {"question": "Nested?", "answer": "Yes", "tags": [{"a": [1]}, "x"]},
+]
+
+
+def feed_in_chunks(text, size):
+    parser = JsonArrayStreamParser()
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return parser, items
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"question": "a", "ans') == []
+    assert parser.feed('wer": "b"}, {"question"') == [{"question": "a", "answer": "b"}]
+    assert parser.feed(': "c", "answer": "d"}]') == [{"question": "c", "answer": "d"}]
+    assert parser.done and not parser.truncated
+
+
+def test_any_chunking_gives_the_same_items():
+    text = "Sure! Here you go:\n```json\n" + json.dumps(CARDS, indent=2) + "\n```\nGood luck!"
+    for size in (1, 2, 7, 64, len(text)):
+        parser, items = feed_in_chunks(text, size)
+        assert items == CARDS, size
+        assert parser.done
+
+
+def test_chatter_with_brackets_before_the_array_is_skipped():
+    items, truncated = parse_json_list('Format: [] (a list)\n[{"question": "q", "answer": "a"}]')
+    assert items == [{"question": "q", "answer": "a"}]
+    assert not truncated
+
+
+def test_truncated_output_keeps_complete_items():
+    text = json.dumps(CARDS)[:-30]
+    items, truncated = parse_json_list(text)
+    assert items == CARDS[:2]
+    assert truncated
+
+
+def test_text_after_the_array_is_ignored():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"question": "q", "answer": "a"}] [{"question": "x", "answer": "y"}]') == \
+        [{"question": "q", "answer": "a"}]
+    assert parser.feed('[{"question": "z", "answer": "z"}]') == []
+
+
+def test_no_array_at_all():
+    assert parse_json_list("I cannot help with that.") == ([], False)
+    assert parse_json_list(None) == ([], False)
+
+
+def test_validate_item_coerces_and_rejects():
+    assert validate_item({"day": "2", "topic": " Loops ", "hours": "1.5"}, PLAN_DAY_SCHEMA) == \
+        {"day": 2, "topic": "Loops", "hours": 1.5}
+    assert validate_item({"day": 1, "topic": "Loops", "hours": "lots"}, PLAN_DAY_SCHEMA) == \
+        {"day": 1, "topic": "Loops"}
+    assert validate_item({"day": "one", "topic": "Loops"}, PLAN_DAY_SCHEMA) is None
+    assert validate_item({"question": "q", "answer": {"nested": 1}}, FLASHCARD_SCHEMA) is None
+    assert validate_item(["not", "a", "dict"], FLASHCARD_SCHEMA) is None
@@ -0,0 +1,80 @@
+"""Lazy plans: day details generated on first open, saved, and prefetched for the next days"""
+import time
+
+import pytest
+
+from models import db, StudyPlan
+
+
+class DayDetails:
+    """Stands in for the AI service's generate_day_details."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.days = []
+
+    def generate_day_details(self, subject, level, days, day, topic, hours, provider=None):
+        self.days.append(day)
+        if self.fail:
+            raise Exception("provider down")
+        return f"Details for {topic}"
+
+
+@pytest.fixture
+def details(monkeypatch):
+    import app as app_module
+    service = DayDetails()
+    monkeypatch.setattr(app_module, "get_ai_service", lambda: service)
+    return service
+
+
+@pytest.fixture
+def lazy_plan(flask_app, register, client):
+    tokens = register()
+    with flask_app.app_context():
+        plan = StudyPlan(user_id=tokens["user"]["id"], subject="DSA", level="Beginner", days=3, hours_per_day=2,
+                         plan_data=[{"day": n, "topic": f"Topic {n}", "hours": 2} for n in (1, 2, 3)])
+        db.session.add(plan)
+        db.session.commit()
+        plan_id = plan.id
+    return plan_id, {"Authorization": f"Bearer {tokens['token']}"}
+
+
+def saved_details(flask_app, plan_id):
+    with flask_app.app_context():
+        return {d["day"]: d.get("details") for d in db.session.get(StudyPlan, plan_id).plan_data}
+
+
+def test_day_details_are_generated_once_and_saved(client, flask_app, lazy_plan, details):
+    plan_id, headers = lazy_plan
+    for _ in range(2):
+        response = client.get(f"/api/plans/{plan_id}/days/2?prefetch=0", headers=headers)
+        assert response.status_code == 200
+        assert response.get_json()["day"]["details"] == "Details for Topic 2"
+    assert details.days == [2]
+    assert saved_details(flask_app, plan_id) == {1: None, 2: "Details for Topic 2", 3: None}
+
+
+def test_next_days_are_prefetched_in_the_background(client, flask_app, lazy_plan, details):
+    plan_id, headers = lazy_plan
+    assert client.get(f"/api/plans/{plan_id}/days/1?prefetch=2", headers=headers).status_code == 200
+    deadline = time.time() + 5
+    while None in saved_details(flask_app, plan_id).values() and time.time() < deadline:
+        time.sleep(0.05)
+    assert sorted(details.days) == [1, 2, 3]
+    assert None not in saved_details(flask_app, plan_id).values()
+
+
+def test_failed_generation_saves_nothing(client, flask_app, lazy_plan, details):
+    plan_id, headers = lazy_plan
+    details.fail = True
+    response = client.get(f"/api/plans/{plan_id}/days/1?prefetch=0", headers=headers)
+    assert response.status_code == 503
+    assert saved_details(flask_app, plan_id)[1] is None
+
+
+def test_unknown_day_or_other_users_plan_is_not_found(client, lazy_plan, details, auth_headers):
+    plan_id, headers = lazy_plan
+    assert client.get(f"/api/plans/{plan_id}/days/9", headers=headers).status_code == 404
+    assert client.get(f"/api/plans/{plan_id}/days/1", headers=auth_headers).status_code == 404
+    assert details.days == []
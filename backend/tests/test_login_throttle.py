@@ -0,0 +1,82 @@
+"""Login throttling: failures per IP and per username, never successes"""
+import uuid
+
+import pytest
+
+from login_throttle import LoginThrottle, LoginThrottled
+
+
+@pytest.fixture
+def throttle(tmp_path):
+    return LoginThrottle(ip_limit=3, ip_window=60, user_limit=2, user_window=900, path=str(tmp_path / "state.db"))
+
+
+def test_successful_logins_do_not_count_against_the_ip(throttle):
+    for i in range(10):
+        throttle.check("10.0.0.1", f"user{i}")
+        throttle.record_success("10.0.0.1", f"user{i}")
+
+
+def test_failures_block_the_ip(throttle):
+    for i in range(3):
+        throttle.check("10.0.0.1", f"user{i}")
+        throttle.record_failure("10.0.0.1", f"user{i}")
+    with pytest.raises(LoginThrottled) as raised:
+        throttle.check("10.0.0.1", "someone-else")
+    assert 1 <= raised.value.retry_after <= 60
+    throttle.check("10.0.0.2", "someone-else")
+
+
+def test_failures_block_the_username_within_the_network(throttle):
+    throttle.record_failure("10.0.0.1", "Alice")
+    throttle.record_failure("10.0.0.2", "alice ")
+    with pytest.raises(LoginThrottled):
+        throttle.check("10.0.0.3", "ALICE")
+    # Someone else's failures can't lock the owner out from their own network
+    throttle.check("192.0.2.7", "alice")
+
+
+def test_ipv6_clients_are_grouped_by_prefix(throttle):
+    throttle.record_failure("2001:db8::1", "alice")
+    throttle.record_failure("2001:db8::2", "alice")
+    with pytest.raises(LoginThrottled):
+        throttle.check("2001:db8::3", "alice")
+    throttle.check("2001:db8:1::1", "alice")
+
+
+def test_success_clears_username_failures(throttle):
+    throttle.record_failure("10.0.0.1", "alice")
+    throttle.record_success("10.0.0.1", "alice")
+    throttle.record_failure("10.0.0.1", "alice")
+    throttle.check("10.0.0.1", "alice")
+
+
+def test_login_route_answers_429_after_repeated_failures(client, register):
+    user = register()['user']
+    headers = {'X-Forwarded-For': f'203.0.113.{uuid.uuid4().int % 250}'}
+    for _ in range(3):
+        response = client.post('/api/login', json={'username': user['username'], 'password': 'secret'},
+                               headers=headers)
+        assert response.status_code == 200
+    for _ in range(5):
+        response = client.post('/api/login', json={'username': user['username'], 'password': 'wrong'},
+                               headers=headers)
+        assert response.status_code == 401
+    response = client.post('/api/login', json={'username': user['username'], 'password': 'secret'},
+                           headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_account_lockout_does_not_reach_the_owner_elsewhere(client, register):
+    user = register()['user']
+    attacker = {'X-Forwarded-For': f'198.51.100.{uuid.uuid4().int % 250}'}
+    for _ in range(5):
+        client.post('/api/login', json={'username': user['username'], 'password': 'wrong'}, headers=attacker)
+    response = client.post('/api/login', json={'username': user['username'], 'password': 'secret'},
+                           headers=attacker)
+    assert response.status_code == 429
+
+    owner = {'X-Forwarded-For': f'192.0.2.{uuid.uuid4().int % 250}'}
+    response = client.post('/api/login', json={'username': user['username'], 'password': 'secret'}, headers=owner)
+    assert response.status_code == 200
@@ -0,0 +1,111 @@
+"""Migrations: idempotent on fresh databases and on ones built by db.create_all()"""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from migrations import MIGRATIONS, pending_migrations, run_migrations
+from models import db
+
+ALL_VERSIONS = [version for version, _, _ in MIGRATIONS]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    yield engine
+    engine.dispose()
+
+
+def assert_current_schema(engine):
+    schema = inspect(engine)
+    assert "job_id" in {c["name"] for c in schema.get_columns("study_plans")}
+    assert schema.has_table("token_revocations")
+    # The inspector skips expression indexes on SQLite
+    with engine.connect() as conn:
+        indexes = {row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'users'"))}
+    assert {"ix_users_created_at", "ix_users_lower_username", "ix_users_lower_email"} <= indexes
+    assert not pending_migrations(engine)
+
+
+def describe(engine):
+    """Tables, columns, keys and indexes as the database reports them."""
+    schema = inspect(engine)
+    tables = {}
+    for table in set(schema.get_table_names()) - {"schema_migrations"}:
+        tables[table] = {
+            "columns": sorted((c["name"], str(c["type"]), c["nullable"], c["default"])
+                              for c in schema.get_columns(table)),
+            "primary_key": schema.get_pk_constraint(table)["constrained_columns"],
+            "foreign_keys": sorted((tuple(fk["constrained_columns"]), fk["referred_table"], tuple(fk["referred_columns"]))
+                                   for fk in schema.get_foreign_keys(table)),
+            "unique": sorted(tuple(u["column_names"]) for u in schema.get_unique_constraints(table)),
+            "indexes": sorted((i["name"], tuple(i["column_names"]), bool(i["unique"])) for i in schema.get_indexes(table)),
+        }
+    # Expression indexes only show up here on SQLite
+    with engine.connect() as conn:
+        names = sorted(tuple(row) for row in conn.execute(text(
+            "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_autoindex%'")))
+    return tables, names
+
+
+def test_migrated_schema_matches_the_models(engine, tmp_path):
+    run_migrations(engine)
+    reference = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    db.metadata.create_all(reference)
+    try:
+        assert describe(engine) == describe(reference)
+    finally:
+        reference.dispose()
+
+
+def test_fresh_database_migrates_once(engine):
+    assert run_migrations(engine) == ALL_VERSIONS
+    assert run_migrations(engine) == []
+    assert_current_schema(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_migrations")).scalar() == len(MIGRATIONS)
+
+
+def test_create_all_database_migrates_cleanly(engine):
+    db.metadata.create_all(engine)
+    assert [m[0] for m in pending_migrations(engine)] == ALL_VERSIONS
+    # Every migration tolerates the tables, columns and indexes create_all already made
+    assert run_migrations(engine) == ALL_VERSIONS
+    assert run_migrations(engine) == []
+    assert_current_schema(engine)
+
+
+def test_unique_plan_job_index_enforced(engine):
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (username, email, password, is_admin, is_active, ai_provider, ai_model)"
+                          " VALUES ('u', 'u@x.io', 'h', 0, 1, 'local', 'm')"))
+        insert = text("INSERT INTO study_plans (user_id, subject, level, days, hours_per_day, plan_data, job_id)"
+                      " VALUES (1, 's', 'beginner', 1, 1, '[]', 'job')")
+        conn.execute(insert)
+    with pytest.raises(IntegrityError):
+        with engine.begin() as conn:
+            conn.execute(insert)
+
+
+def test_ai_preference_becomes_nullable_and_old_defaults_clear(engine):
+    db.metadata.create_all(engine)
+    # Schema and rows as of migration 6: NOT NULL preference columns holding the old defaults
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE users"))
+        conn.execute(text(
+            "CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE,"
+            " email VARCHAR(120) NOT NULL UNIQUE, password VARCHAR(255) NOT NULL, is_admin BOOLEAN NOT NULL,"
+            " is_active BOOLEAN NOT NULL, ai_provider VARCHAR(50) NOT NULL DEFAULT 'gemini',"
+            " ai_model VARCHAR(100) NOT NULL DEFAULT 'gemini-2.0-flash', created_at DATETIME)"))
+        conn.execute(text("INSERT INTO users (username, email, password, is_admin, is_active) VALUES"
+                          " ('a', 'a@x.io', 'h', 0, 1)"))
+        conn.execute(text("INSERT INTO users (username, email, password, is_admin, is_active, ai_provider, ai_model)"
+                          " VALUES ('b', 'b@x.io', 'h', 1, 1, 'groq', 'llama')"))
+    assert 7 in run_migrations(engine)
+    assert_current_schema(engine)
+    assert all(c["nullable"] for c in inspect(engine).get_columns("users") if c["name"].startswith("ai_"))
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT username, is_admin, ai_provider, ai_model FROM users ORDER BY id")).all()
+    assert [tuple(row) for row in rows] == [("a", 0, None, None), ("b", 1, "groq", "llama")]
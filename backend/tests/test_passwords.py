@@ -0,0 +1,57 @@
+"""Password hashing pool: slot accounting and rehash detection"""
+import time
+
+import pytest
+
+from passwords import HashPoolBusy, PasswordHasher, _hash, _method_prefix
+
+
+@pytest.mark.parametrize("method", ["scrypt", "scrypt:16384:8:1", "pbkdf2", "pbkdf2:sha256", "pbkdf2:sha256:1000"])
+def test_prefix_matches_werkzeug(method):
+    assert _method_prefix(method) == _hash("x", method).split("$", 1)[0]
+
+
+def test_needs_rehash_compares_parameters():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=0)
+    assert not hasher.needs_rehash(_hash("x", "pbkdf2:sha256:1000"))
+    assert hasher.needs_rehash(_hash("x", "pbkdf2:sha256:2000"))
+    assert hasher.needs_rehash("")
+
+
+def test_timed_out_hash_keeps_its_slot_until_done():
+    hasher = PasswordHasher(method="pbkdf2:sha256:2000000", workers=1, max_pending=1, timeout=0.01)
+    try:
+        with pytest.raises(HashPoolBusy):
+            hasher.hash("slow")
+        # Still running in the pool: no new work is accepted
+        with pytest.raises(HashPoolBusy):
+            hasher.hash("next")
+        assert hasher.rejected == 1
+        deadline = time.monotonic() + 30
+        while not hasher._slots.acquire(blocking=False):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        hasher._slots.release()
+    finally:
+        hasher.close()
+
+
+def test_hash_many_shares_the_pending_limit():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1, max_pending=4)
+    taken = []
+    original = hasher._submit
+
+    def submit(pool, fn, *args):
+        # Slots in use right after this one was taken
+        taken.append(hasher.max_pending - hasher._slots._value)
+        return original(pool, fn, *args)
+
+    hasher._submit = submit
+    try:
+        hashes = hasher.hash_many([f"pw{i}" for i in range(12)])
+        assert [hasher.verify(h, f"pw{i}") for i, h in enumerate(hashes)] == [True] * 12
+        # Never more than half the slots, so logins are still served during an import
+        assert max(taken) <= 2
+        assert all(hasher._slots.acquire(blocking=False) for _ in range(4))
+    finally:
+        hasher.close()
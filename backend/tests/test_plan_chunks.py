@@ -0,0 +1,107 @@
+"""Long plans: outline, windows generated in parallel, renumbering and the local planner fallback"""
+import time
+
+import pytest
+
+import ai_async
+import local_planner
+from ai_service import PLAN_CHUNK_DAYS, AIStudyService
+from deadlines import RetryPolicy
+
+
+class PlanProvider:
+    name = "planner"
+    model_name = "fake"
+    available = True
+    cacheable = True
+    supports_flashcards = False
+
+    def __init__(self, outline=True, fail=(), short=()):
+        self.outline = outline
+        self.fail = set(fail)
+        self.short = set(short)
+        self.windows = []
+
+    def generate_plan_outline(self, subject, level, days, parts, window):
+        if not self.outline:
+            raise Exception("outline down")
+        return [{"focus": f"Focus {part + 1}"} for part in range(parts)]
+
+    def generate_plan_window(self, subject, level, days, hours_per_day, start, end, focus,
+                             previous_focus, next_focus, details):
+        self.windows.append((start, end, focus, previous_focus, next_focus))
+        if start in self.fail:
+            raise Exception(f"days {start}-{end} down")
+        count = end - start + 1 - (2 if start in self.short else 0)
+        # Models often number each window from 1
+        return [{"day": n + 1, "topic": f"{focus or 'AI'} #{n + 1}", "hours": hours_per_day} for n in range(count)]
+
+    async def agenerate_plan_window(self, *args):
+        return self.generate_plan_window(*args)
+
+
+@pytest.fixture(params=["runtime", "no-runtime"])
+def service(request, monkeypatch):
+    if request.param == "no-runtime":
+        monkeypatch.setattr(ai_async, "_runtime", False)
+    service = AIStudyService()
+    service.retry = RetryPolicy(max_retries=0)
+    service.limiter = None
+    service._providers_checked_at = time.monotonic() + 3600
+    return service
+
+
+def chunked(service, provider, days):
+    service.providers = [provider]
+    return list(service._chunked_plan("DSA", "Beginner", days, 2.0, None))
+
+
+def test_windows_cover_every_day_once(service):
+    provider = PlanProvider()
+    days = 3 * PLAN_CHUNK_DAYS + 2
+    plan = chunked(service, provider, days)
+    assert [day["day"] for day in plan] == list(range(1, days + 1))
+    assert sorted((start, end) for start, end, *_ in provider.windows) == [
+        (1, PLAN_CHUNK_DAYS), (PLAN_CHUNK_DAYS + 1, 2 * PLAN_CHUNK_DAYS),
+        (2 * PLAN_CHUNK_DAYS + 1, 3 * PLAN_CHUNK_DAYS), (3 * PLAN_CHUNK_DAYS + 1, days)]
+
+
+def test_outline_focus_reaches_each_window(service):
+    provider = PlanProvider()
+    plan = chunked(service, provider, 3 * PLAN_CHUNK_DAYS)
+    assert sorted(provider.windows)[1][2:] == ("Focus 2", "Focus 1", "Focus 3")
+    assert sorted(provider.windows)[0][3] is None and sorted(provider.windows)[2][4] is None
+    assert plan[PLAN_CHUNK_DAYS]["topic"] == "Focus 2 #1"
+
+
+def test_failed_outline_still_generates_windows(service):
+    plan = chunked(service, PlanProvider(outline=False), 2 * PLAN_CHUNK_DAYS)
+    assert len(plan) == 2 * PLAN_CHUNK_DAYS
+    assert all(day["topic"].startswith("AI #") for day in plan)
+
+
+def test_failed_or_short_window_is_filled_by_the_local_planner(service):
+    days = 3 * PLAN_CHUNK_DAYS
+    second, third = PLAN_CHUNK_DAYS + 1, 2 * PLAN_CHUNK_DAYS + 1
+    plan = chunked(service, PlanProvider(outline=False, fail=[second], short=[third]), days)
+    local = local_planner.build_plan("DSA", "Beginner", days, 2.0, True)
+    assert [day["day"] for day in plan] == list(range(1, days + 1))
+    assert plan[:PLAN_CHUNK_DAYS] == [{"day": n + 1, "topic": f"AI #{n + 1}", "hours": 2.0}
+                                      for n in range(PLAN_CHUNK_DAYS)]
+    assert plan[second - 1:third - 1] == local[second - 1:third - 1]
+    assert plan[-2:] == local[-2:]
+    assert plan[third - 1]["topic"] == "AI #1"
+
+
+def test_plan_fails_when_every_window_fails(service):
+    with pytest.raises(Exception, match="down"):
+        chunked(service, PlanProvider(fail=[1, PLAN_CHUNK_DAYS + 1]), 2 * PLAN_CHUNK_DAYS)
+
+
+@pytest.mark.parametrize("fields", [{"days": 0}, {"days": 366}, {"days": "many"}, {"hours": 0},
+                                    {"hours": 25}, {"hours": "nan"}])
+@pytest.mark.parametrize("path", ["/api/generate-plan", "/api/generate-plan/stream"])
+def test_plan_length_and_hours_are_bounded(client, auth_headers, path, fields):
+    response = client.post(path, json={"subject": "DSA", **fields}, headers=auth_headers)
+    assert response.status_code == 400
+    assert response.get_json()["error"]
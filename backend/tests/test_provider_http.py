@@ -0,0 +1,70 @@
+"""HTTP providers: blocking calls run the async implementation and keep its usage report"""
+import threading
+
+import httpx
+import pytest
+
+import ai_async
+import ai_service
+from ai_service import GroqProvider, ProviderRateLimitError, _usage_local
+
+
+@pytest.fixture
+def groq(monkeypatch):
+    provider = object.__new__(GroqProvider)
+    provider.available = True
+    provider.api_key = "key"
+    provider.model = provider.model_name = "llama"
+    calls = []
+
+    async def post(service, url, **kwargs):
+        calls.append((service, threading.current_thread().name, kwargs["json"]))
+        status = getattr(provider, "status", 200)
+        return httpx.Response(status, json={"choices": [{"message": {"content": '{"items": [{"q": 1}]}'}}],
+                                            "usage": {"completion_tokens": 42}},
+                              headers={"Retry-After": "3"}, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr(ai_async, "post", post)
+    provider.calls = calls
+    return provider
+
+
+@pytest.fixture(params=["runtime", "no-runtime"])
+def runtime_mode(request, monkeypatch):
+    if request.param == "no-runtime":
+        monkeypatch.setattr(ai_async, "_runtime", False)
+    return request.param
+
+
+def test_complete_goes_through_acomplete(groq, runtime_mode):
+    _usage_local.tokens = None
+    text = groq._complete("prompt", 0.5, 100, {"type": "object"})
+    assert text == '{"items": [{"q": 1}]}'
+    service, thread, body = groq.calls[0]
+    assert service == "groq"
+    assert body["response_format"] == {"type": "json_object"}
+    if runtime_mode == "runtime":
+        assert thread == "ai-async-loop"
+    # Usage reported on the loop is handed back to the calling thread
+    assert _usage_local.tokens == 42
+
+
+def test_rate_limit_status_becomes_rate_limit_error(groq, runtime_mode):
+    groq.status = 429
+    with pytest.raises(ProviderRateLimitError) as raised:
+        groq._complete("prompt", 0.5, 100)
+    assert raised.value.retry_after == 3
+
+
+def test_generate_uses_single_http_implementation(groq, monkeypatch):
+    monkeypatch.setattr(ai_service, "validate_item", lambda item, schema: item)
+    assert groq.generate_flashcards("topic", 1) == [{"q": 1}]
+    assert len(groq.calls) == 1
+
+
+def test_max_tokens_follow_the_requested_size(groq, monkeypatch):
+    monkeypatch.setattr(ai_service, "validate_item", lambda item, schema: item)
+    groq.generate_flashcards("topic", 2)
+    groq.generate_flashcards("topic", 30)
+    small, large = (body["max_tokens"] for _, _, body in groq.calls)
+    assert small < large <= groq.max_output_tokens
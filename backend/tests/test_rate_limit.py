@@ -0,0 +1,79 @@
+"""Quota token buckets: parsing, queueing within max_wait, spill-over and 429 penalties"""
+import multiprocessing
+import time
+
+import pytest
+
+from rate_limit import RateLimited, TokenBucketLimiter, parse_limits
+
+
+def test_parse_limits():
+    assert parse_limits("Groq=30/m, 14400/d; bad=5/x; ollama") == {
+        "groq": [("m", 30.0, 0.5), ("d", 14400.0, 14400 / 86400)],
+    }
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return TokenBucketLimiter(parse_limits("fake=2/s"), path=str(tmp_path / "limits.db"), default_penalty=5)
+
+
+def test_unlimited_provider_never_waits(limiter):
+    for _ in range(100):
+        limiter.acquire("ollama", max_wait=0)
+
+
+def test_empty_bucket_queues_for_the_refill(limiter):
+    limiter.acquire("fake")
+    limiter.acquire("fake")
+    started = time.monotonic()
+    limiter.acquire("fake", max_wait=2)
+    assert 0.3 < time.monotonic() - started < 1.5
+    assert limiter.snapshot()["queued_waits"] == 1
+
+
+def test_wait_beyond_max_wait_raises(limiter):
+    limiter.acquire("fake")
+    limiter.acquire("fake")
+    with pytest.raises(RateLimited) as error:
+        limiter.acquire("fake", max_wait=0.1)
+    assert 0 < error.value.retry_after <= 0.5
+    assert limiter.snapshot()["rejections"] == 1
+
+
+def test_models_have_separate_buckets(limiter):
+    limiter.acquire("fake", "a")
+    limiter.acquire("fake", "a")
+    limiter.acquire("fake", "b", max_wait=0)
+
+
+def test_penalty_blocks_until_retry_after(limiter):
+    limiter.penalize("fake", retry_after=60)
+    with pytest.raises(RateLimited) as error:
+        limiter.acquire("fake", max_wait=1)
+    assert error.value.retry_after > 50
+    assert limiter.snapshot()["buckets"]["fake:default:s"]["blocked_for"] > 50
+
+
+def _take(path, results):
+    limiter = TokenBucketLimiter(parse_limits("shared=5/m"), path=path)
+    taken = 0
+    for _ in range(5):
+        try:
+            limiter.acquire("shared", max_wait=0)
+            taken += 1
+        except RateLimited:
+            pass
+    results.put(taken)
+
+
+def test_quota_is_shared_across_processes(tmp_path):
+    path = str(tmp_path / "shared.db")
+    TokenBucketLimiter(parse_limits("shared=5/m"), path=path)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_take, args=(path, results)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    assert sum(results.get(timeout=5) for _ in workers) == 5
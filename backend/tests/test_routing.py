@@ -0,0 +1,263 @@
+"""Provider routing: health ranking, circuit breakers and failover"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from ai_service import AIStudyService, HedgeBudget, ProviderHealth, ProviderRouter
+from deadlines import Deadline, DeadlineExceeded, RetryPolicy, deadline_scope
+
+
+class FakeProvider:
+    model_name = "fake"
+    available = True
+    cacheable = True
+    supports_flashcards = True
+
+    def __init__(self, name, fail=False, delay=0.0):
+        self.name = name
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise self.fail if isinstance(self.fail, Exception) else Exception(f"{self.name} is down")
+        return self.name
+
+
+def breaker(threshold=3, reset_timeout=30):
+    return ProviderHealth("p", alpha=0.5, failure_threshold=threshold, reset_timeout=reset_timeout)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    health = breaker(threshold=3)
+    for now in (1, 2):
+        health.record(False, 0.1, now)
+    assert health.state == ProviderHealth.CLOSED
+    health.record(True, 0.1, 3)
+    for now in (4, 5):
+        health.record(False, 0.1, now)
+    assert health.state == ProviderHealth.CLOSED  # the success reset the streak
+    health.record(False, 0.1, 6)
+    assert health.state == ProviderHealth.OPEN
+    assert not health.can_attempt(6 + 29)
+
+
+def test_half_open_lets_one_probe_through():
+    health = breaker(threshold=1, reset_timeout=30)
+    health.record(False, 0.1, 0)
+    assert health.acquire(30)
+    assert health.state == ProviderHealth.HALF_OPEN
+    assert not health.acquire(31)  # probe in flight
+    health.record(False, 0.1, 32)
+    assert health.state == ProviderHealth.OPEN
+    assert health.acquire(62)
+    health.record(True, 0.1, 63)
+    assert health.state == ProviderHealth.CLOSED
+
+
+def test_error_rate_decays_while_idle():
+    health = breaker(threshold=10)
+    health.error_half_life = 10
+    health.record(False, 0.1, 0)
+    assert health.current_error_rate(10) == pytest.approx(health.error_rate / 2)
+
+
+def test_router_ranks_by_latency_and_skips_open_breakers(monkeypatch):
+    monkeypatch.setenv("AI_ROUTER_FAILURE_THRESHOLD", "1")
+    router = ProviderRouter()
+    fast, slow, broken = FakeProvider("fast"), FakeProvider("slow"), FakeProvider("broken")
+    router.record("fast", True, 0.2)
+    router.record("slow", True, 3.0)
+    router.record("broken", False, 0.1)
+    assert [p.name for p in router.rank([slow, broken, fast])] == ["fast", "slow"]
+
+
+def test_router_sends_the_half_open_probe_first(monkeypatch):
+    monkeypatch.setenv("AI_ROUTER_FAILURE_THRESHOLD", "1")
+    monkeypatch.setenv("AI_ROUTER_RESET_TIMEOUT", "0")
+    router = ProviderRouter()
+    healthy, recovering = FakeProvider("healthy"), FakeProvider("recovering")
+    router.record("healthy", True, 0.1)
+    router.record("recovering", False, 0.1)
+    assert [p.name for p in router.rank([healthy, recovering])] == ["recovering", "healthy"]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("AI_ROUTER_FAILURE_THRESHOLD", "2")
+    service = AIStudyService()
+    service.retry = RetryPolicy(max_retries=0)
+    service.limiter = None
+    # Fixed provider list; no background re-probing during the test
+    service._providers_checked_at = time.monotonic() + 3600
+    return service
+
+
+def test_call_fails_over_and_demotes_the_failing_provider(service):
+    down, up = FakeProvider("down", fail=True), FakeProvider("up")
+    service.providers = [down, up]
+
+    assert service._call(None, lambda p: p.generate()) == "up"
+    assert service.last_provider_name() == "up"
+    assert down.calls == 1
+    # The error rate now ranks the failing provider last
+    assert [p.name for p in service.candidates()] == ["up", "down"]
+
+
+def test_open_breaker_takes_provider_out_of_rotation(service):
+    down, up = FakeProvider("down", fail=True), FakeProvider("up")
+    service.providers = [down, up]
+    for _ in range(2):
+        with pytest.raises(Exception):
+            service._call(down, lambda p: p.generate())
+    assert service.router.snapshot()["down"]["state"] == ProviderHealth.OPEN
+    assert [p.name for p in service.candidates()] == ["up"]
+
+    service.providers = [down]
+    with pytest.raises(Exception, match="temporarily unavailable"):
+        service._call(None, lambda p: p.generate())
+    assert down.calls == 2
+
+
+def test_explicit_provider_is_not_failed_over(service):
+    down, up = FakeProvider("down", fail=True), FakeProvider("up")
+    service.providers = [down, up]
+    with pytest.raises(Exception, match="down is down"):
+        service._call(down, lambda p: p.generate())
+    assert up.calls == 0
+
+
+def test_all_providers_failing_raises_the_last_error(service):
+    service.providers = [FakeProvider("a", fail=True), FakeProvider("b", fail=True)]
+    with pytest.raises(Exception, match="is down"):
+        service._call(None, lambda p: p.generate())
+
+
+def test_hedge_budget_refills_up_to_the_burst_and_denies_when_empty():
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    budget.deposit()
+    assert not budget.try_spend()  # half a token is not enough
+    for _ in range(5):
+        budget.deposit()
+    assert budget.tokens == 1
+    assert budget.try_spend()
+    assert budget.snapshot()["hedges"] == 2 and budget.snapshot()["denied"] == 2
+
+
+@pytest.fixture
+def hedging(service):
+    service.hedge_min_delay = 0.05
+    service.router.default_latency = 0.05
+    service.hedge_budget = HedgeBudget(ratio=0.1, burst=1)
+    service._hedge_pool = ThreadPoolExecutor(max_workers=2)
+    yield service
+    service._hedge_pool.shutdown(wait=True)
+
+
+def test_hedged_call_takes_the_first_success(hedging):
+    slow, fast = FakeProvider("slow", delay=0.5), FakeProvider("fast")
+    hedging.providers = [slow, fast]
+    assert hedging._call_hedged(lambda p: p.generate()) == "fast"
+    assert hedging.last_provider_name() == "fast"
+    assert hedging.hedge_budget.snapshot()["secondary_wins"] == 1
+
+
+class BusyHedgePool(ThreadPoolExecutor):
+    """Runs the first call; later ones stay queued, as behind a busy pool, until cancelled."""
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.started = False
+        self.queued = []
+
+    def submit(self, fn, *args, **kwargs):
+        if self.started:
+            future = Future()
+            self.queued.append(future)
+            return future
+        self.started = True
+        return super().submit(fn, *args, **kwargs)
+
+
+def test_hedge_that_has_not_started_is_cancelled(hedging):
+    hedging._hedge_pool = BusyHedgePool()
+    primary, secondary = FakeProvider("primary", delay=0.2), FakeProvider("secondary")
+    hedging.providers = [primary, secondary]
+    assert hedging._call_hedged(lambda p: p.generate()) == "primary"
+    assert hedging.hedge_budget.snapshot()["hedges"] == 1
+    assert [future.cancelled() for future in hedging._hedge_pool.queued] == [True]
+    assert secondary.calls == 0
+
+
+def test_no_hedge_without_budget(hedging):
+    hedging.hedge_budget = HedgeBudget(ratio=0, burst=0)
+    slow, fast = FakeProvider("slow", delay=0.2), FakeProvider("fast")
+    hedging.providers = [slow, fast]
+    assert hedging._call_hedged(lambda p: p.generate()) == "slow"
+    assert fast.calls == 0
+    assert hedging.hedge_budget.snapshot()["denied"] == 1
+
+
+def test_failed_hedges_fall_back_to_the_remaining_providers(hedging):
+    providers = [FakeProvider("a", fail=True, delay=0.1), FakeProvider("b", fail=True), FakeProvider("c")]
+    hedging.providers = providers
+    assert hedging._call_hedged(lambda p: p.generate()) == "c"
+    assert [p.calls for p in providers] == [1, 1, 1]
+
+
+class Upstream503(Exception):
+    status_code = 503
+
+
+def test_transient_errors_are_retried_on_the_same_provider(service):
+    service.retry = RetryPolicy(max_retries=2, base_delay=0.01)
+    flaky = FakeProvider("flaky")
+    outcomes = [Upstream503("busy"), Upstream503("busy")]
+
+    def call(provider):
+        provider.calls += 1
+        if outcomes:
+            raise outcomes.pop(0)
+        return provider.name
+
+    service.providers = [flaky, FakeProvider("other")]
+    assert service._call(None, call) == "flaky"
+    assert flaky.calls == 3 and service.retry.retries == 2
+
+
+def test_permanent_errors_are_not_retried():
+    policy = RetryPolicy(max_retries=3)
+    assert policy.backoff(0, ValueError("bad request")) is None
+    assert policy.backoff(0, Exception("Groq returned 502")) is not None
+    assert policy.backoff(3, Upstream503("busy")) is None
+
+
+def test_backoff_never_outlasts_the_deadline():
+    policy = RetryPolicy(max_retries=5, base_delay=1, max_delay=8)
+    with deadline_scope(Deadline(0.5)):
+        assert policy.backoff(0, Upstream503("busy")) is None
+    with deadline_scope(Deadline(60)):
+        assert 0 <= policy.backoff(2, Upstream503("busy")) <= 4
+
+
+def test_expired_deadline_stops_failover(service):
+    first, second = FakeProvider("first", fail=DeadlineExceeded("deadline")), FakeProvider("second")
+    service.providers = [first, second]
+    with pytest.raises(DeadlineExceeded):
+        service._call(None, lambda p: p.generate())
+    assert second.calls == 0
+    # The provider is not blamed for the caller's deadline
+    assert service.router.snapshot().get("first", {}).get("state", ProviderHealth.CLOSED) == ProviderHealth.CLOSED
+
+    with deadline_scope(Deadline(60)) as deadline:
+        deadline.cancel()
+        with pytest.raises(DeadlineExceeded, match="cancelled"):
+            service._call(None, lambda p: p.generate())
+    assert second.calls == 0
@@ -0,0 +1,86 @@
+"""Semantic plan cache: reuse across wordings, never across different subjects or hours"""
+import pytest
+
+from semantic_cache import SemanticPlanIndex, adapt_plan, same_subject
+
+IDENTITY = "auto||full"
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SemanticPlanIndex(path=str(tmp_path / "index.db"), threshold=0.8, hours_tolerance=0.5)
+    for key, subject in [("organic", "Organic Chemistry"), ("react", "React"),
+                         ("dsa", "Data Structures & Algorithms"), ("history", "World History")]:
+        index.add(key, subject, "Beginner", 7, 2.0, IDENTITY)
+    return index
+
+
+def lookup(index, subject, hours=2.0, **kwargs):
+    match = index.lookup(subject, kwargs.get("level", "Beginner"), kwargs.get("days", 7), hours,
+                         kwargs.get("identity", IDENTITY))
+    return match[0] if match else None
+
+
+@pytest.mark.parametrize("subject, key", [
+    ("Data Structures and Algorithms", "dsa"),
+    ("data structures and algos", "dsa"),
+    ("DSA", "dsa"),
+    ("organic chemistry", "organic"),
+    ("world history", "history"),
+])
+def test_rewordings_reuse_the_plan(index, subject, key):
+    assert lookup(index, subject) == key
+
+
+@pytest.mark.parametrize("subject", [
+    "Inorganic Chemistry",
+    "React Native",
+    "Organic Chemistry Lab",
+    "World History II",
+])
+def test_near_miss_subjects_do_not_reuse_the_plan(index, subject):
+    assert lookup(index, subject) is None
+
+
+def test_hours_must_be_close_in_absolute_terms(index):
+    assert lookup(index, "organic chemistry", hours=2.5) == "organic"
+    assert lookup(index, "organic chemistry", hours=1.5) == "organic"
+    assert lookup(index, "organic chemistry", hours=3.0) is None
+    assert lookup(index, "organic chemistry", hours=4.0) is None
+
+
+def test_level_days_and_identity_must_match(index):
+    assert lookup(index, "organic chemistry", level="Advanced") is None
+    assert lookup(index, "organic chemistry", days=8) is None
+    assert lookup(index, "organic chemistry", identity="groq|llama|full") is None
+
+
+def test_removed_entries_are_not_returned(index):
+    index.remove("organic")
+    assert lookup(index, "organic chemistry") is None
+
+
+def test_same_subject_rules():
+    assert same_subject("Python Programming", "python")
+    assert not same_subject("Java", "JavaScript")
+    assert not same_subject("Calculus 1", "Calculus 2")
+
+
+def test_narrow_aliases_match_only_their_own_words():
+    assert not same_subject("Data Structures", "Algorithms")
+    assert not same_subject("Algorithms", "DSA")
+    assert not same_subject("Algorithms", "Data Structures & Algorithms")
+    assert same_subject("DSA", "data structures and algorithms")
+
+
+@pytest.mark.parametrize("subject", ["Data Structures", "DSA", "Data Structures & Algorithms"])
+def test_plan_for_part_of_a_catalog_entry_is_not_reused(tmp_path, subject):
+    index = SemanticPlanIndex(path=str(tmp_path / "index.db"), threshold=0.8, hours_tolerance=0.5)
+    index.add("algorithms", "Algorithms", "Beginner", 7, 2.0, IDENTITY)
+    assert lookup(index, subject) is None
+    assert lookup(index, "algorithms") == "algorithms"
+
+
+def test_adapt_plan_sets_hours():
+    plan = [{"day": 1, "topic": "Alkanes", "hours": 2}, {"day": 2, "topic": "Review"}]
+    assert adapt_plan(plan, 2.25) == [{"day": 1, "topic": "Alkanes", "hours": 2.2}, {"day": 2, "topic": "Review"}]
@@ -0,0 +1,134 @@
+"""Single-flight coalescing: one upstream call per key, bounded by each caller's deadline"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from deadlines import Deadline, DeadlineExceeded, deadline_scope, run_in_context
+from single_flight import SingleFlight
+
+
+@pytest.fixture
+def flights(tmp_path):
+    return SingleFlight(path=str(tmp_path / "flights.db"), lease_ttl=30, poll_interval=0.02)
+
+
+def slow(result, delay=0.3, calls=None):
+    def fn():
+        if calls is not None:
+            calls.append(1)
+        time.sleep(delay)
+        return result
+    return fn
+
+
+def test_concurrent_callers_share_one_call(flights):
+    calls = []
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: flights.run("k", slow("plan", calls=calls)), range(8)))
+    assert results == ["plan"] * 8
+    assert len(calls) == 1
+    assert flights.stats()["coalesced_local"] == 7
+
+
+def test_leader_error_reaches_waiters(flights):
+    def fail():
+        time.sleep(0.2)
+        raise ValueError("provider down")
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flights.run, "k", fail) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+
+
+def test_waiter_gives_up_at_its_deadline(flights):
+    leader = threading.Thread(target=flights.run, args=("k", slow("plan", delay=0.8)))
+    leader.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    with deadline_scope(Deadline(0.2)):
+        with pytest.raises(DeadlineExceeded):
+            flights.run("k", slow("other"))
+    assert time.monotonic() - started < 0.6
+    assert flights.stats()["waiting"] == 0
+    leader.join()
+
+
+def test_cancelled_waiter_stops(flights):
+    leader = threading.Thread(target=flights.run, args=("k", slow("plan", delay=0.8)))
+    leader.start()
+    time.sleep(0.05)
+    deadline = Deadline(60)
+    threading.Timer(0.1, deadline.cancel).start()
+    with deadline_scope(deadline):
+        with pytest.raises(DeadlineExceeded, match="cancelled"):
+            flights.run("k", slow("other"))
+    leader.join()
+
+
+def test_leader_deadline_does_not_fail_waiters(flights):
+    calls = []
+
+    def leader_fn():
+        calls.append("leader")
+        time.sleep(0.2)
+        raise DeadlineExceeded("Request deadline of 0.2s exceeded")
+
+    leader = threading.Thread(target=lambda: pytest.raises(DeadlineExceeded, flights.run, "k", leader_fn))
+    leader.start()
+    time.sleep(0.05)
+    assert flights.run("k", lambda: calls.append("waiter") or "plan") == "plan"
+    leader.join()
+    assert calls == ["leader", "waiter"]
+
+
+def test_other_worker_waits_for_the_shared_result(tmp_path):
+    path = str(tmp_path / "flights.db")
+    worker_a = SingleFlight(path=path, lease_ttl=30, poll_interval=0.02)
+    worker_b = SingleFlight(path=path, lease_ttl=30, poll_interval=0.02)
+    shared_cache = {}
+
+    def generate():
+        time.sleep(0.3)
+        shared_cache["k"] = "plan"
+        return "plan"
+
+    calls = []
+    leader = threading.Thread(target=worker_a.run, args=("k", generate, shared_cache.get))
+    leader.start()
+    time.sleep(0.05)
+    assert worker_b.run("k", lambda: calls.append(1) or "duplicate", lambda: shared_cache.get("k")) == "plan"
+    assert not calls
+    assert worker_b.stats()["coalesced_remote"] == 1
+    leader.join()
+
+
+def test_lease_poll_respects_the_deadline(tmp_path):
+    path = str(tmp_path / "flights.db")
+    worker_a = SingleFlight(path=path, lease_ttl=30, poll_interval=0.02)
+    worker_b = SingleFlight(path=path, lease_ttl=30, poll_interval=0.02)
+    leader = threading.Thread(target=worker_a.run, args=("k", slow("plan", delay=0.8), lambda: None))
+    leader.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    with deadline_scope(Deadline(0.2)):
+        with pytest.raises(DeadlineExceeded):
+            worker_b.run("k", slow("other"), lambda: None)
+    assert time.monotonic() - started < 0.6
+    leader.join()
+
+
+def test_stream_waiters_get_the_complete_list(flights):
+    def make_stream():
+        for day in (1, 2, 3):
+            time.sleep(0.05)
+            yield {"day": day}
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(run_in_context(lambda: list(flights.stream("k", make_stream)))) for _ in range(4)]
+        results = [future.result() for future in futures]
+    assert all(result == [{"day": 1}, {"day": 2}, {"day": 3}] for result in results)
+    assert flights.stats()["leaders"] == 1
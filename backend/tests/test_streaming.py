@@ -0,0 +1,90 @@
+"""SSE routes: partial AI output plus fallback never duplicates or renumbers items"""
+import json
+
+import app as app_module
+import local_planner
+from deadlines import current_deadline
+
+
+def read_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class FailingAI:
+    """Streams the given days, then fails like a dropped provider connection."""
+    provider = object()
+
+    def __init__(self, days):
+        self.days = days
+
+    def stream_study_plan(self, **kwargs):
+        yield from self.days
+        raise Exception("connection reset")
+
+    def local_study_plan(self, subject, level, days, hours):
+        return local_planner.build_plan(subject, level, days, hours)
+
+    def stream_flashcards(self, **kwargs):
+        yield {"question": "Q1", "answer": "A1"}
+        raise Exception("connection reset")
+
+    def last_provider_name(self):
+        return "fake"
+
+
+def test_plan_stream_fallback_fills_only_missing_days(client, auth_headers, monkeypatch):
+    ai_days = [{"day": 3, "topic": "AI three", "hours": 2}, {"day": 1, "topic": "AI one", "hours": 2}]
+    monkeypatch.setattr(app_module, "get_ai_service", lambda: FailingAI(ai_days))
+    response = client.post("/api/generate-plan/stream", headers=auth_headers,
+                           json={"subject": "Python", "days": 4, "hours": 2})
+    events = read_events(response)
+
+    streamed = [data["day"] for event, data in events if event == "day"]
+    assert sorted(streamed) == [1, 2, 3, 4]
+    assert streamed[:2] == [3, 1]
+
+    event, done = events[-1]
+    assert event == "done"
+    assert [day["day"] for day in done["plan"]] == [1, 2, 3, 4]
+    assert done["plan"][0]["topic"] == "AI one"
+    assert done["plan"][2]["topic"] == "AI three"
+    assert done["ai_generated"] is True
+
+
+def test_flashcard_stream_keeps_partial_cards(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "get_ai_service", lambda: FailingAI([]))
+    plan = client.post("/api/generate-plan/stream", headers=auth_headers,
+                       json={"subject": "Python", "days": 2, "hours": 1})
+    plan_id = read_events(plan)[-1][1]["id"]
+
+    response = client.post("/api/ai/generate-flashcards/stream", headers=auth_headers,
+                           json={"plan_id": plan_id, "topic": "Lists", "num_cards": 3})
+    events = read_events(response)
+    assert [event for event, _ in events] == ["card", "done"]
+    assert events[-1][1]["count"] == 1
+    assert events[-1][1]["partial"] is True
+
+
+class SlowAI(FailingAI):
+    """Streams one day, then waits for more; remembers the request deadline it ran under."""
+    deadline = None
+
+    def stream_study_plan(self, **kwargs):
+        SlowAI.deadline = current_deadline()
+        yield {"day": 1, "topic": "AI one", "hours": 2}
+        yield {"day": 2, "topic": "AI two", "hours": 2}
+
+
+def test_client_disconnect_cancels_the_request_deadline(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "get_ai_service", lambda: SlowAI([]))
+    response = client.post("/api/generate-plan/stream", headers=dict(auth_headers, **{"X-Request-Timeout": "20"}),
+                           json={"subject": "Python", "days": 2, "hours": 1}, buffered=False)
+    chunks = iter(response.response)
+    assert b"event: day" in next(chunks)
+    assert SlowAI.deadline.seconds == 20 and not SlowAI.deadline.cancelled
+    response.close()
+    assert SlowAI.deadline.cancelled
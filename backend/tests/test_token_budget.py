@@ -0,0 +1,41 @@
+"""max_tokens sizing: estimates from the requested output size, calibrated by observed usage"""
+from ai_service import TokenBudget
+
+
+def test_estimate_grows_with_units_within_the_model_limit():
+    budget = TokenBudget()
+    small = budget.estimate("groq", "plan_day", 3, limit=8192)
+    large = budget.estimate("groq", "plan_day", 45, limit=8192)
+    assert TokenBudget.MIN_TOKENS <= small < large <= 8192
+    assert budget.estimate("groq", "plan_day", 500, limit=4096) == 4096
+    # A model limit below the floor wins over the floor
+    assert budget.estimate("groq", "flashcard", 1, limit=100) == 100
+
+
+def test_observed_usage_calibrates_per_provider():
+    budget = TokenBudget(alpha=0.5)
+    default = budget.per_unit("groq", "flashcard")
+    budget.observe("groq", "flashcard", units=10, output_tokens=TokenBudget.OVERHEAD + 10 * 30)
+    assert budget.per_unit("groq", "flashcard") == (default + 30) / 2
+    assert budget.per_unit("gemini", "flashcard") == default
+    assert budget.snapshot()["groq:flashcard"]["samples"] == 1
+
+
+def test_truncated_response_raises_the_estimate():
+    budget = TokenBudget(alpha=0.5)
+    before = budget.per_unit("groq", "plan_day")
+    budget.observe("groq", "plan_day", units=5, output_tokens=200, truncated=True)
+    assert budget.per_unit("groq", "plan_day") > before
+
+
+def test_empty_observations_are_ignored():
+    budget = TokenBudget()
+    budget.observe("groq", "plan_day", units=0, output_tokens=500)
+    budget.observe("groq", "plan_day", units=3, output_tokens=0)
+    assert budget.snapshot() == {}
+
+
+def test_detail_words_shrink_as_a_response_covers_more_days():
+    assert TokenBudget.detail_words(1) == 40
+    assert TokenBudget.detail_words(30) == 20
+    assert TokenBudget.detail_words(100) == 12
@@ -0,0 +1,210 @@
+"""Bulk user import: parsing, duplicate and conflict checks, batched inserts and the admin job"""
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+import user_import
+from jobs import JobRunner
+from models import db, GenerationJob, User
+from passwords import PasswordHasher
+from user_import import UserImportError, import_users, parse_rows
+
+
+def unique(prefix="imp"):
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture
+def hasher():
+    return PasswordHasher(method="pbkdf2:sha256:1000", workers=0)
+
+
+def test_parse_csv_normalizes_header_and_bom():
+    rows = parse_rows("﻿Username, Email ,PASSWORD,is_admin\nann,ann@example.com,pw,yes\n")
+    assert rows == [{"username": "ann", "email": "ann@example.com", "password": "pw", "is_admin": "yes"}]
+
+
+def test_parse_csv_requires_columns():
+    with pytest.raises(UserImportError, match="password"):
+        parse_rows("username,email\nann,ann@example.com\n")
+
+
+def test_parse_ndjson_skips_blank_lines_and_rejects_bad_ones():
+    rows = parse_rows('{"Username": "ann", "email": "a@x.io", "password": "pw"}\n\n', "ndjson")
+    assert rows == [{"username": "ann", "email": "a@x.io", "password": "pw"}]
+    with pytest.raises(UserImportError, match="Line 2"):
+        parse_rows('{"username": "ann"}\n[1, 2]\n', "ndjson")
+
+
+def test_duplicates_in_file_ignore_case(flask_app, hasher):
+    name = unique()
+    rows = [
+        {"username": name, "email": f"{name}@example.com", "password": "pw"},
+        {"username": name.upper(), "email": f"other-{name}@example.com", "password": "pw"},
+        {"username": f"{name}-2", "email": f"{name.upper()}@EXAMPLE.COM", "password": "pw"},
+        {"username": f"{name}-3", "email": "not-an-email", "password": "pw"},
+        {"username": f"{name}-4", "email": f"{name}-4@example.com"},
+    ]
+    with flask_app.app_context():
+        report = import_users(rows, hasher)
+    assert report["created"] == 1
+    assert [(e["row"], e["error"]) for e in report["errors"]] == [
+        (2, "Duplicate username (row 1)"),
+        (3, "Duplicate email (row 1)"),
+        (4, "Invalid email"),
+        (5, "Missing fields: password"),
+    ]
+
+
+def test_existing_users_conflict_ignoring_case(flask_app, register, hasher):
+    existing = register()["user"]
+    name = unique()
+    rows = [
+        {"username": existing["username"].upper(), "email": f"{name}@example.com", "password": "pw"},
+        {"username": name, "email": existing["email"].upper(), "password": "pw"},
+    ]
+    with flask_app.app_context():
+        report = import_users(rows, hasher)
+    assert report["created"] == 0
+    assert [e["error"] for e in report["errors"]] == ["Username already exists", "Email already exists"]
+
+
+def test_dry_run_creates_nothing(flask_app, hasher):
+    name = unique()
+    with flask_app.app_context():
+        report = import_users([{"username": name, "email": f"{name}@example.com", "password": "pw"}],
+                              hasher, dry_run=True)
+        assert report["valid"] == 1 and report["created"] == 0 and report["dry_run"]
+        assert User.query.filter_by(username=name).first() is None
+
+
+def test_batch_conflict_falls_back_to_row_inserts(flask_app, register, hasher, monkeypatch):
+    existing = register()["user"]
+    # A user created between the check and the insert
+    monkeypatch.setattr(user_import, "find_taken", lambda usernames, emails: (set(), set()))
+    names = [unique() for _ in range(3)]
+    rows = [{"username": n, "email": f"{n}@example.com", "password": "pw"} for n in names]
+    rows.insert(1, {"username": existing["username"], "email": f"x-{existing['email']}", "password": "pw"})
+    with flask_app.app_context():
+        report = import_users(rows, hasher, batch_size=10)
+        assert report["created"] == 3
+        assert report["errors"] == [{"row": 2, "username": existing["username"],
+                                     "error": "Username or email already exists"}]
+        created = User.query.filter(User.username.in_(names)).all()
+        assert len(created) == 3
+        assert all(user.check_password("pw") for user in created)
+
+
+def test_register_rejects_names_that_differ_only_in_case(client, register):
+    user = register()["user"]
+    response = client.post("/api/register", json={"username": user["username"].upper(),
+                                                  "email": f"{unique()}@example.com", "password": "pw"})
+    assert response.status_code == 400
+    response = client.post("/api/register", json={"username": unique(),
+                                                  "email": user["email"].upper(), "password": "pw"})
+    assert response.status_code == 400
+
+
+def stored_job(flask_app, job_id):
+    """(status, everything stored for the job as text) straight from the table."""
+    with flask_app.app_context():
+        row = db.session.execute(text("SELECT status, params, result, error FROM generation_jobs WHERE id = :id"),
+                                 {"id": job_id}).one()
+    return row[0], " ".join(str(value) for value in row[1:])
+
+
+def wait_for_job(flask_app, job_id, statuses=("succeeded", "failed"), timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status, stored = stored_job(flask_app, job_id)
+        if status in statuses:
+            return status, stored
+        time.sleep(0.05)
+    raise AssertionError(f"import job still {status}")
+
+
+def load_app_module():
+    """The app module (imported by the flask_app fixture)."""
+    import app as app_module
+    return app_module
+
+
+def import_csv(names):
+    return "username,email,password\n" + "".join(f"{n},{n}@example.com,pw-{n}\n" for n in names) + "bad,,x\n"
+
+
+def test_admin_import_runs_as_background_job(client, flask_app, admin_headers, monkeypatch):
+    names = [unique() for _ in range(3)]
+    csv = import_csv(names)
+
+    dry = client.post("/api/admin/users/import?dry_run=1", data=csv, headers=admin_headers, content_type="text/csv")
+    assert dry.status_code == 200
+    assert dry.get_json()["valid"] == 3 and dry.get_json()["failed"] == 1
+
+    app_module = load_app_module()
+    release = threading.Event()
+    original = app_module.hash_passwords
+
+    def slow_hash(pending, hasher):
+        release.wait(5)
+        original(pending, hasher)
+
+    monkeypatch.setattr(app_module, "hash_passwords", slow_hash)
+    response = client.post("/api/admin/users/import", data=csv, headers=admin_headers, content_type="text/csv")
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["valid"] == 3 and body["errors"][0]["row"] == 4
+
+    # Queued or running: the row never holds a submitted password
+    status, stored = wait_for_job(flask_app, body["job_id"], statuses=("queued", "running"))
+    assert not any(f"pw-{name}" in stored for name in names)
+    release.set()
+
+    status, stored = wait_for_job(flask_app, body["job_id"])
+    assert status == "succeeded"
+    assert '"created": 3' in stored
+    assert not any(f"pw-{name}" in stored for name in names)
+    for name in names:
+        login = client.post("/api/login", json={"username": name, "password": f"pw-{name}"})
+        assert login.status_code == 200
+
+
+def test_failed_import_job_holds_no_passwords(client, flask_app, admin_headers, monkeypatch):
+    def broken(pending, hasher):
+        raise RuntimeError("pool gone")
+
+    monkeypatch.setattr(load_app_module(), "hash_passwords", broken)
+    names = [unique()]
+    response = client.post("/api/admin/users/import", data=import_csv(names), headers=admin_headers,
+                           content_type="text/csv")
+    status, stored = wait_for_job(flask_app, response.get_json()["job_id"])
+    assert status == "failed"
+    assert f"pw-{names[0]}" not in stored
+
+
+def test_import_job_of_a_dead_worker_fails_instead_of_rerunning(flask_app, admin_headers):
+    other_worker = JobRunner(flask_app, stale_after=1, sweep_interval=3600)
+    other_worker.register("import_users", lambda job: {"created": 1}, transient=True)
+    with flask_app.app_context():
+        user_id = User.query.first().id
+        stale = datetime.utcnow() - timedelta(seconds=5)
+        jobs = []
+        for status in ("queued", "running"):
+            job = GenerationJob(id=uuid.uuid4().hex, user_id=user_id, kind="import_users", status=status,
+                                params={"total": 1, "rows": [], "errors": []}, attempts=0, updated_at=stale)
+            db.session.add(job)
+            jobs.append(job.id)
+        db.session.commit()
+
+    # Its input only existed in the dead worker: this worker must not claim it
+    other_worker._run(jobs[0])
+    assert stored_job(flask_app, jobs[0])[0] == "queued"
+
+    other_worker.recover()
+    for job_id in jobs:
+        status, stored = stored_job(flask_app, job_id)
+        assert status == "failed" and "Submit it again" in stored
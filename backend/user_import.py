@@ -0,0 +1,219 @@
+"""
+User Import - Bulk user provisioning for admins
+
+Shared by POST /api/admin/users/import and the import_users.py CLI. Input is
+CSV (header row with username, email, password and optional is_admin /
+is_active columns) or NDJSON (one JSON object per line with the same keys).
+
+Every row is validated first; usernames and emails are checked against the
+database with a few set-based IN queries instead of two lookups per row.
+Like /api/register, names and emails that differ only in case count as
+taken. Passwords of the valid rows are then hashed in a PasswordHasher pool
+and users are inserted in batched transactions. The result is a report with
+one entry per rejected row.
+
+The endpoint only validates in the request; hashing and inserting run as a
+background job (see app.py), so a large file does not tie up a web worker.
+"""
+
+import csv
+import io
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User
+from passwords import PasswordHasher
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ("username", "email", "password")
+# Parameter lists per IN query; stays under SQLite's default variable limit
+_QUERY_CHUNK = 400
+
+
+class UserImportError(Exception):
+    """The input could not be parsed at all (as opposed to individual bad rows)."""
+
+
+def detect_format(filename: str = None, content_type: str = None, content: str = "") -> str:
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl", ".json")) or "json" in (content_type or ""):
+        return "ndjson"
+    if name.endswith(".csv") or "csv" in (content_type or ""):
+        return "csv"
+    return "ndjson" if content.lstrip().startswith("{") else "csv"
+
+
+def parse_rows(content: str, fmt: str = "csv") -> List[Dict]:
+    """Rows as dicts with lower-case keys, in input order."""
+    content = content.lstrip("\ufeff")  # byte order mark from spreadsheet exports
+    if fmt == "ndjson":
+        rows = []
+        for number, line in enumerate(content.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise UserImportError(f"Line {number} is not valid JSON")
+            if not isinstance(row, dict):
+                raise UserImportError(f"Line {number} is not a JSON object")
+            rows.append({str(k).strip().lower(): v for k, v in row.items()})
+        return rows
+    if fmt != "csv":
+        raise UserImportError(f"Unsupported format: {fmt}")
+    reader = csv.DictReader(io.StringIO(content))
+    header = [(name or "").strip().lower() for name in (reader.fieldnames or [])]
+    missing = [field for field in REQUIRED_FIELDS if field not in header]
+    if missing:
+        raise UserImportError(f"CSV header is missing: {', '.join(missing)}")
+    reader.fieldnames = header
+    return [{k: v for k, v in row.items() if k} for row in reader]
+
+
+def _flag(value, default: bool) -> bool:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "on")
+    return bool(value)
+
+
+def _validate(rows: List[Dict]) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+    """(row number, user mapping without password hash) for valid rows, plus errors for the rest."""
+    valid, errors = [], []
+    seen_usernames, seen_emails = {}, {}
+    for number, row in enumerate(rows, 1):
+        username = str(row.get("username") or "").strip()
+        email = str(row.get("email") or "").strip()
+        password = row.get("password")
+        password = "" if password is None else str(password)
+
+        error = None
+        missing = [f for f, v in (("username", username), ("email", email), ("password", password)) if not v]
+        if missing:
+            error = f"Missing fields: {', '.join(missing)}"
+        elif len(username) > 80:
+            error = "Username is longer than 80 characters"
+        elif len(email) > 120 or "@" not in email:
+            error = "Invalid email"
+        elif username.lower() in seen_usernames:
+            error = f"Duplicate username (row {seen_usernames[username.lower()]})"
+        elif email.lower() in seen_emails:
+            error = f"Duplicate email (row {seen_emails[email.lower()]})"
+        if error:
+            errors.append({"row": number, "username": username, "error": error})
+            continue
+
+        seen_usernames[username.lower()] = number
+        seen_emails[email.lower()] = number
+        valid.append((number, {
+            "username": username,
+            "email": email,
+            "password": password,
+            "is_admin": _flag(row.get("is_admin"), False),
+            "is_active": _flag(row.get("is_active"), True),
+        }))
+    return valid, errors
+
+
+def find_taken(usernames: List[str], emails: List[str]) -> Tuple[set, set]:
+    """Lower-cased usernames and emails from the input that are already taken, ignoring case."""
+    usernames = [u.lower() for u in usernames]
+    emails = [e.lower() for e in emails]
+    taken_usernames, taken_emails = set(), set()
+    for start in range(0, max(len(usernames), len(emails)), _QUERY_CHUNK):
+        chunk_usernames = usernames[start:start + _QUERY_CHUNK]
+        chunk_emails = emails[start:start + _QUERY_CHUNK]
+        query = db.session.query(User.username, User.email).filter(
+            or_(func.lower(User.username).in_(chunk_usernames), func.lower(User.email).in_(chunk_emails)))
+        for username, email in query:
+            taken_usernames.add(username.lower())
+            taken_emails.add(email.lower())
+    return taken_usernames, taken_emails
+
+
+def drop_taken(valid: List[Tuple[int, Dict]], errors: List[Dict]) -> List[Tuple[int, Dict]]:
+    """The rows whose username and email are still free; the others are added to errors."""
+    taken_usernames, taken_emails = find_taken([m["username"] for _, m in valid], [m["email"] for _, m in valid])
+    pending = []
+    for number, mapping in valid:
+        if mapping["username"].lower() in taken_usernames:
+            errors.append({"row": number, "username": mapping["username"], "error": "Username already exists"})
+        elif mapping["email"].lower() in taken_emails:
+            errors.append({"row": number, "username": mapping["username"], "error": "Email already exists"})
+        else:
+            pending.append((number, mapping))
+    return pending
+
+
+def check_rows(rows: List[Dict]) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+    """Validation and conflict checks without hashing: (importable rows, errors). Needs an app context."""
+    valid, errors = _validate(rows)
+    return drop_taken(valid, errors), errors
+
+
+def hash_passwords(pending: List[Tuple[int, Dict]], hasher: PasswordHasher):
+    """Replace each mapping's plain password with its hash, in place."""
+    hashes = hasher.hash_many([mapping["password"] for _, mapping in pending])
+    for (_, mapping), password_hash in zip(pending, hashes):
+        mapping["password"] = password_hash
+
+
+def insert_users(pending: List[Tuple[int, Dict]], errors: List[Dict], batch_size: int = 500,
+                 progress: Optional[Callable[[int], None]] = None) -> int:
+    """Insert rows with hashed passwords in batched transactions; returns the number created."""
+    created = 0
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        try:
+            db.session.bulk_insert_mappings(User, [mapping for _, mapping in batch])
+            db.session.commit()
+            created += len(batch)
+        except IntegrityError:
+            # Someone took one of these names since the check: retry row by row to find it
+            db.session.rollback()
+            for number, mapping in batch:
+                try:
+                    db.session.add(User(**mapping))
+                    db.session.commit()
+                    created += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    errors.append({"row": number, "username": mapping["username"],
+                                   "error": "Username or email already exists"})
+        if progress:
+            progress(created)
+    return created
+
+
+def build_report(total: int, pending: List, errors: List[Dict], created: int, dry_run: bool) -> Dict:
+    return {
+        "total": total,
+        "created": created,
+        "valid": len(pending),
+        "failed": len(errors),
+        "dry_run": dry_run,
+        "errors": sorted(errors, key=lambda e: e["row"]),
+    }
+
+
+def import_users(rows: List[Dict], hasher: PasswordHasher, batch_size: int = 500, dry_run: bool = False,
+                 progress: Optional[Callable[[str], None]] = None) -> Dict:
+    """Create users from parsed rows. Must be called inside an app context."""
+    report = progress or (lambda message: None)
+    pending, errors = check_rows(rows)
+    report(f"{len(pending)} of {len(rows)} rows valid")
+
+    created = 0
+    if pending and not dry_run:
+        hash_passwords(pending, hasher)
+        report(f"Hashed {len(pending)} passwords")
+        created = insert_users(pending, errors, batch_size, lambda done: report(f"Inserted {done} users"))
+
+    logger.info(f"👥 User import: {created} created, {len(errors)} rejected{' (dry run)' if dry_run else ''}")
+    return build_report(len(rows), pending, errors, created, dry_run)
@@ -323,17 +323,52 @@ function App() {
   const { mode, toggleMode } = useContext(ThemeModeContext);
   const isDarkMode = mode === "dark";
 
-  // Intercept all fetches to handle 401 globally (expired tokens)
+  // Intercept all fetches to handle 401 globally: refresh the short-lived access token once,
+  // and only log out if that fails
   useEffect(() => {
     const originalFetch = window.fetch;
+    let refreshing = null;
+    const refreshAccessToken = () => {
+      const refreshToken = localStorage.getItem('refresh_token');
+      if (!refreshToken) return Promise.resolve(null);
+      // Concurrent 401s share one refresh call
+      if (!refreshing) {
+        refreshing = originalFetch(`${API_URL}/api/token/refresh`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ refresh_token: refreshToken }),
+        })
+          .then(res => (res.ok ? res.json() : null))
+          .then(data => {
+            if (!data?.token) return null;
+            localStorage.setItem('token', data.token);
+            return data.token;
+          })
+          .catch(() => null)
+          .finally(() => { refreshing = null; });
+      }
+      return refreshing;
+    };
+
     window.fetch = async (...args) => {
-      const response = await originalFetch(...args);
-      // If 401 Unauthorized is returned, and it's not login/register
+      let response = await originalFetch(...args);
+      // If 401 Unauthorized is returned, and it's not login/register/refresh
       const url = typeof args[0] === 'string' ? args[0] : (args[0]?.url || '');
+      if (response.status === 401 && !url.includes('/api/login') && !url.includes('/api/register') && !url.includes('/api/token/refresh')) {
+        const headers = new Headers(args[1]?.headers || {});
+        if (headers.has('Authorization')) {
+          const newToken = await refreshAccessToken();
+          if (newToken) {
+            headers.set('Authorization', `Bearer ${newToken}`);
+            response = await originalFetch(args[0], { ...args[1], headers });
+          }
+        }
+      }
       if (response.status === 401 && !url.includes('/api/login') && !url.includes('/api/register')) {
         console.warn("🔐 Session expired or invalid token. Redirecting to login.");
         // Clear auth and reset state
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
         localStorage.removeItem('user');
         setIsAuthenticated(false);
         setIsAdmin(false);
@@ -684,6 +719,7 @@ function App() {
   // Logout
   const handleLogout = () => {
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     localStorage.removeItem('user');
     setIsAuthenticated(false);
     setIsAdmin(false);
@@ -172,6 +172,7 @@ const res = await fetch(`${API_URL}/api/register`, {
 
       // Save token and user info
       localStorage.setItem('token', data.token);
+      localStorage.setItem('refresh_token', data.refresh_token);
       localStorage.setItem('user', JSON.stringify(data.user));
       
       console.log('💾 Saved to localStorage:', {